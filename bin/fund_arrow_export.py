@@ -0,0 +1,98 @@
+"""fund_arrow_export.py
+
+Typed machine-readable output of the emailer (`fund_momentum_emailer.py
+--export-dir DIR [--export-format arrow|parquet]`):
+
+    performance.<ext>   one row per fund: Fund (string), every lookback return and
+                        'All Dates', LongTermAdjustedPerf, LagAdjScore and any further
+                        score columns (float64, null for no return), LongTermRank and
+                        LagAdjRank (int32, null for unranked funds)
+    prices.<ext>        the bundled log10 price matrix: date (date32), one float64
+                        column per fund, null where a fund has no value
+
+'arrow' writes uncompressed Arrow IPC files (.arrow), which consumers can
+memory-map (`pyarrow.ipc.open_file(pyarrow.memory_map(path))`) without copying
+or parsing; 'parquet' writes compressed Parquet files (.parquet) for tools that
+read that. Both carry the run date and the generator in the schema metadata.
+Files are replaced with output_cache.atomic_replace, so a reader never sees a
+partial export.
+
+pyarrow is an optional dependency, imported only when exporting.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from fund_score_store import RANK_COLUMNS
+from output_cache import atomic_replace
+
+EXPORT_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def require_pyarrow() -> None:
+    """Raises ImportError with an install hint if pyarrow is missing."""
+    try:
+        import pyarrow # noqa: F401
+    except ImportError as e:
+        raise ImportError("Arrow/Parquet export needs pyarrow (pip install pyarrow)") from e
+
+
+def performance_table(perf_df: pd.DataFrame, metadata: Dict[str, str]):
+    """The per-fund performance frame ('Fund' column plus numeric columns) as a typed pyarrow Table."""
+    import pyarrow as pa
+
+    fields, arrays = [pa.field("Fund", pa.string(), nullable=False)], [pa.array(perf_df["Fund"].astype(str).tolist(), pa.string())]
+    for column in perf_df.columns:
+        if column == "Fund":
+            continue
+        values = pd.to_numeric(perf_df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        if column in RANK_COLUMNS.values():
+            fields.append(pa.field(column, pa.int32()))
+            arrays.append(pa.array(np.nan_to_num(values, nan=0).astype(np.int32), pa.int32(), mask=np.isnan(values)))
+        else:
+            fields.append(pa.field(str(column), pa.float64()))
+            arrays.append(pa.array(values, pa.float64(), from_pandas=True)) # NaN (no return) -> null
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+
+
+def prices_table(log_prices: pd.DataFrame, metadata: Dict[str, str]):
+    """The date x fund log price matrix as a pyarrow Table: a date32 'date' column and one float64 column per fund."""
+    import pyarrow as pa
+
+    fields = [pa.field("date", pa.date32(), nullable=False)]
+    arrays = [pa.array(log_prices.index.values.astype("datetime64[D]"), pa.date32())]
+    for column in log_prices.columns:
+        values = log_prices[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        fields.append(pa.field(str(column), pa.float64()))
+        arrays.append(pa.array(values, pa.float64(), from_pandas=True)) # NaN -> null
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+
+
+def write_table(table, path: Path, export_format: str) -> None:
+    """Writes `table` as an uncompressed Arrow IPC file or a Parquet file."""
+    import pyarrow as pa
+
+    with atomic_replace(path, suffix=path.suffix) as tmp_path:
+        if export_format == "arrow":
+            with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(table, str(tmp_path))
+
+
+def export_results(export_dir: Path, export_format: str, run_date: str, perf_df: pd.DataFrame,
+                   log_prices: pd.DataFrame | None, generator: str) -> List[Path]:
+    """Writes performance.<ext> and, given `log_prices`, prices.<ext> to `export_dir`; returns the paths written."""
+    suffix = EXPORT_FORMATS[export_format]
+    metadata = {"run_date": run_date, "generator": generator}
+    written = [Path(export_dir) / f"performance{suffix}"]
+    write_table(performance_table(perf_df, metadata), written[0], export_format)
+    if log_prices is not None:
+        written.append(Path(export_dir) / f"prices{suffix}")
+        write_table(prices_table(log_prices, metadata), written[1], export_format)
+    return written
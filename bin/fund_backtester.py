@@ -0,0 +1,235 @@
+"""fund_backtester.py
+
+Backtest of the ranking screens: holds the top-N funds of LongTermAdjustedPerf or
+LagAdjScore (the score and rank history of fund_rank_history.py) and switches
+on a rebalancing schedule, with the switch executed a number of trading days
+after the decision, as PPM switches settle with a lag.
+
+On each decision date the funds ranked 1..N that day are chosen and held in
+equal weights from the execution date (decision + --lag trading days, at that
+day's prices) until the next execution date. Holdings drift with their prices
+between switches. A day with no ranked fund holds cash. Per combination it
+reports the total and annualized return, the maximum drawdown of the daily
+value and the one-way turnover (half the summed absolute weight changes, cash
+included) per switch and per year; the initial purchase is not a switch.
+
+The simulation has no loop over dates: the segment between two executions is
+found for every day with one searchsorted, and the daily value of all segments
+comes from one matrix of price ratios to each segment's entry prices. The
+parameter grid (--score x --top-n x --rebalance x --lag) is spread over --jobs
+worker processes, which attach to the price and rank matrices published once
+in shared memory (shared_matrix.py) instead of each receiving a pickled copy.
+
+Schedules (--rebalance): a number of trading days between decisions, or
+W, M or Q for the first trading day of each week, month or quarter.
+
+Usage:
+    python3 bin/fund_backtester.py
+    python3 bin/fund_backtester.py --score lag_adj --top-n 5,10,20 --rebalance 5,10,M --lag 0,2,5 --jobs 8
+    python3 bin/fund_backtester.py --since 2024-01-01 --output backtest.csv
+
+Python deps: numpy, pandas (plus the deps of fund_momentum_emailer.py)
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import fund_momentum_emailer as emailer
+from fund_momentum_emailer import LOOKBACKS_BD, ONE_YEAR_LOOKBACK_KEY
+from fund_rank_history import load_bundled_prices, rank_history, score_history
+from fund_tables_io import iso_date_arg
+from shared_matrix import SharedMatrices, attach
+
+SCORES = {"long_term": "LongTermAdjustedPerf", "lag_adj": "LagAdjScore"}
+CALENDAR_SCHEDULES = {"W": "W", "M": "M", "Q": "Q"} # --rebalance value -> pandas period frequency
+RESULT_COLUMNS = ["score", "top_n", "rebalance", "lag", "start", "total_return", "annual_return", "max_drawdown",
+                  "switches", "turnover_per_switch", "turnover_per_year"]
+
+# Price and rank matrices of the worker process (set by init_worker)
+_shared: Dict[str, Any] = {}
+
+
+def decision_rows(dates: pd.DatetimeIndex, first_row: int, schedule: str) -> np.ndarray:
+    """Rows of the decision dates from `first_row` on: every N rows, or the first row of each W/M/Q period."""
+    rows = np.arange(first_row, len(dates))
+    if schedule in CALENDAR_SCHEDULES:
+        periods = dates[first_row:].to_period(CALENDAR_SCHEDULES[schedule]).asi8
+        return rows[np.concatenate(([True], periods[1:] != periods[:-1]))] if len(rows) else rows
+    return rows[::int(schedule)]
+
+
+def simulate(log_prices: np.ndarray, ranks: np.ndarray, decisions: np.ndarray, top_n: int, lag: int) -> Dict[str, Any] | None:
+    """
+    Simulates holding the top `top_n` of `ranks` (date x fund, NaN unranked) chosen on the `decisions`
+    rows and bought `lag` rows later. `log_prices` are forward-filled log10 prices. Returns the daily
+    value (1 at the first execution) from the first execution row and the turnover of each switch,
+    or None if no execution falls inside the matrix.
+    """
+    n_dates = log_prices.shape[0]
+    executions = decisions + lag
+    keep = executions < n_dates
+    decisions, executions = decisions[keep], executions[keep]
+    if not len(executions):
+        return None
+
+    held = ranks[decisions] <= top_n # NaN ranks compare False
+    n_held = held.sum(axis=1)
+    weights = held / np.maximum(n_held, 1)[:, None]
+    cash = (n_held == 0).astype(np.float64)
+
+    # Segment (index of the last execution) of every day from the first execution on
+    rows = np.arange(executions[0], n_dates)
+    segment = np.searchsorted(executions, rows, side="right") - 1
+    with np.errstate(invalid="ignore", over="ignore"):
+        growth = np.power(10.0, log_prices[rows] - log_prices[executions[segment]])
+        end_growth = np.power(10.0, log_prices[executions[1:]] - log_prices[executions[:-1]])
+    segment_weights = weights[segment]
+    segment_value = (np.where(segment_weights > 0, growth, 0.0) * segment_weights).sum(axis=1) + cash[segment]
+    # Value of each segment's holdings at the next execution, before switching
+    drifted = np.where(weights[:-1] > 0, end_growth, 0.0) * weights[:-1]
+    end_value = drifted.sum(axis=1) + cash[:-1]
+    start_value = np.concatenate(([1.0], np.cumprod(end_value)))
+    value = start_value[segment] * segment_value
+
+    drifted_weights = drifted / end_value[:, None]
+    drifted_cash = cash[:-1] / end_value
+    turnover = 0.5 * (np.abs(weights[1:] - drifted_weights).sum(axis=1) + np.abs(cash[1:] - drifted_cash))
+    return {"first_row": int(executions[0]), "value": value, "turnover": turnover}
+
+
+def summarize(dates: pd.DatetimeIndex, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Return, drawdown and turnover figures of a simulate() result."""
+    value, turnover = result["value"], result["turnover"]
+    start = dates[result["first_row"]]
+    years = (dates[-1] - start).days / 365.25
+    total_return = value[-1] - 1
+    return {
+        "start": start.strftime("%Y-%m-%d"),
+        "total_return": total_return,
+        "annual_return": value[-1] ** (1 / years) - 1 if years > 0 and value[-1] > 0 else np.nan,
+        "max_drawdown": float((1 - value / np.maximum.accumulate(value)).max()),
+        "switches": len(turnover),
+        "turnover_per_switch": float(turnover.mean()) if len(turnover) else 0.0,
+        "turnover_per_year": float(turnover.sum() / years) if years > 0 else np.nan,
+    }
+
+
+def init_worker(log_prices: np.ndarray, ranks: Dict[str, np.ndarray], dates: pd.DatetimeIndex, first_row: int) -> None:
+    _shared.update(log_prices=log_prices, ranks=ranks, dates=dates, first_row=first_row)
+
+
+def init_shared_worker(spec: Dict[str, Any], first_row: int) -> None:
+    """Pool initializer: attaches to the matrices run_grid published (the attachment lives as long as the worker)."""
+    attached = attach(spec)
+    init_worker(attached.arrays["log_prices"], {key: attached.arrays[key] for key in SCORES}, attached.dates, first_row)
+    _shared["attached"] = attached
+
+
+def run_backtest(params: Tuple[str, int, str, int]) -> Dict[str, Any]:
+    """One grid combination (score, top_n, rebalance, lag) on the worker's matrices."""
+    score, top_n, schedule, lag = params
+    dates = _shared["dates"]
+    row = {"score": score, "top_n": top_n, "rebalance": schedule, "lag": lag}
+    result = simulate(_shared["log_prices"], _shared["ranks"][score], decision_rows(dates, _shared["first_row"], schedule), top_n, lag)
+    if result is None:
+        return {**row, **{column: np.nan for column in RESULT_COLUMNS if column not in row}}
+    return {**row, **summarize(dates, result)}
+
+
+def run_grid(log_prices: pd.DataFrame, grid: List[Tuple[str, int, str, int]], first_row: int, jobs: int = 1) -> pd.DataFrame:
+    """
+    Backtests every (score, top_n, rebalance, lag) combination of `grid` on the bundled log price
+    matrix, deciding from row `first_row` on. jobs > 1 runs the combinations in that many processes.
+    """
+    log_prices = log_prices.sort_index()
+    scores = score_history(log_prices)
+    ranks = {key: rank_history(scores[column]).to_numpy(dtype=np.float64, na_value=np.nan) for key, column in SCORES.items()}
+    prices = log_prices.ffill().to_numpy(dtype=np.float64, na_value=np.nan)
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with SharedMatrices({"log_prices": prices, **ranks}, log_prices.index, list(log_prices.columns)) as shared, \
+                ProcessPoolExecutor(max_workers=jobs, initializer=init_shared_worker, initargs=(shared.spec, first_row)) as pool:
+            rows = list(pool.map(run_backtest, grid, chunksize=max(1, len(grid) // (4 * jobs))))
+    else:
+        init_worker(prices, ranks, log_prices.index, first_row)
+        rows = [run_backtest(params) for params in grid]
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def parse_list(parser: argparse.ArgumentParser, option: str, value: str, valid) -> List[str]:
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    bad = [item for item in items if not valid(item)]
+    if bad or not items:
+        parser.error(f"--{option}: invalid value(s) {bad or [value]}")
+    return list(dict.fromkeys(items))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Backtest holding the top-N funds of the long-term or lag-adjusted screen.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--tables", type=Path, default=emailer.DEFAULT_TABLES_DIR,
+                        help="Fund tables: a directory, fund_tables.zip or fund_tables_concat.txt\n"
+                             "(default: the committed tables/).")
+    parser.add_argument("--score", default=",".join(SCORES),
+                        help=f"Comma-separated screens: {', '.join(SCORES)} (default: both).")
+    parser.add_argument("--top-n", default="5,10,20", help="Comma-separated numbers of funds held (default: 5,10,20).")
+    parser.add_argument("--rebalance", default="5,21,M",
+                        help="Comma-separated schedules: trading days between decisions, or W, M, Q\n"
+                             "for the first trading day of each week, month, quarter (default: 5,21,M).")
+    parser.add_argument("--lag", default="0,2,5", help="Comma-separated execution lags in trading days (default: 0,2,5).")
+    parser.add_argument("--since", type=iso_date_arg, metavar="YYYY-MM-DD", default=None,
+                        help="First decision date (default: one year of lookback after the first date).\n"
+                             "Earlier prices are still used for the scores.")
+    parser.add_argument("--until", type=iso_date_arg, metavar="YYYY-MM-DD", default=None, help="Last date of the backtest (default: the latest).")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for the parameter grid (default: the number of CPUs).")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the results as CSV to this file.")
+    args = parser.parse_args()
+
+    scores = parse_list(parser, "score", args.score, lambda item: item in SCORES)
+    top_ns = [int(item) for item in parse_list(parser, "top-n", args.top_n, lambda item: item.isdigit() and int(item) > 0)]
+    schedules = [item.upper() if item.upper() in CALENDAR_SCHEDULES else item
+                 for item in parse_list(parser, "rebalance", args.rebalance,
+                                        lambda item: item.upper() in CALENDAR_SCHEDULES or (item.isdigit() and int(item) > 0))]
+    lags = [int(item) for item in parse_list(parser, "lag", args.lag, lambda item: item.isdigit())]
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    _, log_prices = load_bundled_prices(args.tables, until=args.until, purpose="backtest")
+
+    first_date = log_prices.dropna(how="all").index[0]
+    start = pd.Timestamp(args.since) if args.since else first_date + pd.tseries.offsets.BDay(LOOKBACKS_BD[ONE_YEAR_LOOKBACK_KEY])
+    first_row = int(log_prices.index.searchsorted(start))
+    if first_row >= len(log_prices.index):
+        sys.exit(f"Error: No dates on or after {start:%Y-%m-%d}.")
+
+    grid = list(itertools.product(scores, top_ns, schedules, lags))
+    jobs = min(args.jobs, len(grid))
+    started = time.perf_counter()
+    results = run_grid(log_prices, grid, first_row, jobs=jobs)
+    print(f"Backtested {len(grid)} combinations on {len(log_prices.index) - first_row} dates x {len(log_prices.columns)} funds "
+          f"in {time.perf_counter() - started:.2f} s ({jobs} worker(s))", file=sys.stderr)
+
+    results = results.sort_values("annual_return", ascending=False, kind="stable", na_position="last")
+    display = results.copy()
+    for column in ("total_return", "annual_return", "max_drawdown", "turnover_per_switch", "turnover_per_year"):
+        display[column] = display[column].map(lambda v: "" if pd.isna(v) else f"{v:.2%}")
+    print(display.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Wrote backtest results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
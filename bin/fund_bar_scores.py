@@ -0,0 +1,99 @@
+"""fund_bar_scores.py
+
+Fund scores for the `interactive_fund_plot.py --bar` dashboard.
+
+Each fund's log10 series gets one contribution per window in BAR_WINDOWS (trading
+days): the slope of a least-squares line over the last `window` values, scaled to
+the percent change across the window (slope * (window - 1) * 100). A window longer
+than the series contributes 0. The score is the weighted sum of the contributions
+(BAR_INIT_WEIGHTS are the dashboard's initial slider weights).
+
+The score trend ("gradient") is the slope of the scores of the last
+GRADIENT_LOOKBACK_DAYS days: for day k back the series is cut k values short and
+renormalized to end at 0, scored again, and a line is fitted through those scores.
+The per-day contribution sets are also handed to the dashboard's JavaScript, which
+recomputes scores and gradients when the weights are changed.
+
+Kept separate from the plot tool so the scoring can be imported on its own, e.g. by
+`fund_equivalence.py` to compare faster implementations against this reference.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+BAR_WINDOWS = [5, 10, 21, 64, 129, 261, 390, 522]
+BAR_INIT_WEIGHTS = [0.3, 1.5, 2.5, 4, 3, 2, 1.5, 1]
+BAR_PERIOD_LABELS = {
+    5: 'Week', 10: 'Fortnight', 21: 'Month', 64: 'Quarter',
+    129: 'Half year', 261: 'Year', 390: '1.5 years', 522: '2 years'
+}
+GRADIENT_LOOKBACK_DAYS = 10
+
+
+def window_contributions(ys: Sequence[float] | np.ndarray, windows: Sequence[int] = BAR_WINDOWS) -> List[float]:
+    """Percent change of the fitted line over the last `window` values, per window (0.0 if too short or not finite)."""
+    if not isinstance(ys, np.ndarray): ys = np.array(ys)
+    contributions = []
+    for window in windows:
+        if len(ys) < window:
+            contributions.append(0.0)
+        else:
+            m, _ = np.polyfit(np.arange(window), ys[-window:], 1)
+            raw_contrib = m * (window - 1) * 100
+            contributions.append(raw_contrib if np.isfinite(raw_contrib) else 0.0)
+    return contributions
+
+
+def score_funds(series_by_fund: Dict[str, np.ndarray], windows: Sequence[int] = BAR_WINDOWS,
+                weights: Sequence[float] = BAR_INIT_WEIGHTS,
+                lookback_days: int = GRADIENT_LOOKBACK_DAYS) -> Dict[str, Any]:
+    """
+    Scores every fund (log10 values without NaNs, oldest first) in name order. Returns:
+      names                     sorted fund names
+      main_contributions        [per-window contributions] per fund
+      historical_contributions  {name: [per-window contributions for day k back, k = 0..lookback_days-1]}
+      scores                    weighted sum of main_contributions per fund (0.0 if not finite)
+      gradients                 slope of the last lookback_days scores per fund (NaN if the series is too short)
+    """
+    names = sorted(series_by_fund.keys())
+    main_contributions: List[List[float]] = []
+    historical_contributions: Dict[str, List[List[float]]] = {}
+    scores: List[float] = []
+    gradients: List[float] = []
+    shortest_window = windows[0] if windows else 5
+    min_total_length_for_gradient = shortest_window + (lookback_days - 1)
+
+    for fund_name in names:
+        ys = series_by_fund[fund_name]
+        contributions = window_contributions(ys, windows)
+        main_contributions.append(contributions)
+        score = sum(p * wt for p, wt in zip(contributions, weights))
+        scores.append(score if np.isfinite(score) else 0.0)
+
+        day_contribution_sets = []
+        if len(ys) < min_total_length_for_gradient:
+            for _ in range(lookback_days): day_contribution_sets.append([0.0] * len(windows))
+        else:
+            for k in range(lookback_days):
+                segment = ys[:len(ys) - k]
+                day_contributions = [0.0] * len(windows)
+                if len(segment) >= shortest_window:
+                    day_contributions = window_contributions(segment - segment[-1], windows)
+                day_contribution_sets.append(day_contributions)
+        historical_contributions[fund_name] = day_contribution_sets
+
+        if len(ys) >= min_total_length_for_gradient:
+            day_scores = []
+            for k in range(lookback_days):
+                day_score = sum(p * wt for p, wt in zip(day_contribution_sets[k], weights))
+                day_scores.append(day_score if np.isfinite(day_score) else 0.0)
+            if len([s for s in day_scores if np.isfinite(s)]) == lookback_days:
+                slope, _ = np.polyfit(np.arange(lookback_days), day_scores[::-1], 1)
+                gradients.append(slope)
+            else: gradients.append(np.nan)
+        else: gradients.append(np.nan)
+
+    return {"names": names, "main_contributions": main_contributions,
+            "historical_contributions": historical_contributions, "scores": scores, "gradients": gradients}
@@ -0,0 +1,264 @@
+"""fund_benchmark.py
+
+Synthetic-data benchmark for the fund table pipeline.
+
+Writes fund tables in the exact format of `slice_fond_files.pl` (a blank line,
+the '# ;[alias]...' header, the '# ;name;...' header, then 'YYYY-MM-DD;-0,046;;...;'
+rows of comma-decimal log10 values normalized to 0 on the latest date, ISO-8859-15)
+plus a matching fund name bundle YAML, for any number of funds, years of history
+and alias bundle size. It then times the pipeline on them:
+
+- In process, repeated (min and median wall time): table loading with the pandas
+  and the streaming parser, bundle_funds and compute_momentum_tables from
+  fund_momentum_emailer.py.
+- As subprocesses with --profile (per-stage wall time, CPU time and tracemalloc
+  peak, see stage_profiler.py): the emailer's markdown report, the plot tool's
+  single-page charts (-r :internal:) and its --bar dashboard. tracemalloc slows
+  these runs down, so compare their stage times only with other profiled runs.
+  A subprocess that exceeds --timeout is recorded as "timeout", which is how a
+  size that breaks the pipeline shows up in the results.
+
+Every combination of --funds, --years and --bundle-size is run and the results
+are written as one JSON document (--output), to be kept as a baseline and
+compared with later runs.
+
+Usage:
+    python3 bin/fund_benchmark.py                                   # 500 funds, 2 years, bundles of 2
+    python3 bin/fund_benchmark.py --funds 500,2000,10000 --years 1,5,20 --output benchmark_baseline.json
+    python3 bin/fund_benchmark.py --funds 10000 --years 20 --skip-plots --timeout 1800
+    python3 bin/fund_benchmark.py --funds 1000 --keep-dir /tmp/synthetic_tables   # Keep the generated tables
+
+Python deps: numpy, pandas, pyyaml (plus the deps of the benchmarked scripts)
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import fund_momentum_emailer as emailer
+
+SCRIPT_DIR = Path(os.path.abspath(__file__)).parent
+EMAILER_SCRIPT = SCRIPT_DIR / "fund_momentum_emailer.py"
+PLOT_SCRIPT = SCRIPT_DIR / "interactive_fund_plot.py"
+
+BUSINESS_DAYS_PER_YEAR = 261
+TABLE_ENCODING = "iso-8859-15"
+SYNTHETIC_END_DATE = "2025-05-21"
+
+
+def parse_int_list(value: str) -> List[int]:
+    """argparse type for comma-separated integers, e.g. '500,2000,10000'."""
+    try:
+        return [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a comma-separated list of integers")
+
+
+def synthetic_log_prices(rng: np.random.Generator, n_rows: int, n_funds: int) -> np.ndarray:
+    """
+    Random-walk log10 prices, rows x funds, each fund normalized to 0 on the last row.
+    About a fifth of the funds start late (NaN before their start) and 0.5% of the
+    remaining cells are blank, as with missing quotes in the real tables.
+    """
+    daily_returns = rng.normal(0.0003, 0.012, size=(n_rows, n_funds))
+    log_prices = np.cumsum(daily_returns, axis=0) / np.log(10)
+    log_prices -= log_prices[-1]
+    late_starters = rng.random(n_funds) < 0.2
+    start_rows = np.where(late_starters, rng.integers(0, max(1, int(n_rows * 0.6)), n_funds), 0)
+    log_prices[np.arange(n_rows)[:, None] < start_rows[None, :]] = np.nan
+    gaps = rng.random((n_rows, n_funds)) < 0.005
+    gaps[-1] = False # Keep the latest (normalized) value
+    log_prices[gaps] = np.nan
+    return log_prices
+
+
+def write_table(path: Path, dates: pd.DatetimeIndex, names: List[str], alias_groups: List[List[str]], values: np.ndarray) -> None:
+    """Writes one fund table in the slice_fond_files.pl format."""
+    frame = pd.DataFrame(values, index=dates.strftime("%Y-%m-%d"), columns=names)
+    frame[""] = "" # Empty last column gives the trailing ';' of every data row
+    body = frame.to_csv(sep=";", decimal=",", float_format="%.3f", header=False, na_rep="", lineterminator="\n")
+    alias_header = "# ;" + ";".join("".join(f"[{alias}]" for alias in group) for group in alias_groups) + ";\n"
+    name_header = "# ;" + ";".join(names) + ";\n"
+    with path.open("w", encoding=TABLE_ENCODING, newline="") as f:
+        f.write("\n" + alias_header + name_header + body)
+
+
+def generate_synthetic_tables(out_dir: Path, n_funds: int, years: int, bundle_size: int,
+                              funds_per_table: int = 17, seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Writes fund_tables_<n>.csv files and fund_names.yaml for n_funds funds with `years` years of
+    business-day history into out_dir, and returns the bundles {canonical name: [alias names]}.
+    With bundle_size k each fund's history is split over k table columns: the current name holds
+    the latest segment and k-1 former names hold the earlier ones, as after fund renames.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=SYNTHETIC_END_DATE, periods=years * BUSINESS_DAYS_PER_YEAR)
+    log_prices = synthetic_log_prices(rng, len(dates), n_funds)
+
+    bundles: Dict[str, List[str]] = {}
+    columns: Dict[str, np.ndarray] = {}
+    segment_bounds = np.linspace(0, len(dates), bundle_size + 1).astype(int)
+    for fund in range(n_funds):
+        canonical = f"synthetic fund {fund + 1:05d}"
+        aliases = [canonical] + [f"{canonical} former {k}" for k in range(1, bundle_size)]
+        bundles[canonical] = aliases
+        for k, alias in enumerate(aliases): # Current name: latest segment; former k: k-th segment from the end
+            start, end = segment_bounds[bundle_size - 1 - k], segment_bounds[bundle_size - k]
+            column = np.full(len(dates), np.nan)
+            column[start:end] = log_prices[start:end, fund]
+            columns[alias] = column
+
+    column_names = sorted(columns)
+    for table_number, first in enumerate(range(0, len(column_names), funds_per_table), start=1):
+        names = column_names[first:first + funds_per_table]
+        alias_groups = [bundles[name.split(" former ")[0]] for name in names] # Current name first, as in the real tables
+        write_table(out_dir / f"fund_tables_{table_number}.csv", dates, names,
+                    alias_groups, np.column_stack([columns[name] for name in names]))
+
+    with (out_dir / "fund_names.yaml").open("w", encoding=TABLE_ENCODING) as f:
+        yaml.safe_dump({"fund_names": bundles}, f, allow_unicode=True, sort_keys=True)
+    return bundles
+
+
+def time_repeated(function: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """
+    Runs function `repeat` times with stderr (the scripts' progress lines) discarded; returns
+    min/median wall seconds and the last result (under 'result').
+    """
+    timings = []
+    result = None
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+    return {"min_s": round(min(timings), 6), "median_s": round(statistics.median(timings), 6), "runs": repeat, "result": result}
+
+
+def benchmark_in_process(tables_dir: Path, bundles: Dict[str, List[str]], repeat: int) -> Dict[str, Any]:
+    """Times the emailer's load, bundle and momentum functions on the synthetic tables."""
+    stages: Dict[str, Any] = {}
+    stages["load_pandas"] = time_repeated(lambda: emailer.load_and_parse_individual_csv_files(tables_dir), repeat)
+    stages["load_streaming"] = time_repeated(
+        lambda: emailer.load_and_parse_individual_csv_files(tables_dir, parser="streaming"), repeat)
+    raw_prices_df = stages["load_pandas"]["result"]
+    stages["bundle"] = time_repeated(lambda: emailer.bundle_funds(raw_prices_df, bundles), repeat)
+    bundled_df = stages["bundle"]["result"]
+    stages["momentum"] = time_repeated(lambda: emailer.compute_momentum_tables(bundled_df), repeat)
+    for stage in stages.values():
+        del stage["result"]
+    stages["matrix_shape"] = list(raw_prices_df.shape)
+    return stages
+
+
+def run_profiled(command: List[str], profile_path: Path, timeout: float, env: Dict[str, str] | None = None) -> Dict[str, Any]:
+    """Runs a script with --profile, discarding its output; returns status, total wall time and the profile's stages."""
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(command + ["--profile", str(profile_path)], stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, timeout=timeout, env=env)
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout", "wall_s": round(time.perf_counter() - start, 3)}
+    result: Dict[str, Any] = {"status": "ok" if completed.returncode == 0 else f"exit {completed.returncode}",
+                              "wall_s": round(time.perf_counter() - start, 3)}
+    if completed.returncode != 0:
+        result["stderr_tail"] = completed.stderr.decode("utf-8", "replace").splitlines()[-5:]
+    if profile_path.exists():
+        profile = json.loads(profile_path.read_text(encoding="utf-8"))
+        result["total"] = profile["total"]
+        result["stages"] = profile["stages"]
+    return result
+
+
+def benchmark_subprocesses(tables_dir: Path, timeout: float, skip_plots: bool) -> Dict[str, Any]:
+    """Profiles the emailer report and the plot tool's chart and bar modes on the synthetic tables."""
+    env = dict(os.environ, YAML_DATA_URL=(tables_dir / "fund_names.yaml").as_uri())
+    runs = {"emailer_report": run_profiled([sys.executable, str(EMAILER_SCRIPT), "--tables", str(tables_dir)],
+                                           tables_dir / "profile_emailer.json", timeout, env)}
+    if not skip_plots:
+        runs["plot_charts"] = run_profiled([sys.executable, str(PLOT_SCRIPT), "-t", str(tables_dir), "-r", ":internal:"],
+                                           tables_dir / "profile_charts.json", timeout)
+        runs["plot_bar"] = run_profiled([sys.executable, str(PLOT_SCRIPT), "--bar", "-t", str(tables_dir), "-r", ":internal:"],
+                                        tables_dir / "profile_bar.json", timeout)
+    return runs
+
+
+def run_configuration(work_dir: Path, n_funds: int, years: int, bundle_size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    config = {"funds": n_funds, "years": years, "bundle_size": bundle_size, "funds_per_table": args.funds_per_table, "seed": args.seed}
+    print(f"Benchmarking {config}...", file=sys.stderr)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    bundles = generate_synthetic_tables(work_dir, n_funds, years, bundle_size, args.funds_per_table, args.seed)
+    result: Dict[str, Any] = {"config": config, "generate_s": round(time.perf_counter() - start, 3),
+                              "tables": len(list(work_dir.glob("fund_tables_*.csv"))),
+                              "table_bytes": sum(p.stat().st_size for p in work_dir.glob("fund_tables_*.csv"))}
+    result["in_process"] = benchmark_in_process(work_dir, bundles, args.repeat)
+    result["subprocess"] = benchmark_subprocesses(work_dir, args.timeout, args.skip_plots)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the fund pipeline on synthetic fund tables.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--funds", type=parse_int_list, default=[500],
+                        help="Comma-separated fund counts to benchmark, e.g. 500,2000,10000 (default: 500).")
+    parser.add_argument("--years", type=parse_int_list, default=[2],
+                        help="Comma-separated history lengths in years, e.g. 1,5,20 (default: 2).")
+    parser.add_argument("--bundle-size", type=parse_int_list, default=[2],
+                        help="Comma-separated alias bundle sizes: table columns (current + former names)\n"
+                             "per fund (default: 2).")
+    parser.add_argument("--funds-per-table", type=int, default=17,
+                        help="Fund columns per fund_tables_<n>.csv, as slice_fond_files.pl writes them (default: 17).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per in-process stage (default: 3).")
+    parser.add_argument("--timeout", type=float, default=600.0,
+                        help="Seconds before a profiled subprocess is recorded as 'timeout' (default: 600).")
+    parser.add_argument("--skip-plots", action="store_true", help="Do not run the plot tool.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data (default: 0).")
+    parser.add_argument("--keep-dir", type=Path, default=None,
+                        help="Write the synthetic tables under this directory and keep them\n"
+                             "(one <funds>f_<years>y_<bundle>b subdirectory per configuration).")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_baseline.json"),
+                        help="Where to write the JSON results (default: benchmark_baseline.json).")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "generated_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="fund_benchmark_") as temp_dir:
+        base_dir = args.keep_dir if args.keep_dir else Path(temp_dir)
+        for n_funds in args.funds:
+            for years in args.years:
+                for bundle_size in args.bundle_size:
+                    work_dir = base_dir / f"{n_funds}f_{years}y_{bundle_size}b"
+                    results["runs"].append(run_configuration(work_dir, n_funds, years, bundle_size, args))
+                    with args.output.open("w", encoding="utf-8") as f: # Rewritten after every run so partial results survive
+                        json.dump(results, f, indent=2)
+                        f.write("\n")
+    print(f"Wrote benchmark results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""fund_equivalence.py
+
+Golden-output check for faster implementations of the ranking code.
+
+Runs the reference engine - bundle_funds and compute_momentum_tables from
+fund_momentum_emailer.py and score_funds from fund_bar_scores.py (the --bar
+dashboard) - and a candidate engine on the same inputs, and compares:
+
+- bundle_funds: the bundled price matrix (same funds, dates and values).
+- compute_momentum_tables: the full perf_df (every lookback return, All Dates,
+  LongTermAdjustedPerf and LagAdjScore) and both top-20 tables. The funds and
+  ranks of the top-20 tables must match exactly; the published rankings may not
+  change. Numbers must agree within --rtol/--atol.
+- score_funds: the per-window contributions, the day-by-day contributions for
+  the gradient, the scores and the gradients of every fund.
+
+The candidate is a module (importable name or path to a .py file) defining any
+of bundle_funds, compute_momentum_tables and score_funds with the reference
+signatures; functions it does not define are taken from the reference. Without
+--candidate the reference is checked against itself, which shows the timing
+noise to expect.
+
+Inputs are the committed tables/ with the default fund name bundles and
+synthetic tables from fund_benchmark.py (--synthetic-funds, --synthetic-years,
+--bundle-size). Each stage is timed for both engines (median of --repeat runs)
+and the speedup (reference / candidate) is reported. The exit status is 1 if
+any output differs, so the check can gate a change.
+
+Usage:
+    python3 bin/fund_equivalence.py                                  # Reference against itself
+    python3 bin/fund_equivalence.py --candidate fast_momentum        # bin/fast_momentum.py
+    python3 bin/fund_equivalence.py --candidate /tmp/engine.py --datasets synthetic --synthetic-funds 5000
+    python3 bin/fund_equivalence.py --candidate fast_momentum --output equivalence.json
+
+Python deps: numpy, pandas, pyyaml (plus the deps of fund_momentum_emailer.py)
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import importlib.util
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import fund_bar_scores
+import fund_momentum_emailer as emailer
+from fund_benchmark import generate_synthetic_tables, time_repeated
+
+ENGINE_FUNCTIONS = ("bundle_funds", "compute_momentum_tables", "score_funds")
+DATASETS = ("tables", "synthetic")
+
+
+def reference_engine() -> Dict[str, Callable[..., Any]]:
+    return {"bundle_funds": emailer.bundle_funds,
+            "compute_momentum_tables": emailer.compute_momentum_tables,
+            "score_funds": fund_bar_scores.score_funds}
+
+
+def load_candidate_engine(spec: str) -> Dict[str, Callable[..., Any]]:
+    """Imports the candidate module (name or .py path); functions it lacks come from the reference."""
+    if spec.endswith(".py"):
+        module_spec = importlib.util.spec_from_file_location(Path(spec).stem, spec)
+        if module_spec is None or module_spec.loader is None:
+            raise ImportError(f"Cannot load candidate engine from '{spec}'")
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(spec)
+    engine = reference_engine()
+    provided = [name for name in ENGINE_FUNCTIONS if callable(getattr(module, name, None))]
+    if not provided:
+        raise ImportError(f"Candidate engine '{spec}' defines none of {', '.join(ENGINE_FUNCTIONS)}")
+    for name in provided:
+        engine[name] = getattr(module, name)
+    print(f"Candidate engine '{spec}' provides: {', '.join(provided)}", file=sys.stderr)
+    return engine
+
+
+def bar_series(raw_prices_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Per table column log10 values without NaNs, oldest first, as interactive_fund_plot.py --bar reads them."""
+    return {str(name): raw_prices_df[name].dropna().to_numpy(dtype=np.float64) for name in raw_prices_df.columns}
+
+
+def compare_arrays(label: str, reference: Any, candidate: Any, rtol: float, atol: float) -> List[str]:
+    reference, candidate = np.asarray(reference, dtype=np.float64), np.asarray(candidate, dtype=np.float64)
+    if reference.shape != candidate.shape:
+        return [f"{label}: shape {candidate.shape} != reference {reference.shape}"]
+    close = np.isclose(candidate, reference, rtol=rtol, atol=atol, equal_nan=True)
+    if close.all():
+        return []
+    worst = np.nanmax(np.where(close, 0.0, np.abs(candidate - reference)))
+    return [f"{label}: {int((~close).sum())} of {close.size} values differ (largest difference {worst:.3g})"]
+
+
+def compare_frames(label: str, reference: pd.DataFrame, candidate: pd.DataFrame, rtol: float, atol: float) -> List[str]:
+    """Same columns and rows (in any order), numeric columns within tolerance, other columns equal."""
+    if set(reference.columns) != set(candidate.columns):
+        return [f"{label}: columns {sorted(map(str, candidate.columns))} != reference {sorted(map(str, reference.columns))}"]
+    if not reference.index.sort_values().equals(candidate.index.sort_values()):
+        return [f"{label}: {len(candidate.index)} rows do not match the reference's {len(reference.index)}"]
+    candidate = candidate.loc[reference.index, reference.columns]
+    problems: List[str] = []
+    for column in reference.columns:
+        if pd.api.types.is_numeric_dtype(reference[column]) and pd.api.types.is_numeric_dtype(candidate[column]):
+            problems += compare_arrays(f"{label} '{column}'", reference[column], candidate[column], rtol, atol)
+        elif not reference[column].equals(candidate[column]):
+            problems.append(f"{label} '{column}': values differ")
+    return problems
+
+
+def compare_top_table(label: str, reference: pd.DataFrame, candidate: pd.DataFrame, rtol: float, atol: float) -> List[str]:
+    """Top-20 tables must list the same funds with the same ranks; their numbers may differ within tolerance."""
+    reference_order, candidate_order = list(reference.get("Fund", [])), list(candidate.get("Fund", []))
+    if reference_order != candidate_order:
+        first = next((i for i, pair in enumerate(zip(reference_order, candidate_order)) if pair[0] != pair[1]),
+                     min(len(reference_order), len(candidate_order)))
+        return [f"{label}: ranking differs from rank {first + 1} (candidate {candidate_order[first:first + 3]}, "
+                f"reference {reference_order[first:first + 3]})"]
+    if list(reference.get("Rank", [])) != list(candidate.get("Rank", [])):
+        return [f"{label}: Rank column differs"]
+    return compare_frames(label, reference.set_index("Fund"), candidate.set_index("Fund"), rtol, atol)
+
+
+def compare_bar_scores(reference: Dict[str, Any], candidate: Dict[str, Any], rtol: float, atol: float) -> List[str]:
+    if list(reference["names"]) != list(candidate["names"]):
+        return ["score_funds: fund names differ"]
+    problems = []
+    for key in ("main_contributions", "scores", "gradients"):
+        problems += compare_arrays(f"score_funds {key}", reference[key], candidate[key], rtol, atol)
+    historical = [name for name in reference["names"]
+                  if compare_arrays("", reference["historical_contributions"][name],
+                                    candidate["historical_contributions"].get(name, []), rtol, atol)]
+    if historical:
+        problems.append(f"score_funds historical_contributions: {len(historical)} funds differ, e.g. '{historical[0]}'")
+    return problems
+
+
+def check_dataset(label: str, raw_prices_df: pd.DataFrame, bundles: Dict[str, List[str]],
+                  reference: Dict[str, Callable[..., Any]], candidate: Dict[str, Callable[..., Any]],
+                  args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs both engines on one dataset; returns timings, speedups and any differences."""
+    print(f"Checking {label} ({raw_prices_df.shape[0]} dates x {raw_prices_df.shape[1]} table columns)...", file=sys.stderr)
+    series = bar_series(raw_prices_df)
+    stages: Dict[str, Dict[str, Any]] = {}
+    outputs: Dict[str, Dict[str, Any]] = {}
+    for engine_label, engine in (("reference", reference), ("candidate", candidate)):
+        bundle = time_repeated(lambda: engine["bundle_funds"](raw_prices_df, bundles), args.repeat)
+        bundled_df = bundle.pop("result")
+        # Both engines rank the reference bundle, so a bundling difference does not hide a ranking one
+        momentum_input = outputs["reference"]["bundle"] if engine_label == "candidate" else bundled_df
+        momentum = time_repeated(lambda: engine["compute_momentum_tables"](momentum_input), args.repeat)
+        scores = time_repeated(lambda: engine["score_funds"](series), args.repeat)
+        outputs[engine_label] = {"bundle": bundled_df, "momentum": momentum.pop("result"), "scores": scores.pop("result")}
+        for stage, timing in (("bundle_funds", bundle), ("compute_momentum_tables", momentum), ("score_funds", scores)):
+            stages.setdefault(stage, {})[engine_label] = timing
+
+    ref, cand = outputs["reference"], outputs["candidate"]
+    problems = compare_frames("bundle_funds", ref["bundle"], cand["bundle"], args.rtol, args.atol)
+    ref_long, ref_lag, ref_perf = ref["momentum"]
+    cand_long, cand_lag, cand_perf = cand["momentum"]
+    problems += compare_frames("perf_df", ref_perf.set_index("Fund"), cand_perf.set_index("Fund"), args.rtol, args.atol)
+    problems += compare_top_table("LongTermAdjustedPerf top 20", ref_long, cand_long, args.rtol, args.atol)
+    problems += compare_top_table("LagAdjScore top 20", ref_lag, cand_lag, args.rtol, args.atol)
+    problems += compare_bar_scores(ref["scores"], cand["scores"], args.rtol, args.atol)
+
+    for timings in stages.values():
+        candidate_s = timings["candidate"]["median_s"]
+        timings["speedup"] = round(timings["reference"]["median_s"] / candidate_s, 3) if candidate_s > 0 else None
+    return {"dataset": label, "shape": list(raw_prices_df.shape), "funds": len(ref_perf),
+            "equivalent": not problems, "differences": problems, "stages": stages}
+
+
+def print_summary(result: Dict[str, Any]) -> None:
+    status = "EQUIVALENT" if result["equivalent"] else "DIFFERENT"
+    print(f"{result['dataset']}: {status} ({result['funds']} ranked funds)")
+    for stage, timings in result["stages"].items():
+        print(f"  {stage:<24} reference {timings['reference']['median_s']:9.4f}s  "
+              f"candidate {timings['candidate']['median_s']:9.4f}s  speedup {timings['speedup']}x")
+    for problem in result["differences"]:
+        print(f"  - {problem}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check a candidate ranking engine against the reference implementation.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--candidate", default=None,
+                        help="Module name or .py path defining bundle_funds, compute_momentum_tables\n"
+                             "and/or score_funds (default: the reference itself).")
+    parser.add_argument("--datasets", default=",".join(DATASETS),
+                        help=f"Comma-separated datasets to check: {', '.join(DATASETS)} (default: both).")
+    parser.add_argument("--tables", type=Path, default=emailer.DEFAULT_TABLES_DIR,
+                        help="Fund tables for the 'tables' dataset (default: the committed tables/).")
+    parser.add_argument("--yaml", type=Path, default=emailer.DEFAULT_LOCAL_YAML_PATH,
+                        help="Fund name bundles YAML for the 'tables' dataset (default: bin/fund_name_bundles.yaml).")
+    parser.add_argument("--synthetic-funds", type=int, default=500, help="Funds in the synthetic dataset (default: 500).")
+    parser.add_argument("--synthetic-years", type=int, default=3, help="Years of synthetic history (default: 3).")
+    parser.add_argument("--bundle-size", type=int, default=2, help="Table columns per synthetic fund (default: 2).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data (default: 0).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage and engine (default: 3).")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="Relative tolerance for numbers (default: 1e-9).")
+    parser.add_argument("--atol", type=float, default=1e-12, help="Absolute tolerance for numbers (default: 1e-12).")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    datasets = [name.strip() for name in args.datasets.split(",") if name.strip()]
+    unknown = [name for name in datasets if name not in DATASETS]
+    if unknown or not datasets:
+        parser.error(f"--datasets must list {' and/or '.join(DATASETS)}, got '{args.datasets}'")
+
+    reference = reference_engine()
+    try:
+        candidate = load_candidate_engine(args.candidate) if args.candidate else reference_engine()
+    except ImportError as e:
+        sys.exit(f"Error: {e}")
+
+    results: List[Dict[str, Any]] = []
+    if "tables" in datasets:
+        bundles = yaml.safe_load(args.yaml.read_text(encoding=emailer.YAML_ENCODING))["fund_names"]
+        raw_prices_df = emailer.load_and_parse_individual_csv_files(args.tables)
+        results.append(check_dataset(f"tables ({args.tables})", raw_prices_df, bundles, reference, candidate, args))
+    if "synthetic" in datasets:
+        with tempfile.TemporaryDirectory(prefix="fund_equivalence_") as temp_dir:
+            bundles = generate_synthetic_tables(Path(temp_dir), args.synthetic_funds, args.synthetic_years,
+                                                args.bundle_size, seed=args.seed)
+            raw_prices_df = emailer.load_and_parse_individual_csv_files(Path(temp_dir))
+        label = f"synthetic ({args.synthetic_funds} funds, {args.synthetic_years} years, bundles of {args.bundle_size})"
+        results.append(check_dataset(label, raw_prices_df, bundles, reference, candidate, args))
+
+    for result in results:
+        print_summary(result)
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump({"candidate": args.candidate, "rtol": args.rtol, "atol": args.atol, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Wrote equivalence results to {args.output}", file=sys.stderr)
+    sys.exit(0 if all(result["equivalent"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
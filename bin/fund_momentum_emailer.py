@@ -9,13 +9,14 @@ computes two momentum screens:
        penalizing for poor 1-year and very poor recent (2-month) performance.
     2. Best Lag-Adjusted Short-Term Assessment (top-20)
 
-Also displays a table of funds appearing in both top-20 lists.
+Also displays a table of funds appearing in both top-20 lists (the table size is set with --top-k).
 Optionally, a list of specific funds can be provided via --compare for direct comparison.
 Output tables include Rank, Fund, 2-week, 1-month, 2-month, 3-month, 6-month, 1-year, and All Dates performance.
 HTML output includes a "Copy CSV" button for each table and sortable columns.
 
 Default file locations (assuming script is in 'bin/' and run from project root):
-- CSV Data: Scans for 'tables/fund_tables_*.csv' (expected to contain log10 of normalized prices, ISO-8859-15 encoding)
+- CSV Data: Scans for 'tables/fund_tables_*.csv' (expected to contain log10 of normalized prices, ISO-8859-15 encoding),
+  or reads them from 'tables/fund_tables.zip' / 'tables/fund_tables_concat.txt' with --tables
 - YAML Bundles: 'bin/fund_name_bundles.yaml' (expected to be ISO-8859-15 encoding)
 
 Output Behavior:
@@ -35,6 +36,18 @@ Usage examples:
     python3.11 bin/fund_momentum_emailer.py --email > fund_report.html
     python3.11 bin/fund_momentum_emailer.py --compare "Fund Name A","Another Fund, with comma"
     python3.11 bin/fund_momentum_emailer.py --compare "'Fund C','Fund D'" --email > specific_funds_report.html
+    python3.11 bin/fund_momentum_emailer.py --compare "Fund Name A","Fund B" --compare-only
+    python3.11 bin/fund_momentum_emailer.py --since 2023-05-01   # Load only ~2 years; "All Dates" still uses full history
+    python3.11 bin/fund_momentum_emailer.py --parser streaming   # Parse tables straight to floats (lower peak memory)
+    python3.11 bin/fund_momentum_emailer.py --tables tables/fund_tables.zip --jobs 4   # Read the zip archive, 4 parser processes
+    python3.11 bin/fund_momentum_emailer.py --profile profile.json   # Per-stage wall/CPU time and memory peak as JSON
+    python3.11 bin/fund_momentum_emailer.py --weight-profiles   # Add one Top 20 table per profile in bin/weight_profiles.yaml
+    python3.11 bin/fund_momentum_emailer.py --top-k 50   # Rank 50 funds per table
+    python3.11 bin/fund_momentum_emailer.py --as-of 2025-03-31   # The report as it stood on that date
+    python3.11 bin/fund_momentum_emailer.py --cache-dir .output_cache   # Reuse the ranked tables while the inputs are unchanged
+    python3.11 bin/fund_momentum_emailer.py --score-store results/score_history   # Keep every fund's results of the run date
+    python3.11 bin/fund_momentum_emailer.py --score-store results/score_history --rank-changes   # Moves since the previous stored run
+    python3.11 bin/fund_momentum_emailer.py --export-dir results/export --export-format parquet   # Typed performance and price files
 
 Environment variables:
     (SMTP variables like SMTP_HOST, SMTP_USER, SMTP_PASS, RECIPIENT, SENDER are no longer
@@ -47,6 +60,8 @@ Environment variables:
 
 Shared Environment variables (can override default local file paths):
     YAML_DATA_URL  optional - URL (http/https/file) for the fund name bundles YAML file.
+    HTTP_CACHE_DIR optional - cache of http(s) downloads, revalidated with ETag / If-Modified-Since
+                   and used when the server is down (default: '.http_cache' in the project root).
 
 
 Python deps: pandas, numpy, pyyaml, requests, tabulate, argparse
@@ -55,24 +70,35 @@ Python deps: pandas, numpy, pyyaml, requests, tabulate, argparse
 # Standard library imports
 import os
 import sys
-import smtplib
-import ssl
 import textwrap
 import argparse # For command-line argument parsing
 import csv # For parsing comma-separated fund list
 from datetime import datetime, timezone
 from email.message import EmailMessage # Kept if send_email is used manually
 from io import StringIO # Used for pd.read_csv with text string
+from html import escape as html_escape # Weight profile names in HTML headings
 from typing import Dict, List, Tuple, Any
 from pathlib import Path # For creating file URIs
 import glob # For finding multiple CSV files
+from itertools import repeat
 
 # Third-party library imports
 import numpy as np
 import pandas as pd
-import requests
 import yaml
-from tabulate import tabulate
+# requests, tabulate, smtplib/ssl and the --jobs process pool are imported where they are used:
+# a run reading the YAML from a file:// URI and printing HTML never needs them, and they add to every start-up
+
+# Local imports (bin/ is on sys.path when the script is run directly)
+from stage_profiler import StageProfiler
+from fund_top_k import DEFAULT_TOP_K, rank_values, top_k_positions, top_k_rows
+from fund_weight_profiles import DEFAULT_WEIGHT_PROFILES_FILE, LONG_TERM_PARAMETERS, load_weight_profiles
+from fund_arrow_export import EXPORT_FORMATS, export_results, require_pyarrow
+from fund_score_store import BAR_SCORE_COLUMNS, RANK_COLUMNS, append_run, bar_score_columns, load_run, previous_run
+from output_cache import (cache_key, code_version, frames_from_npz, frames_to_npz, load_artifact, short_key, store_artifact,
+                          table_source_digest, text_digest)
+from fund_tables_io import (load_table_index, read_fund_columns, filter_table_lines, first_values_for_bundles,
+                            iso_date_arg, parse_table_values, iter_table_sources)
 
 # ------------------- Config & constants ------------------------------------ #
 
@@ -84,6 +110,7 @@ DEFAULT_LOCAL_YAML_PATH = PROJECT_ROOT_DIR / "bin" / "fund_name_bundles.yaml"
 DEFAULT_YAML_FILE_URI = DEFAULT_LOCAL_YAML_PATH.as_uri()
 
 YAML_URL = os.getenv("YAML_DATA_URL", DEFAULT_YAML_FILE_URI)
+CACHE_GENERATOR = "fund_momentum_emailer" # --cache-dir subdirectory
 
 CSV_ENCODING = "iso-8859-15"
 YAML_ENCODING = "iso-8859-15"
@@ -146,14 +173,17 @@ def fetch_data(url: str, expected_encoding: str) -> str:
             print(f"Error reading local file {file_path} with encoding {expected_encoding}: {e}", file=sys.stderr)
             raise
     elif url.startswith("http://") or url.startswith("https://"):
+        import requests
+        from http_cache import DEFAULT_CACHE_DIR, fallback_encoding, fetch_url # Pooled session, retry, conditional GET
         try:
-            resp = requests.get(url, timeout=30)
-            resp.raise_for_status()
+            content, meta, source = fetch_url(url, DEFAULT_CACHE_DIR)
+            if source == "not-modified":
+                print(f"{url} not modified; using the cached copy", file=sys.stderr)
             try:
-                return resp.content.decode(expected_encoding)
+                return content.decode(expected_encoding)
             except UnicodeDecodeError:
-                print(f"Warning: Could not decode HTTP content from {url} with {expected_encoding}. Falling back to requests' detected encoding.", file=sys.stderr)
-                return resp.text
+                print(f"Warning: Could not decode HTTP content from {url} with {expected_encoding}. Falling back to the encoding of its Content-Type.", file=sys.stderr)
+                return content.decode(fallback_encoding(meta), errors="replace")
         except requests.exceptions.RequestException as e:
             print(f"Error fetching URL {url}: {e}", file=sys.stderr)
             raise
@@ -161,147 +191,265 @@ def fetch_data(url: str, expected_encoding: str) -> str:
         raise ValueError(f"Unsupported URL scheme for {url}. Must be http, https, or file.")
 
 
-def load_and_parse_individual_csv_files(tables_dir: Path) -> pd.DataFrame:
+def parse_fund_bundles(yaml_text: str) -> Dict[str, List[str]]:
     """
-    Scans a directory for fund_tables_*.csv files, parses each, and concatenates them.
-    Skips leading blank lines to find the two '# ;' header lines.
+    Returns the fund name bundles {canonical name: [alias names]} from the bundles YAML: the
+    'fund_names' mapping, or else the first top-level mapping whose values are all lists.
+    Raises ValueError if there is none.
     """
-    all_dfs: List[pd.DataFrame] = []
-    csv_files = sorted(list(tables_dir.glob("fund_tables_*.csv")))
-
-    if not csv_files:
-        print(f"Warning: No CSV files found in {tables_dir} matching pattern 'fund_tables_*.csv'.", file=sys.stderr)
-        return pd.DataFrame()
+    fund_bundles_from_yaml = yaml.safe_load(yaml_text)
+    if not isinstance(fund_bundles_from_yaml, dict):
+        raise ValueError("YAML content did not parse into a dictionary.")
+
+    # Try to find the fund bundles within the YAML structure
+    temp_actual_fund_bundles: Dict[str, List[str]] | None = None
+    if 'fund_names' in fund_bundles_from_yaml and isinstance(fund_bundles_from_yaml['fund_names'], dict):
+        temp_actual_fund_bundles = fund_bundles_from_yaml['fund_names']
+        print("Info: Extracted bundles from 'fund_names' key in YAML.", file=sys.stderr)
+    else: # Fallback: iterate through top-level keys to find a suitable dictionary of bundles
+        for key, value in fund_bundles_from_yaml.items():
+            if isinstance(value, dict):
+                # Check if this dictionary looks like a bundle map (values are lists)
+                is_bundle_dict = all(isinstance(sub_value, list) for sub_value in value.values()) if value else False
+                if is_bundle_dict:
+                    print(f"Info: Using bundles from YAML key '{key}'.", file=sys.stderr)
+                    temp_actual_fund_bundles = value
+                    break # Found a suitable bundle map
+
+    if temp_actual_fund_bundles is None:
+        raise ValueError("Could not find fund name bundles in YAML. Check for 'fund_names' key or a top-level dictionary where values are lists of fund aliases.")
+    return temp_actual_fund_bundles
+
+
+def assemble_price_matrix(file_blocks: List[Tuple[pd.DatetimeIndex, List[str], np.ndarray]],
+                          value_dtype: Any = np.float64) -> pd.DataFrame:
+    """
+    Assembles per-file (dates, column names, numeric values) blocks into one DataFrame.
+    The union date index is computed once and a single value_dtype matrix is preallocated;
+    each block is then copied into its rows and columns. A column name seen in an earlier
+    block wins over later duplicates, as with concat followed by columns.duplicated(keep='first').
+    """
+    column_names: List[str] = []
+    column_positions: Dict[str, int] = {}
+    block_columns: List[Tuple[List[int], List[int]]] = [] # (source positions, destination positions) per block
+    for _, names, _ in file_blocks:
+        source_positions, destination_positions = [], []
+        for source_position, name in enumerate(names):
+            if name in column_positions:
+                continue # Duplicate of a column from an earlier file (or earlier in this file)
+            column_positions[name] = len(column_names)
+            column_names.append(name)
+            source_positions.append(source_position)
+            destination_positions.append(column_positions[name])
+        block_columns.append((source_positions, destination_positions))
+
+    union_dates = pd.DatetimeIndex(np.unique(np.concatenate([dates.values for dates, _, _ in file_blocks])), name="date")
+    matrix = np.full((len(union_dates), len(column_names)), np.nan, dtype=value_dtype)
+    for (dates, _, values), (source_positions, destination_positions) in zip(file_blocks, block_columns):
+        if not source_positions:
+            continue
+        row_positions = union_dates.get_indexer(dates)
+        matrix[np.ix_(row_positions, destination_positions)] = values[:, source_positions]
 
-    print(f"Found {len(csv_files)} CSV files to process in {tables_dir}.", file=sys.stderr)
+    return pd.DataFrame(matrix, index=union_dates, columns=column_names, copy=False)
 
-    for csv_file_path in csv_files:
-        print(f"Processing file: {csv_file_path.name}", file=sys.stderr)
-        lines_to_skip_for_pandas = 0
-        header_line1_text: str | None = None
-        header_line2_text: str | None = None
 
+def parse_table_block(table_name: str, table_bytes: bytes, since: str | None = None, until: str | None = None,
+                      parser: str = "pandas") -> Tuple[pd.DatetimeIndex, List[str], np.ndarray] | None:
+    """
+    Parses one fund table (raw bytes as yielded by fund_tables_io.iter_table_sources) into a
+    (dates, fund column names, float64 values) block for assemble_price_matrix, or None if it
+    holds no usable data. Skips leading blank lines to find the two '# ;' header lines.
+    Module-level so that --jobs can run it in worker processes.
+    """
+    print(f"Processing file: {table_name}", file=sys.stderr)
+    if parser == "streaming":
         try:
-            with csv_file_path.open('r', encoding=CSV_ENCODING) as f:
-                temp_lines_read_count = 0
-                for line_raw in f:
-                    temp_lines_read_count += 1
-                    line_stripped = line_raw.strip()
-                    if line_stripped:
-                        if line_stripped.startswith("# ;"):
-                            header_line1_text = line_stripped
-                        break
-                else:
-                    print(f"Warning: No non-blank lines or no first '# ;' header line found in {csv_file_path.name}. Skipping.", file=sys.stderr)
-                    continue
-
-                if header_line1_text is None:
-                     print(f"Warning: First non-blank line in {csv_file_path.name} is not a '# ;' header. Line: '{line_stripped}'. Skipping.", file=sys.stderr)
-                     continue
+            date_strs, column_names, values = parse_table_values(table_bytes, since, until, encoding=CSV_ENCODING)
+        except Exception as e:
+            print(f"Error processing file {table_name}: {e}. Skipping this file.", file=sys.stderr)
+            return None
+        dates = pd.to_datetime(pd.Index(date_strs), errors='coerce', format='%Y-%m-%d')
+        keep_rows = dates.notna() & ~dates.duplicated(keep='first')
+        if keep_rows.any() and column_names:
+            return dates[keep_rows], column_names, values[keep_rows]
+        return None
+
+    table_text = table_bytes.decode(CSV_ENCODING)
+    lines_to_skip_for_pandas = 0
+    header_line1_text: str | None = None
+    header_line2_text: str | None = None
 
-                header_line2_raw = f.readline()
+    try:
+        with StringIO(table_text) as f:
+            temp_lines_read_count = 0
+            for line_raw in f:
                 temp_lines_read_count += 1
-                if not header_line2_raw:
-                    print(f"Warning: File {csv_file_path.name} ended unexpectedly after the first potential header line. Skipping.", file=sys.stderr)
-                    continue
-                header_line2_text = header_line2_raw.strip()
-
-                lines_to_skip_for_pandas = temp_lines_read_count
-
-            if not (header_line1_text.startswith("# ;") and header_line2_text.startswith("# ;")):
-                print(f"Warning: File {csv_file_path.name} headers not as expected. H1: '{header_line1_text}', H2: '{header_line2_text}'. Skipping.", file=sys.stderr)
-                continue
-
-            actual_header_str = header_line2_text
-            column_names_from_header = [p.strip() for p in actual_header_str[3:].split(";") if p.strip()]
-
-            if not column_names_from_header:
-                print(f"Warning: No column names extracted from header in {csv_file_path.name}. Header was: '{actual_header_str}'. Skipping.", file=sys.stderr)
-                continue
+                line_stripped = line_raw.strip()
+                if line_stripped:
+                    if line_stripped.startswith("# ;"):
+                        header_line1_text = line_stripped
+                    break
+            else:
+                print(f"Warning: No non-blank lines or no first '# ;' header line found in {table_name}. Skipping.", file=sys.stderr)
+                return None
+
+            if header_line1_text is None:
+                 print(f"Warning: First non-blank line in {table_name} is not a '# ;' header. Line: '{line_stripped}'. Skipping.", file=sys.stderr)
+                 return None
+
+            header_line2_raw = f.readline()
+            temp_lines_read_count += 1
+            if not header_line2_raw:
+                print(f"Warning: File {table_name} ended unexpectedly after the first potential header line. Skipping.", file=sys.stderr)
+                return None
+            header_line2_text = header_line2_raw.strip()
+
+            lines_to_skip_for_pandas = temp_lines_read_count
+
+        if not (header_line1_text.startswith("# ;") and header_line2_text.startswith("# ;")):
+            print(f"Warning: File {table_name} headers not as expected. H1: '{header_line1_text}', H2: '{header_line2_text}'. Skipping.", file=sys.stderr)
+            return None
+
+        actual_header_str = header_line2_text
+        column_names_from_header = [p.strip() for p in actual_header_str[3:].split(";") if p.strip()]
+
+        if not column_names_from_header:
+            print(f"Warning: No column names extracted from header in {table_name}. Header was: '{actual_header_str}'. Skipping.", file=sys.stderr)
+            return None
+
+        if since or until:
+            table_text = "".join(filter_table_lines(StringIO(table_text), since, until))
+
+        df_raw_data = pd.read_csv(
+            StringIO(table_text),
+            sep=";",
+            header=None,
+            skiprows=lines_to_skip_for_pandas,
+            skip_blank_lines=True,
+            comment='#',
+            dtype=str # Read all as string initially to handle mixed types or formatting issues
+        )
 
-            df_raw_data = pd.read_csv(
-                csv_file_path,
-                sep=";",
-                header=None,
-                skiprows=lines_to_skip_for_pandas,
-                encoding=CSV_ENCODING,
-                skip_blank_lines=True,
-                comment='#',
-                dtype=str # Read all as string initially to handle mixed types or formatting issues
-            )
-
-            if df_raw_data.empty:
-                continue
+        if df_raw_data.empty:
+            return None
+
+        num_fund_cols_from_header = len(column_names_from_header)
+        expected_total_cols_in_data = 1 + num_fund_cols_from_header # Date + fund columns
+
+        # Adjust DataFrame shape if it doesn't match header expectations
+        if df_raw_data.shape[1] < expected_total_cols_in_data:
+            num_actual_fund_cols = df_raw_data.shape[1] - 1
+            if num_actual_fund_cols < 0 : # Only date column or less
+                print(f"Warning: File {table_name} has no data columns after date. Skipping.", file=sys.stderr)
+                return None
+            # Take only the available columns from header, plus date
+            current_column_names = ['date_str_temp'] + column_names_from_header[:num_actual_fund_cols]
+            # If there are still more data columns than named columns (e.g. malformed CSV)
+            # Slice df_raw_data to match the length of current_column_names
+            df_segment = df_raw_data.iloc[:, :len(current_column_names)].copy()
+            df_segment.columns = current_column_names
+        else: # df_raw_data.shape[1] >= expected_total_cols_in_data
+            # Take only the expected number of columns
+            df_segment = df_raw_data.iloc[:, :expected_total_cols_in_data].copy()
+            df_segment.columns = ['date_str_temp'] + column_names_from_header
+
+
+        df_segment['date'] = df_segment['date_str_temp'].str.strip()
+        df_segment["date"] = pd.to_datetime(df_segment["date"], errors='coerce', dayfirst=False, format='%Y-%m-%d') # Ensure correct date parsing
+        df_segment.drop(columns=['date_str_temp'], inplace=True)
+        df_segment.dropna(subset=["date"], inplace=True) # Remove rows where date parsing failed
+
+        if df_segment.empty: # If all rows had invalid dates
+            return None
+
+        # Convert data columns to numeric, coercing errors
+        for col in df_segment.columns:
+            if col != 'date': # Skip the date column, already datetime
+                if df_segment[col].dtype == 'object': # If it's still object type
+                    df_segment[col] = df_segment[col].str.replace(',', '.', regex=False) # Standardize decimal point
+                df_segment[col] = pd.to_numeric(df_segment[col], errors='coerce')
+
+        df_segment.set_index("date", inplace=True)
+        df_segment = df_segment[~df_segment.index.duplicated(keep='first')] # One row per date for positional copying
+
+        if not df_segment.columns.empty: # Check if there are any fund columns left
+            return df_segment.index, list(df_segment.columns), df_segment.to_numpy(dtype=np.float64)
+        return None
 
-            num_fund_cols_from_header = len(column_names_from_header)
-            expected_total_cols_in_data = 1 + num_fund_cols_from_header # Date + fund columns
-
-            # Adjust DataFrame shape if it doesn't match header expectations
-            if df_raw_data.shape[1] < expected_total_cols_in_data:
-                num_actual_fund_cols = df_raw_data.shape[1] - 1
-                if num_actual_fund_cols < 0 : # Only date column or less
-                    print(f"Warning: File {csv_file_path.name} has no data columns after date. Skipping.", file=sys.stderr)
-                    continue
-                # Take only the available columns from header, plus date
-                current_column_names = ['date_str_temp'] + column_names_from_header[:num_actual_fund_cols]
-                # If there are still more data columns than named columns (e.g. malformed CSV)
-                # Slice df_raw_data to match the length of current_column_names
-                df_segment = df_raw_data.iloc[:, :len(current_column_names)].copy()
-                df_segment.columns = current_column_names
-            else: # df_raw_data.shape[1] >= expected_total_cols_in_data
-                # Take only the expected number of columns
-                df_segment = df_raw_data.iloc[:, :expected_total_cols_in_data].copy()
-                df_segment.columns = ['date_str_temp'] + column_names_from_header
-
-
-            df_segment['date'] = df_segment['date_str_temp'].str.strip()
-            df_segment["date"] = pd.to_datetime(df_segment["date"], errors='coerce', dayfirst=False, format='%Y-%m-%d') # Ensure correct date parsing
-            df_segment.drop(columns=['date_str_temp'], inplace=True)
-            df_segment.dropna(subset=["date"], inplace=True) # Remove rows where date parsing failed
-
-            if df_segment.empty: # If all rows had invalid dates
-                continue
+    except Exception as e:
+        print(f"Error processing file {table_name}: {e}. Skipping this file.", file=sys.stderr)
+        return None
 
-            # Convert data columns to numeric, coercing errors
-            for col in df_segment.columns:
-                if col != 'date': # Skip the date column, already datetime
-                    if df_segment[col].dtype == 'object': # If it's still object type
-                        df_segment[col] = df_segment[col].str.replace(',', '.', regex=False) # Standardize decimal point
-                    df_segment[col] = pd.to_numeric(df_segment[col], errors='coerce')
 
-            df_segment.set_index("date", inplace=True)
+def load_and_parse_individual_csv_files(tables_path: Path, since: str | None = None, until: str | None = None,
+                                        value_dtype: Any = np.float64, parser: str = "pandas", jobs: int = 1) -> pd.DataFrame:
+    """
+    Parses every fund table in tables_path and assembles them into one DataFrame
+    (see assemble_price_matrix) holding value_dtype values.
+    tables_path is a directory of fund_tables_*.csv files, the fund_tables.zip archive or
+    fund_tables_concat.txt; archive members are read without extracting them.
+    If since/until (YYYY-MM-DD) are given, rows outside that range are dropped while the
+    table is read, before pandas parses or converts them.
+    parser="streaming" converts the cells directly to floats line by line
+    (fund_tables_io.parse_table_values) instead of reading every cell as a string with pandas.
+    jobs > 1 parses the tables in that many worker processes.
+    """
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        table_sources = list(iter_table_sources(tables_path))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed_blocks = list(pool.map(parse_table_block,
+                                          [name for name, _ in table_sources], [content for _, content in table_sources],
+                                          repeat(since), repeat(until), repeat(parser)))
+    else:
+        parsed_blocks = [parse_table_block(name, content, since, until, parser)
+                         for name, content in iter_table_sources(tables_path)]
 
-            if not df_segment.columns.empty: # Check if there are any fund columns left
-                all_dfs.append(df_segment)
+    if not parsed_blocks:
+        print(f"Warning: No fund tables found in {tables_path} (expected files matching 'fund_tables_*.csv').", file=sys.stderr)
+        return pd.DataFrame()
 
-        except Exception as e:
-            print(f"Error processing file {csv_file_path.name}: {e}. Skipping this file.", file=sys.stderr)
-            continue
+    file_blocks = [block for block in parsed_blocks if block is not None]
 
-    if not all_dfs:
+    if not file_blocks:
         print("Warning: No dataframes were successfully parsed from any CSV file.", file=sys.stderr)
         return pd.DataFrame()
 
-    # Concatenate all dataframes. 'outer' join handles different date ranges.
-    full_df = pd.concat(all_dfs, axis=1, join='outer').sort_index()
-
-    # Ensure all data columns are numeric after concat (in case some were missed or became object)
-    for col in full_df.columns:
-        if full_df[col].dtype == 'object':
-            full_df[col] = full_df[col].str.replace(',', '.', regex=False)
-        full_df[col] = pd.to_numeric(full_df[col], errors='coerce')
-
-    # Remove duplicate columns that might arise from overlapping CSV files, keeping the first occurrence
-    full_df = full_df.loc[:,~full_df.columns.duplicated(keep='first')]
+    # Union of all dates, one preallocated matrix; duplicate fund columns keep their first occurrence
+    full_df = assemble_price_matrix(file_blocks, value_dtype=value_dtype)
 
     if not full_df.empty:
-        print(f"Successfully concatenated data from {len(all_dfs)} CSV files into a DataFrame of shape {full_df.shape}.", file=sys.stderr)
+        print(f"Successfully assembled data from {len(file_blocks)} CSV files into a DataFrame of shape {full_df.shape}.", file=sys.stderr)
     else:
-        print(f"Warning: Concatenated DataFrame is empty, though {len(all_dfs)} individual DataFrames were processed (they might have been empty or incompatible).", file=sys.stderr)
+        print(f"Warning: Assembled DataFrame is empty, though {len(file_blocks)} individual DataFrames were processed (they might have been empty or incompatible).", file=sys.stderr)
 
     return full_df
 
 
+def load_fund_columns_via_index(tables_dir: Path, column_names: List[str], since: str | None = None, until: str | None = None) -> pd.DataFrame:
+    """
+    Loads only the given table columns using the fund table index (see fund_tables_io.py),
+    returning a DataFrame shaped like load_and_parse_individual_csv_files' result.
+    Names must be table column names; YAML aliases are resolved by the caller.
+    """
+    index = load_table_index(tables_dir, encoding=CSV_ENCODING)
+    known_columns = [name for name in column_names if name in index["funds"]]
+    if not known_columns:
+        print("Warning: None of the requested fund columns are present in the fund tables.", file=sys.stderr)
+        return pd.DataFrame()
+
+    tables_read = sorted({index["funds"][name]["table"] for name in known_columns})
+    print(f"Reading {len(known_columns)} fund columns from {len(tables_read)} table(s) via index: {', '.join(tables_read)}", file=sys.stderr)
+    date_strs, columns = read_fund_columns(tables_dir, index, known_columns, since=since, until=until)
+    if not date_strs:
+        return pd.DataFrame()
+
+    prices_df = pd.DataFrame(columns, index=pd.to_datetime(date_strs, errors='coerce', format='%Y-%m-%d'))
+    prices_df.index.name = "date"
+    return prices_df[prices_df.index.notna()].sort_index()
+
+
 def bundle_funds(prices_df: pd.DataFrame, fund_bundles_map: Dict[str, List[str]]) -> pd.DataFrame:
     """Collapse alias fund columns into canonical fund columns using fund_bundles_map."""
     if prices_df.empty:
@@ -332,12 +480,29 @@ def bundle_funds(prices_df: pd.DataFrame, fund_bundles_map: Dict[str, List[str]]
     return result_df.sort_index() # Sort by date index
 
 
-def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def compute_momentum_tables(log_prices: pd.DataFrame,
+                            all_dates_anchors: Dict[str, Tuple[str, float]] | None = None,
+                            expect_normalized_latest: bool = True,
+                            top_k: int = DEFAULT_TOP_K,
+                            as_of: str | None = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
-    Computes momentum tables and returns top-20s and the full performance DataFrame.
+    Computes momentum tables and returns the top-'top_k' tables (default 20) and the full performance DataFrame.
     Input 'log_prices' DataFrame contains log10 of normalized prices for each fund.
-    Adds 'Rank' column to top-20 tables.
+    Adds 'Rank' column to the top tables.
+    'all_dates_anchors' maps a fund to its (first date, first log value) over the whole history
+    (see fund_tables_io.first_values_for_bundles); it is used for the "All Dates" return when
+    log_prices was loaded with --since and starts later than the fund's history.
+    Set 'expect_normalized_latest' to False when log_prices was cut with --until, so the latest
+    loaded value is not expected to be 0.
+    'as_of' (YYYY-MM-DD) computes everything as it stood on that date: only rows dated on or before it
+    are used, so each fund's returns end at its last value up to 'as_of'. Returns are log differences,
+    which do not depend on the date the tables were normalized to, so the loaded matrix is filtered
+    in memory instead of the tables being sliced again.
     """
+    if as_of is not None:
+        if not log_prices.empty and isinstance(log_prices.index, pd.DatetimeIndex):
+            log_prices = log_prices.loc[log_prices.index <= pd.Timestamp(as_of)]
+        expect_normalized_latest = False # The latest value up to as_of is generally not 0
     empty_perf_df = pd.DataFrame(index=log_prices.index if not log_prices.empty else None)
     empty_top_df = pd.DataFrame(columns=DISPLAY_COLUMNS) # For returning empty tables with correct columns
 
@@ -362,7 +527,7 @@ def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.
             continue
 
         # Check if the latest log value is indeed close to 0 (as expected for normalized prices)
-        if abs(l_current) > 1e-6: # A small tolerance for floating point inaccuracies
+        if expect_normalized_latest and abs(l_current) > 1e-6: # A small tolerance for floating point inaccuracies
              print(f"Warning: For fund {fund_name}, latest log value {l_current:.4f} (after potential clipping) is not close to 0. "
                    "This might affect return calculations if normalization assumption is incorrect.", file=sys.stderr)
 
@@ -374,6 +539,10 @@ def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.
         if not fund_series.empty: # Redundant check, but safe
             fund_earliest_date = fund_series.index.min()
             l_earliest_past = fund_series.get(fund_earliest_date) # log10(Price_earliest / Price_latest_normalized_to_1)
+            if all_dates_anchors and fund_name in all_dates_anchors:
+                anchor_date_str, anchor_value = all_dates_anchors[fund_name]
+                if pd.Timestamp(anchor_date_str) < fund_earliest_date: # History starts before the loaded range
+                    l_earliest_past = min(max(anchor_value, LOG_VALUE_CLIP_MIN), LOG_VALUE_CLIP_MAX)
 
             if not pd.isna(l_earliest_past) and not pd.isna(l_current):
                 # log_difference = log(P_curr/P_latest_norm) - log(P_past/P_latest_norm) = log(P_curr/P_past)
@@ -452,7 +621,7 @@ def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.
                 penalty_2m = loss_beyond_threshold_2m * valid_all_dates_for_penalty_2m.abs() * LONG_TERM_AD_2M_PENALTY_FACTOR
                 perf_df.loc[significant_2m_loss_mask, 'LongTermAdjustedPerf'] -= penalty_2m
 
-        long_term_top = perf_df.sort_values("LongTermAdjustedPerf", ascending=False).head(20).reset_index()
+        long_term_top = top_k_rows(perf_df, "LongTermAdjustedPerf", top_k).reset_index()
         if not long_term_top.empty:
             long_term_top.insert(0, 'Rank', range(1, len(long_term_top) + 1))
     else:
@@ -494,7 +663,7 @@ def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.
     if "LagAdjScore" not in perf_df.columns and not perf_df.empty: # Fallback if somehow not created
         perf_df["LagAdjScore"] = np.nan
 
-    lag_adj_top = perf_df.sort_values("LagAdjScore", ascending=False).head(20).reset_index()
+    lag_adj_top = top_k_rows(perf_df, "LagAdjScore", top_k).reset_index()
     if not lag_adj_top.empty:
         lag_adj_top.insert(0, 'Rank', range(1, len(lag_adj_top) + 1))
     elif perf_df.empty: # If perf_df was empty to begin with
@@ -508,6 +677,142 @@ def compute_momentum_tables(log_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.
     return long_term_top, lag_adj_top, perf_df.reset_index()
 
 
+def weight_profile_scores(perf_df: pd.DataFrame, lag_profiles: Dict[str, Dict[str, float]],
+                          long_term_profiles: Dict[str, Dict[str, float]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Scores every fund under all weight profiles at once (see fund_weight_profiles.py). 'perf_df' has one
+    row per fund with the lookback returns, as the full performance DataFrame of compute_momentum_tables.
+    Lag-adjusted scores are one matrix product Z @ W: Z holds the fund x lookback z-scores computed as for
+    LagAdjScore (NaN counted as 0) and W the lookback x profile weights. Long-term scores apply each
+    parameter set's penalties as for LongTermAdjustedPerf, broadcast over a fund x parameter-set matrix.
+    Returns (lag-adjusted scores, long-term scores) as fund x profile name DataFrames. A profile without
+    any lookback present in 'perf_df' scores NaN, as LagAdjScore does.
+    """
+    perf = perf_df.set_index("Fund") if "Fund" in perf_df.columns else perf_df
+    unknown_periods = sorted({period for weights in lag_profiles.values() for period in weights} - set(LOOKBACKS_BD))
+    if unknown_periods:
+        raise ValueError(f"Unknown lookback(s) {unknown_periods} in lag_adjusted profiles; known: {', '.join(LOOKBACKS_BD)}")
+
+    periods = [period for period in LOOKBACKS_BD if any(period in weights for weights in lag_profiles.values())]
+    z_matrix = np.zeros((len(perf), len(periods)))
+    for j, period in enumerate(periods):
+        if period not in perf.columns:
+            continue
+        period_returns = perf[period].to_numpy(dtype=float)
+        valid_returns = period_returns[~np.isnan(period_returns)]
+        if len(valid_returns) >= 2 and valid_returns.std() != 0: # Otherwise the z-scores are 0 or NaN, both counted as 0
+            z_matrix[:, j] = np.nan_to_num((period_returns - valid_returns.mean()) / valid_returns.std())
+    weight_matrix = np.array([[weights.get(period, 0.0) for weights in lag_profiles.values()] for period in periods]).reshape(len(periods), len(lag_profiles))
+    lag_scores = z_matrix @ weight_matrix
+    scored = np.array([any(period in perf.columns for period in weights) for weights in lag_profiles.values()], dtype=bool)
+    lag_scores[:, ~scored] = np.nan
+
+    parameters = {key: np.array([profile[key] for profile in long_term_profiles.values()], dtype=float) for key in LONG_TERM_PARAMETERS}
+    long_term_scores = np.full((len(perf), len(long_term_profiles)), np.nan)
+    if ALL_DATES_KEY in perf.columns:
+        all_dates_returns = perf[ALL_DATES_KEY].to_numpy(dtype=float)[:, None]
+        penalty_scale = np.abs(np.nan_to_num(all_dates_returns)) # Penalties scale with |All Dates| (0 if NaN)
+        long_term_scores = np.where(np.isnan(all_dates_returns), -np.inf, all_dates_returns) + np.zeros((1, len(long_term_profiles)))
+        for period, threshold, factor in ((ONE_YEAR_LOOKBACK_KEY, parameters["threshold_1y"], parameters["penalty_factor_1y"]),
+                                          (TWO_MONTH_LOOKBACK_KEY, parameters["threshold_2m"], parameters["penalty_factor_2m"])):
+            if period in perf.columns:
+                period_returns = perf[period].to_numpy(dtype=float)[:, None]
+                below_threshold = period_returns < threshold # False for NaN returns
+                long_term_scores -= np.where(below_threshold, (threshold - period_returns) * penalty_scale * factor, 0.0)
+
+    return (pd.DataFrame(lag_scores, index=perf.index, columns=list(lag_profiles)),
+            pd.DataFrame(long_term_scores, index=perf.index, columns=list(long_term_profiles)))
+
+
+def rank_weight_profiles(perf_df: pd.DataFrame, profiles: Dict[str, Dict[str, Any]], top_k: int = DEFAULT_TOP_K) -> List[Tuple[str, pd.DataFrame]]:
+    """
+    Top-'top_k' table with 'Rank' for every long-term and lag-adjusted profile in 'profiles' (as returned by
+    fund_weight_profiles.parse_weight_profiles), scored in one pass by weight_profile_scores.
+    Returns [(heading, table)], long-term profiles first, each section in file order.
+    """
+    if perf_df.empty or "Fund" not in perf_df.columns:
+        return []
+    lag_scores, long_term_scores = weight_profile_scores(perf_df, profiles["lag_adjusted"], profiles["long_term"])
+    perf = perf_df.set_index("Fund")
+    rankings: List[Tuple[str, pd.DataFrame]] = []
+    for assessment, scores in (("Best Long-Term Growth Assessment", long_term_scores), ("Best Lag-Adjusted Short-Term Assessment", lag_scores)):
+        for profile_name in scores.columns:
+            ranked = perf.iloc[top_k_positions(scores[profile_name].to_numpy(), top_k)].reset_index()
+            ranked.insert(0, 'Rank', range(1, len(ranked) + 1))
+            rankings.append((f"{assessment} (Top {top_k}), profile '{profile_name}'", ranked))
+    return rankings
+
+
+def add_rank_columns(perf_df: pd.DataFrame) -> pd.DataFrame:
+    """Adds each fund's rank in both assessments (fund_score_store.RANK_COLUMNS), in the order of the ranking tables."""
+    perf_df = perf_df.copy()
+    for score_column, rank_column in RANK_COLUMNS.items():
+        perf_df[rank_column] = rank_values(perf_df[score_column].to_numpy(dtype=np.float64, na_value=np.nan))
+    return perf_df
+
+
+def rank_changes(perf_df: pd.DataFrame, previous_df: pd.DataFrame, score_column: str, top_k: int = DEFAULT_TOP_K) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Moves of the top-'top_k' funds of 'score_column' since a stored run. 'perf_df' has the rank columns
+    (add_rank_columns); 'previous_df' is the stored run indexed by fund (fund_score_store.load_run).
+    Returns (changes, exits):
+      changes  the current top 'top_k': Rank, Fund, Prev Rank, Rank Change (places gained), New (not in the
+               previous top 'top_k'), Score, Score Change
+      exits    funds in the previous top 'top_k' but not in the current one: Fund, Prev Rank, Rank (NaN if the
+               fund is no longer ranked)
+    """
+    rank_column = RANK_COLUMNS[score_column]
+    current = perf_df.set_index("Fund")
+    top = current[current[rank_column] <= top_k].sort_values(rank_column)
+    previous = previous_df.reindex(top.index) # Funds missing from the stored run get NaN
+    changes = pd.DataFrame({
+        "Rank": top[rank_column],
+        "Prev Rank": previous[rank_column],
+        "Rank Change": previous[rank_column] - top[rank_column],
+        "New": ~(previous[rank_column] <= top_k),
+        "Score": top[score_column],
+        "Score Change": top[score_column] - previous[score_column],
+    }).rename_axis("Fund").reset_index()
+    changes = changes[["Rank", "Fund", "Prev Rank", "Rank Change", "New", "Score", "Score Change"]]
+
+    previous_top = previous_df[previous_df[rank_column] <= top_k].sort_values(rank_column)
+    exited = previous_top.index[~previous_top.index.isin(top.index)]
+    exits = pd.DataFrame({"Fund": exited, "Prev Rank": previous_top.loc[exited, rank_column].to_numpy(),
+                          "Rank": current[rank_column].reindex(exited).to_numpy()})
+    return changes, exits
+
+
+def format_rank_changes(changes: pd.DataFrame, score_column: str) -> pd.DataFrame:
+    """rank_changes() moves as display strings: LongTermAdjustedPerf as a percentage, LagAdjScore as a z-score sum."""
+    percent = score_column == "LongTermAdjustedPerf"
+
+    def rank(x):
+        return f"{int(x)}" if pd.notnull(x) else "N/A"
+
+    def score(x, sign=""):
+        if pd.isnull(x) or np.isinf(x):
+            return "N/A"
+        return f"{x * 100:{sign},.1f}%" if percent else f"{x:{sign}.2f}"
+
+    return pd.DataFrame({
+        "Rank": changes["Rank"].map(rank),
+        "Fund": changes["Fund"],
+        "Prev Rank": changes["Prev Rank"].map(rank),
+        "Change": [("new" if new else f"{int(delta):+d}" if delta else "0") for delta, new in zip(changes["Rank Change"], changes["New"])],
+        "Score": changes["Score"].map(score),
+        "Score Change": changes["Score Change"].map(lambda x: score(x, "+")),
+    })
+
+
+def rank_exits_text(exits: pd.DataFrame, top_k: int) -> str:
+    """One line naming the funds that left the top 'top_k' with their previous and current rank."""
+    if exits.empty:
+        return f"Left the top {top_k}: none."
+    entries = [f"{fund} (was {int(prev_rank)}, now {int(rank) if pd.notnull(rank) else 'unranked'})"
+               for fund, prev_rank, rank in zip(exits["Fund"], exits["Prev Rank"], exits["Rank"])]
+    return f"Left the top {top_k}: " + "; ".join(entries) + "."
+
+
 def format_df_for_display(df: pd.DataFrame) -> pd.DataFrame:
     """Prepares a DataFrame for display: selects columns, reorders, and formats percentages."""
     if df.empty:
@@ -556,6 +861,7 @@ def df_to_markdown_table(df: pd.DataFrame) -> str:
                     lambda x: f"{int(x)}" if pd.notnull(x) and isinstance(x, (int, float)) and not np.isinf(x) and not np.isnan(x) else "N/A"
                 )
             # "Fund" column requires no special formatting here, tabulate handles strings.
+    from tabulate import tabulate
     return tabulate(
         formatted_df, headers="keys", tablefmt="pipe",
         showindex=False, stralign="left", numalign="right"
@@ -622,9 +928,14 @@ def df_to_html_table_styled(df: pd.DataFrame, table_id: str | None = None) -> st
             escape=True # Escape HTML characters in data
         )
 
+    return f"<div class='table-wrapper'>{table_html}{table_copy_button(table_id)}</div>"
+
+
+def table_copy_button(table_id: str | None) -> str:
+    """The "Copy CSV" button (and its feedback span) for the HTML table with id 'table_id'."""
     feedback_id = f"feedback-{table_id}" if table_id else f"feedback-unknown-{np.random.randint(1000)}"
     button_table_id = table_id if table_id else "" # Ensure table_id is not None for JS
-    copy_button_html = f"""
+    return f"""
     <div class="copy-button-container">
       <button onclick="copyTableAsCsv('{button_table_id}', '{feedback_id}')" title="Copy table data as CSV">
         <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-clipboard" viewBox="0 0 16 16">
@@ -635,7 +946,6 @@ def df_to_html_table_styled(df: pd.DataFrame, table_id: str | None = None) -> st
       <span id="{feedback_id}" class="copy-feedback"></span>
     </div>
     """
-    return f"<div class='table-wrapper'>{table_html}{copy_button_html}</div>"
 
 
 def send_email(subject: str, html_body: str, text_body: str) -> None:
@@ -668,6 +978,7 @@ def send_email(subject: str, html_body: str, text_body: str) -> None:
     msg.set_content(text_body) # Plain text part
     msg.add_alternative(html_body, subtype="html") # HTML part
 
+    import smtplib, ssl
     try:
         context = ssl.create_default_context() # For TLS
         with smtplib.SMTP(smtp_host, smtp_port) as server:
@@ -682,6 +993,122 @@ def send_email(subject: str, html_body: str, text_body: str) -> None:
     except Exception as e: # Catch any other exceptions
         print(f"Unexpected email error (if send_email was called directly): {e}", file=sys.stderr)
 
+
+def load_and_rank_funds(args: argparse.Namespace, actual_fund_bundles: Dict[str, List[str]], requested_fund_names: List[str],
+                         profiler: StageProfiler) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame | None]:
+    """
+    Loads the fund tables selected by the command-line options, bundles them and computes the momentum
+    tables (the csv_load, bundle and momentum stages). Returns (long_term_top_df, lag_adj_top_df, full_perf_df,
+    bundled prices up to --as-of for --export-dir, else None).
+    """
+    raw_prices_df = pd.DataFrame()
+    processed_prices_df = pd.DataFrame()
+
+    profiler.start("csv_load")
+    tables_use_index = args.tables.is_dir() # The fund table index only covers a directory of tables
+    if args.compare_only:
+        # Only the requested bundles matter; collect their alias columns
+        actual_fund_bundles = {name: actual_fund_bundles[name] for name in requested_fund_names if name in actual_fund_bundles}
+        alias_columns = list(dict.fromkeys(alias for aliases in actual_fund_bundles.values() for alias in aliases))
+    if args.compare_only and tables_use_index:
+        print("Loading comparison fund columns via the fund table index...", file=sys.stderr)
+        try:
+            raw_prices_df = load_fund_columns_via_index(args.tables, alias_columns, since=args.since, until=args.until)
+        except Exception as e:
+            print(f"Error during indexed loading of comparison funds: {e}. Report will show limited/no data.", file=sys.stderr)
+            raw_prices_df = pd.DataFrame()
+    else:
+        print(f"Loading and parsing fund tables from {args.tables}...", file=sys.stderr)
+        try:
+            raw_prices_df = load_and_parse_individual_csv_files(args.tables, since=args.since, until=args.until,
+                                                                value_dtype=np.float32 if args.float32 else np.float64,
+                                                                parser=args.parser, jobs=args.jobs)
+            if args.compare_only: # Tables not in a directory: no index, so keep just the comparison columns
+                raw_prices_df = raw_prices_df[[col for col in alias_columns if col in raw_prices_df.columns]]
+            if raw_prices_df.empty:
+                # This is a warning, script can proceed but tables will likely be empty.
+                print("Warning: Parsed raw prices DataFrame is empty after processing all CSVs.", file=sys.stderr)
+        except Exception as e:
+            print(f"Error during loading/parsing of CSV files: {e}. Report will show limited/no data.", file=sys.stderr)
+            raw_prices_df = pd.DataFrame() # Ensure it's an empty DataFrame on error
+    profiler.stop("csv_load")
+
+
+    print("Bundling fund columns...", file=sys.stderr)
+    profiler.start("bundle")
+    try:
+        processed_prices_df = bundle_funds(raw_prices_df, actual_fund_bundles)
+        if processed_prices_df.empty and not raw_prices_df.empty and actual_fund_bundles :
+             print("Warning: Prices DataFrame is empty after bundling funds. This might be due to no matching fund names between CSVs and YAML.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error during fund bundling: {e}. Proceeding with unbundled or empty data for report.", file=sys.stderr)
+        # Fallback to raw_prices_df if bundling fails, or empty if raw_prices_df is also problematic
+        processed_prices_df = raw_prices_df if raw_prices_df is not None else pd.DataFrame()
+    profiler.stop("bundle")
+
+
+    print("Computing momentum tables...", file=sys.stderr)
+    profiler.start("momentum")
+    # Initialize with empty DataFrames having correct columns for graceful failure
+    empty_display_df = pd.DataFrame(columns=DISPLAY_COLUMNS)
+    long_term_top_df = empty_display_df.copy()
+    lag_adj_top_df = empty_display_df.copy()
+    full_perf_df = pd.DataFrame(columns=DISPLAY_COLUMNS + ['LongTermAdjustedPerf', 'LagAdjScore']) # Include score cols
+
+    all_dates_anchors: Dict[str, Tuple[str, float]] | None = None
+    if args.since and not tables_use_index:
+        print(f"Warning: The fund table index needs a tables directory; 'All Dates' will start at {args.since}.", file=sys.stderr)
+    elif args.since:
+        try:
+            all_dates_anchors = first_values_for_bundles(load_table_index(args.tables, encoding=CSV_ENCODING), actual_fund_bundles)
+        except Exception as e:
+            print(f"Warning: Could not read first values from the fund table index: {e}. 'All Dates' will start at {args.since}.", file=sys.stderr)
+
+    try:
+        long_term_top_df, lag_adj_top_df, full_perf_df = compute_momentum_tables(
+            processed_prices_df, all_dates_anchors=all_dates_anchors, expect_normalized_latest=args.until is None, top_k=args.top_k,
+            as_of=args.as_of)
+    except Exception as e:
+        print(f"Error computing momentum tables: {e}. Report will show no data for tables.", file=sys.stderr)
+        # Already initialized to empty display DFs
+    profiler.stop("momentum")
+
+    if args.score_store and "Fund" in full_perf_df.columns:
+        print("Computing bar scores for the score history...", file=sys.stderr)
+        profiler.start("bar_scores")
+        try:
+            bar_prices = processed_prices_df
+            if args.as_of:
+                bar_prices = bar_prices.loc[bar_prices.index <= pd.Timestamp(args.as_of)]
+            full_perf_df = full_perf_df.join(bar_score_columns(bar_prices), on="Fund")
+        except Exception as e:
+            print(f"Warning: Could not compute bar scores: {e}. The score history gets NaN for them.", file=sys.stderr)
+            full_perf_df = full_perf_df.assign(**{column: np.nan for column in BAR_SCORE_COLUMNS})
+        profiler.stop("bar_scores")
+
+    export_prices_df = None
+    if args.export_dir:
+        export_prices_df = processed_prices_df
+        if args.as_of and not export_prices_df.empty:
+            export_prices_df = export_prices_df.loc[export_prices_df.index <= pd.Timestamp(args.as_of)]
+    return long_term_top_df, lag_adj_top_df, full_perf_df, export_prices_df
+
+
+def ranking_cache_key(args: argparse.Namespace, yaml_text: str, requested_fund_names: List[str]) -> str:
+    """
+    Output cache key of the ranked tables: the table bytes, the bundle YAML, the options that change
+    the loaded prices and the code version. --compare only selects rows at render time unless --compare-only.
+    """
+    return cache_key({
+        "tables": table_source_digest(args.tables),
+        "yaml": text_digest(yaml_text),
+        "options": {"since": args.since, "until": args.until, "parser": args.parser, "float32": args.float32, "top_k": args.top_k, "as_of": args.as_of,
+                    "bar_scores": bool(args.score_store), "export_prices": bool(args.export_dir),
+                    "compare_only": requested_fund_names if args.compare_only else None},
+        "code": code_version(),
+    })
+
+
 # ------------------- Main Execution --------------------------------------- #
 
 def main() -> None:
@@ -704,102 +1131,276 @@ def main() -> None:
         help="A comma-separated list of fund names to include for comparison.\n"
              "Example: --compare \"'Fund A, Inc.'\",\"Fund B\",'Fund C'\""
     )
+    parser.add_argument(
+        "--compare-only",
+        action="store_true",
+        help="Only report the --compare funds. Their columns are located with the fund table\n"
+             "index (tables/fund_tables_index.json) and read without parsing the other tables."
+    )
+    parser.add_argument(
+        "--since",
+        type=iso_date_arg,
+        default=None,
+        help="Only load table rows dated on or after this YYYY-MM-DD date. Rows outside the range\n"
+             "are skipped while reading. All lookbacks except 'All Dates' need at most 252\n"
+             "business days; 'All Dates' is anchored on each fund's first value from the\n"
+             "fund table index, so it still covers the full history."
+    )
+    parser.add_argument(
+        "--until",
+        type=iso_date_arg,
+        default=None,
+        help="Only load table rows dated on or before this YYYY-MM-DD date."
+    )
+    parser.add_argument(
+        "--as-of",
+        type=iso_date_arg,
+        default=None,
+        help="Compute every lookback return and both assessments as of this YYYY-MM-DD date, as\n"
+             "the report would have shown them then. The tables are loaded as usual and only the\n"
+             "rows up to this date are used; the report is dated with it."
+    )
+    parser.add_argument(
+        "--parser",
+        choices=["pandas", "streaming"],
+        default="pandas",
+        help="How the fund tables are parsed. 'pandas' reads every cell as a string and then\n"
+             "converts it. 'streaming' converts cells directly to floats line by line, which\n"
+             "keeps peak memory close to the size of the final price matrix."
+    )
+    parser.add_argument(
+        "--float32",
+        action="store_true",
+        help="Hold the loaded price matrix as float32 instead of float64. Halves its memory;\n"
+             "reported returns may differ in the last decimal."
+    )
+    parser.add_argument(
+        "--tables",
+        type=Path,
+        default=DEFAULT_TABLES_DIR,
+        help="Where to read the fund tables from: a directory of fund_tables_<n>.csv files,\n"
+             "the fund_tables.zip archive or fund_tables_concat.txt (read without extracting).\n"
+             f"Default: {DEFAULT_TABLES_DIR}"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse the fund tables (default: 1)."
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        default=None,
+        help="Write a JSON profile with wall time, CPU time and tracemalloc peak for each stage\n"
+             "(yaml_fetch, yaml_parse, cache_lookup, csv_load, bundle, momentum, bar_scores,\n"
+             "rank_changes, score_store, export, render) to FILE.\n"
+             "tracemalloc slows the run down, so compare profiles only with each other."
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=DEFAULT_TOP_K,
+        metavar="K",
+        help=f"Number of funds in each ranking table (default: {DEFAULT_TOP_K}). The K best funds are\n"
+             "selected without sorting all of them; ties keep the fund order of the tables."
+    )
+    parser.add_argument(
+        "--weight-profiles",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_WEIGHT_PROFILES_FILE,
+        default=None,
+        metavar="FILE",
+        help="Also rank the funds under every long-term and lag-adjusted profile in the weight\n"
+             "profile YAML FILE (default without FILE: bin/weight_profiles.yaml), scored in one\n"
+             "pass, and add one Top K table per profile to the report. Not with --compare-only."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Content-addressed output cache. The ranked tables are stored under DIR keyed by a\n"
+             "hash of the table bytes, the bundle YAML, the options and the code version; a run\n"
+             "with the same key skips loading and ranking and only renders the report (whose\n"
+             "dates stay current). Cache hits and misses are reported on STDERR."
+    )
+    parser.add_argument(
+        "--score-store",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Append this run's result row of every fund (all lookback returns, both assessments\n"
+             "and the --bar dashboard score and gradient) to the score history in DIR, keyed by\n"
+             "the run date (see fund_score_store.py). A second run on the same date replaces it.\n"
+             "Not with --compare-only."
+    )
+    parser.add_argument(
+        "--export-dir",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Also write the full per-fund performance frame and the bundled price matrix with typed\n"
+             "columns to DIR as performance.<ext> and prices.<ext> (see fund_arrow_export.py).\n"
+             "Needs pyarrow."
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=list(EXPORT_FORMATS),
+        default="arrow",
+        help="Format of --export-dir: 'arrow' (uncompressed Arrow IPC files, memory-mappable) or\n"
+             "'parquet' (default: arrow)."
+    )
+    parser.add_argument(
+        "--rank-changes",
+        action="store_true",
+        help="Show how each top-K fund moved since the previous run in the --score-store history\n"
+             "(new entries, funds that left, rank and score changes), read from the stored run."
+    )
     args = parser.parse_args()
+    if args.compare_only and not args.compare:
+        parser.error("--compare-only requires --compare")
+    if args.since and args.until and args.since > args.until:
+        parser.error("--since must not be later than --until")
+    if args.as_of and args.since and args.as_of < args.since:
+        parser.error("--as-of must not be earlier than --since")
+    if args.as_of and args.until and args.as_of > args.until:
+        parser.error("--as-of must not be later than --until")
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    if args.weight_profiles and args.compare_only:
+        parser.error("--weight-profiles cannot be used with --compare-only")
+    if args.score_store and args.compare_only:
+        parser.error("--score-store cannot be used with --compare-only")
+    if args.rank_changes and not args.score_store:
+        parser.error("--rank-changes requires --score-store")
+    if args.export_dir:
+        try:
+            require_pyarrow()
+        except ImportError as e:
+            parser.error(str(e))
+    weight_profiles: Dict[str, Dict[str, Any]] | None = None
+    if args.weight_profiles:
+        try:
+            weight_profiles = load_weight_profiles(args.weight_profiles)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            parser.error(f"Cannot read weight profiles from {args.weight_profiles}: {e}")
+        unknown_periods = sorted({period for weights in weight_profiles["lag_adjusted"].values() for period in weights} - set(LOOKBACKS_BD))
+        if unknown_periods:
+            parser.error(f"Unknown lookback(s) {unknown_periods} in {args.weight_profiles}; known: {', '.join(LOOKBACKS_BD)}")
 
     script_start_time = datetime.now()
     print(f"Script execution started at {script_start_time.strftime('%Y-%m-%d %H:%M:%S UTC')}", file=sys.stderr)
-    print(f"Scanning for CSV files in: {DEFAULT_TABLES_DIR}", file=sys.stderr)
+    print(f"Scanning for CSV files in: {args.tables}", file=sys.stderr)
     print(f"Using YAML bundle source: {YAML_URL}", file=sys.stderr)
 
 
-    current_date_utc_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    current_date_utc_str = args.as_of or datetime.now(timezone.utc).strftime("%Y-%m-%d")
     email_subject_prefix = os.getenv("SUBJECT_PREFIX", "Daily Fund Momentum Rankings")
     final_email_subject = f"{email_subject_prefix} - {current_date_utc_str}"
 
-    # Initialize DataFrames
-    raw_prices_df = pd.DataFrame()
-    processed_prices_df = pd.DataFrame()
+    # Initialize fund bundles
     actual_fund_bundles: Dict[str, List[str]] = {}
 
+    profiler = StageProfiler("fund_momentum_emailer", enabled=bool(args.profile))
+
     print("Fetching YAML bundle data...", file=sys.stderr)
+    profiler.start("yaml_fetch")
     try:
         fund_name_bundles_yaml_txt = fetch_data(YAML_URL, expected_encoding=YAML_ENCODING)
     except Exception as e:
         print(f"Critical error: Failed to fetch YAML bundle data: {e}. Cannot proceed without fund names.", file=sys.stderr)
         sys.exit(1) # Exit if YAML fetching fails
+    profiler.stop("yaml_fetch")
 
     print("Parsing fund name bundles from YAML...", file=sys.stderr)
+    profiler.start("yaml_parse")
     try:
-        fund_bundles_from_yaml = yaml.safe_load(fund_name_bundles_yaml_txt)
-        if not isinstance(fund_bundles_from_yaml, dict):
-            raise ValueError("YAML content did not parse into a dictionary.")
-
-        # Try to find the fund bundles within the YAML structure
-        temp_actual_fund_bundles: Dict[str, List[str]] | None = None
-        if 'fund_names' in fund_bundles_from_yaml and isinstance(fund_bundles_from_yaml['fund_names'], dict):
-            temp_actual_fund_bundles = fund_bundles_from_yaml['fund_names']
-            print("Info: Extracted bundles from 'fund_names' key in YAML.", file=sys.stderr)
-        else: # Fallback: iterate through top-level keys to find a suitable dictionary of bundles
-            for key, value in fund_bundles_from_yaml.items():
-                if isinstance(value, dict):
-                    # Check if this dictionary looks like a bundle map (values are lists)
-                    is_bundle_dict = all(isinstance(sub_value, list) for sub_value in value.values()) if value else False
-                    if is_bundle_dict:
-                        print(f"Info: Using bundles from YAML key '{key}'.", file=sys.stderr)
-                        temp_actual_fund_bundles = value
-                        break # Found a suitable bundle map
-
-        if temp_actual_fund_bundles is not None:
-            actual_fund_bundles = temp_actual_fund_bundles
-        else:
-            raise ValueError("Could not find fund name bundles in YAML. Check for 'fund_names' key or a top-level dictionary where values are lists of fund aliases.")
-
+        actual_fund_bundles = parse_fund_bundles(fund_name_bundles_yaml_txt)
     except Exception as e:
         print(f"Critical error during parsing of YAML: {e}. Aborting.", file=sys.stderr)
         sys.exit(1) # Exit if YAML parsing fails
+    profiler.stop("yaml_parse")
 
+    requested_fund_names: List[str] = []
+    if args.compare:
+        # Use csv module to handle commas within quoted fund names
+        reader = csv.reader(StringIO(args.compare), skipinitialspace=True)
+        try:
+            requested_fund_names = next(reader) # Parses the single line of comma-separated names
+        except StopIteration: # Handle empty string for --compare
+            requested_fund_names = []
 
-    print("Loading and parsing individual CSV files from tables directory...", file=sys.stderr)
-    try:
-        raw_prices_df = load_and_parse_individual_csv_files(DEFAULT_TABLES_DIR)
-        if raw_prices_df.empty:
-            # This is a warning, script can proceed but tables will likely be empty.
-            print("Warning: Parsed raw prices DataFrame is empty after processing all CSVs.", file=sys.stderr)
-    except Exception as e:
-        print(f"Error during loading/parsing of CSV files: {e}. Report will show limited/no data.", file=sys.stderr)
-        raw_prices_df = pd.DataFrame() # Ensure it's an empty DataFrame on error
-
-
-    print("Bundling fund columns...", file=sys.stderr)
-    try:
-        processed_prices_df = bundle_funds(raw_prices_df, actual_fund_bundles)
-        if processed_prices_df.empty and not raw_prices_df.empty and actual_fund_bundles :
-             print("Warning: Prices DataFrame is empty after bundling funds. This might be due to no matching fund names between CSVs and YAML.", file=sys.stderr)
-    except Exception as e:
-        print(f"Error during fund bundling: {e}. Proceeding with unbundled or empty data for report.", file=sys.stderr)
-        # Fallback to raw_prices_df if bundling fails, or empty if raw_prices_df is also problematic
-        processed_prices_df = raw_prices_df if raw_prices_df is not None else pd.DataFrame()
-
+    ranked_tables = None
+    ranking_key = None
+    if args.cache_dir:
+        profiler.start("cache_lookup")
+        try:
+            ranking_key = ranking_cache_key(args, fund_name_bundles_yaml_txt, requested_fund_names)
+            cached_artifact = load_artifact(args.cache_dir, CACHE_GENERATOR, ranking_key, ".npz")
+            if cached_artifact is not None:
+                ranked_tables = tuple(frames_from_npz(cached_artifact))
+                print(f"Output cache hit {short_key(ranking_key)}: reusing the ranked tables from {args.cache_dir}", file=sys.stderr)
+            else:
+                print(f"Output cache miss {short_key(ranking_key)}", file=sys.stderr)
+        except Exception as e:
+            print(f"Warning: Output cache lookup failed: {e}. Computing the tables.", file=sys.stderr)
+        profiler.stop("cache_lookup")
 
-    print("Computing momentum tables...", file=sys.stderr)
-    # Initialize with empty DataFrames having correct columns for graceful failure
-    empty_display_df = pd.DataFrame(columns=DISPLAY_COLUMNS)
-    long_term_top_df = empty_display_df.copy()
-    lag_adj_top_df = empty_display_df.copy()
-    full_perf_df = pd.DataFrame(columns=DISPLAY_COLUMNS + ['LongTermAdjustedPerf', 'LagAdjScore']) # Include score cols
+    if ranked_tables is None:
+        ranked_tables = load_and_rank_funds(args, actual_fund_bundles, requested_fund_names, profiler)
+        if ranking_key is not None and not ranked_tables[2].empty: # Never cache a failed load
+            try:
+                store_artifact(args.cache_dir, CACHE_GENERATOR, ranking_key, ".npz", frames_to_npz(ranked_tables))
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not write to the output cache: {e}", file=sys.stderr)
+    long_term_top_df, lag_adj_top_df, full_perf_df, export_prices_df = ranked_tables
+
+    rank_change_sections: List[Tuple[str, str, pd.DataFrame, pd.DataFrame]] = [] # (heading, score column, changes, exits)
+    if args.score_store and "Fund" in full_perf_df.columns and not full_perf_df.empty:
+        full_perf_df = add_rank_columns(full_perf_df)
+        if args.rank_changes:
+            profiler.start("rank_changes")
+            try:
+                previous_date = previous_run(args.score_store, current_date_utc_str)
+                if previous_date is None:
+                    print(f"No run before {current_date_utc_str} in {args.score_store}; the report has no rank changes.", file=sys.stderr)
+                else:
+                    previous_df = load_run(args.score_store, previous_date, columns=list(RANK_COLUMNS) + list(RANK_COLUMNS.values()))
+                    for score_column, assessment in (("LongTermAdjustedPerf", "Long-Term Growth"), ("LagAdjScore", "Lag-Adjusted Short-Term")):
+                        heading = f"Rank Changes in the Best {assessment} Assessment (Top {args.top_k}) since {previous_date}"
+                        rank_change_sections.append((heading, score_column, *rank_changes(full_perf_df, previous_df, score_column, args.top_k)))
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read the previous run from the score history: {e}", file=sys.stderr)
+            profiler.stop("rank_changes")
+
+        profiler.start("score_store")
+        try:
+            run_file = append_run(args.score_store, current_date_utc_str, full_perf_df)
+            print(f"Stored {len(full_perf_df)} fund results for {current_date_utc_str} in {run_file}", file=sys.stderr)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not write to the score history: {e}", file=sys.stderr)
+        profiler.stop("score_store")
+
+    if args.export_dir and "Fund" in full_perf_df.columns and not full_perf_df.empty:
+        profiler.start("export")
+        try:
+            export_perf_df = full_perf_df if set(RANK_COLUMNS.values()) <= set(full_perf_df.columns) else add_rank_columns(full_perf_df)
+            exported = export_results(args.export_dir, args.export_format, current_date_utc_str, export_perf_df, export_prices_df, CACHE_GENERATOR)
+            print(f"Exported {', '.join(str(path) for path in exported)}", file=sys.stderr)
+        except Exception as e:
+            print(f"Warning: Could not export the performance frame: {e}", file=sys.stderr)
+        profiler.stop("export")
 
-    try:
-        long_term_top_df, lag_adj_top_df, full_perf_df = compute_momentum_tables(processed_prices_df)
-    except Exception as e:
-        print(f"Error computing momentum tables: {e}. Report will show no data for tables.", file=sys.stderr)
-        # Already initialized to empty display DFs
+    profiler.start("render") # Overlap/comparison selection, table rendering and output
 
     # --- Overlap Funds Logic ---
     md_overlap_table = ""
     html_overlap_table = ""
     overlap_funds_df = pd.DataFrame(columns=DISPLAY_COLUMNS) # Initialize empty with correct columns
 
-    if not long_term_top_df.empty and not lag_adj_top_df.empty and "Fund" in full_perf_df.columns:
+    # Top-20 screens over a --compare-only subset would be meaningless, so only the comparison table is shown
+    if not args.compare_only and not long_term_top_df.empty and not lag_adj_top_df.empty and "Fund" in full_perf_df.columns:
         long_term_fund_names = set(long_term_top_df['Fund'])
         lag_adj_fund_names = set(lag_adj_top_df['Fund'])
         common_fund_names = list(long_term_fund_names.intersection(lag_adj_fund_names))
@@ -809,7 +1410,7 @@ def main() -> None:
             if not overlap_funds_df.empty:
                 # Sort by LongTermAdjustedPerf by default for overlap, then add Rank
                 if 'LongTermAdjustedPerf' in overlap_funds_df.columns:
-                    overlap_funds_df.sort_values("LongTermAdjustedPerf", ascending=False, inplace=True)
+                    overlap_funds_df = top_k_rows(overlap_funds_df, "LongTermAdjustedPerf", len(overlap_funds_df))
                 overlap_funds_df.insert(0, 'Rank', range(1, len(overlap_funds_df) + 1))
 
             md_overlap_table = df_to_markdown_table(overlap_funds_df) # Will use DISPLAY_COLUMNS
@@ -824,14 +1425,6 @@ def main() -> None:
 
     if args.compare:
         print(f"Processing comparison funds: {args.compare}", file=sys.stderr)
-        # Use csv module to handle commas within quoted fund names
-        f = StringIO(args.compare)
-        reader = csv.reader(f, skipinitialspace=True)
-        try:
-            requested_fund_names = next(reader) # Parses the single line of comma-separated names
-        except StopIteration: # Handle empty string for --compare
-            requested_fund_names = []
-
         if requested_fund_names:
             if "Fund" in full_perf_df.columns:
                 # Filter full_perf_df for the requested funds
@@ -842,7 +1435,7 @@ def main() -> None:
                 # Or, could sort them here by a specific metric if desired before ranking.
                 # For now, rank reflects the order they appear from full_perf_df filter.
                 if 'LongTermAdjustedPerf' in comparison_funds_perf_df.columns: # Optional: sort by a metric
-                     comparison_funds_perf_df.sort_values("LongTermAdjustedPerf", ascending=False, inplace=True)
+                     comparison_funds_perf_df = top_k_rows(comparison_funds_perf_df, "LongTermAdjustedPerf", len(comparison_funds_perf_df))
                 comparison_funds_perf_df.insert(0, 'Rank', range(1, len(comparison_funds_perf_df) + 1))
 
                 found_funds = comparison_funds_perf_df['Fund'].tolist()
@@ -859,6 +1452,18 @@ def main() -> None:
     # --- End Comparison Funds Logic ---
 
 
+    # --- Weight Profile Rankings ---
+    profile_rankings: List[Tuple[str, pd.DataFrame]] = []
+    if weight_profiles:
+        try:
+            profile_rankings = rank_weight_profiles(full_perf_df, weight_profiles, args.top_k)
+            print(f"Ranked funds under {len(weight_profiles['long_term'])} long-term and "
+                  f"{len(weight_profiles['lag_adjusted'])} lag-adjusted weight profiles.", file=sys.stderr)
+        except ValueError as e:
+            print(f"Error ranking weight profiles: {e}. Report will not include them.", file=sys.stderr)
+    # --- End Weight Profile Rankings ---
+
+
     print("Generating HTML and Markdown table outputs...", file=sys.stderr)
     html_long_term_table = df_to_html_table_styled(long_term_top_df, "longTermGrowthTable")
     html_lag_adj_table = df_to_html_table_styled(lag_adj_top_df, "lagAdjustedShortTermTable")
@@ -1046,14 +1651,22 @@ def main() -> None:
         <h1><a href="https://famantic-net.github.io/fundrider-pages/" class="header-link">{final_email_subject}</a></h1>
         """
         if html_overlap_table: # Check if there's content to display
-             html_email_body += f"""<h2>Funds Appearing in Both Top 20 Assessments</h2>{html_overlap_table}"""
+             html_email_body += f"""<h2>Funds Appearing in Both Top {args.top_k} Assessments</h2>{html_overlap_table}"""
 
-        html_email_body += f"""
-        <h2>Best Long-Term Growth Assessment (Top 20)</h2>{html_long_term_table}
-        <h2>Best Lag-Adjusted Short-Term Assessment (Top 20)</h2>{html_lag_adj_table}
+        if not args.compare_only:
+            html_email_body += f"""
+        <h2>Best Long-Term Growth Assessment (Top {args.top_k})</h2>{html_long_term_table}
+        <h2>Best Lag-Adjusted Short-Term Assessment (Top {args.top_k})</h2>{html_lag_adj_table}
         """
+        for section_number, (heading, score_column, changes, exits) in enumerate(rank_change_sections, start=1):
+            table_id = f"rankChangesTable{section_number}"
+            changes_html = format_rank_changes(changes, score_column).to_html(index=False, border=0, classes="fund-table", table_id=table_id, escape=True)
+            html_email_body += (f"""<h2>{heading}</h2><div class='table-wrapper'>{changes_html}{table_copy_button(table_id)}</div>"""
+                                f"""<p>{html_escape(rank_exits_text(exits, args.top_k), quote=False)}</p>""")
         if html_comparison_table: # Check if there's content for comparison table
             html_email_body += f"""<h2>Comparison Funds Performance</h2>{html_comparison_table}"""
+        for profile_number, (heading, ranking_df) in enumerate(profile_rankings, start=1):
+            html_email_body += f"""<h2>{html_escape(heading, quote=False)}</h2>{df_to_html_table_styled(ranking_df, f"weightProfileTable{profile_number}")}"""
 
         html_email_body += f"""
         <div class="footer"><p>This report was generated automatically by the Fund Momentum Emailer script.</p>
@@ -1065,17 +1678,30 @@ def main() -> None:
         # Output Markdown to STDOUT if --email is not used
         print("\n--- Email sending skipped (--email flag not provided) ---", file=sys.stderr)
         if md_overlap_table:
-            print("\n### Funds Appearing in Both Top 20 Assessments\n", file=sys.stdout)
+            print(f"\n### Funds Appearing in Both Top {args.top_k} Assessments\n", file=sys.stdout)
             print(md_overlap_table, file=sys.stdout)
 
-        print(f"\n### Best Long-Term Growth Assessment (Top 20) - {current_date_utc_str}\n", file=sys.stdout)
-        print(md_long_term_table, file=sys.stdout)
-        print(f"\n### Best Lag-Adjusted Short-Term Assessment (Top 20) - {current_date_utc_str}\n", file=sys.stdout)
-        print(md_lag_adj_table, file=sys.stdout)
+        if not args.compare_only:
+            print(f"\n### Best Long-Term Growth Assessment (Top {args.top_k}) - {current_date_utc_str}\n", file=sys.stdout)
+            print(md_long_term_table, file=sys.stdout)
+            print(f"\n### Best Lag-Adjusted Short-Term Assessment (Top {args.top_k}) - {current_date_utc_str}\n", file=sys.stdout)
+            print(md_lag_adj_table, file=sys.stdout)
+        for heading, score_column, changes, exits in rank_change_sections:
+            from tabulate import tabulate
+            print(f"\n### {heading}\n", file=sys.stdout)
+            print(tabulate(format_rank_changes(changes, score_column), headers="keys", tablefmt="pipe", showindex=False,
+                           disable_numparse=True, colalign=("right", "left", "right", "right", "right", "right")), file=sys.stdout)
+            print(f"\n{rank_exits_text(exits, args.top_k)}", file=sys.stdout)
         if md_comparison_table:
             print("\n### Comparison Funds Performance\n", file=sys.stdout)
             print(md_comparison_table, file=sys.stdout)
+        for heading, ranking_df in profile_rankings:
+            print(f"\n### {heading} - {current_date_utc_str}\n", file=sys.stdout)
+            print(df_to_markdown_table(ranking_df), file=sys.stdout)
         print("\n--- End of Report ---", file=sys.stderr)
+    profiler.stop("render")
+    if args.profile:
+        profiler.write(args.profile)
 
     script_end_time = datetime.now()
     total_execution_time = script_end_time - script_start_time
@@ -0,0 +1,299 @@
+"""fund_pipeline.py
+
+Runs the nightly process locally as one dependency-aware pipeline instead of the
+three scheduled workflows (fetch, slice, plots) and their separate invocations.
+
+Each stage of STAGES declares its input and output files (glob patterns
+relative to the project root) and the steps that produce the outputs:
+
+    fetch        today's snapshot of the price list -> data/fonder_<date>.csv
+    ingest       data/fonder_*.csv -> tables/ (slice_fond_files.pl, then fund_tables_concat.txt)
+    charts       tables -> results/fund_series_charts.stdout.html
+    bar_scores   tables -> results/fund_series_scores.stdout.html
+    report_md    tables -> results/growth-recommendations.md (and the score history)
+    report_html  tables -> results/growth-recommendations.html
+    publish      the four results -> docs/
+
+A stage depends on every stage that declares one of its input patterns as an
+output, and starts as soon as those have finished: charts, bar_scores and both
+reports only share the ingested tables, so they run concurrently (--jobs) and
+the night's latency is the critical path fetch -> ingest -> slowest consumer ->
+publish. Bundling and scoring happen inside the consumers, which share their
+work across runs through --cache-dir (output_cache.py).
+
+A stage is skipped when its fingerprint -- the SHA-256 of its steps and of the
+content of every file matching its inputs -- equals the one recorded after its
+last successful run and all its outputs exist. fetch has no inputs and is
+skipped once today's snapshot exists. Fingerprints and per-file digests (reused
+while a file's size and mtime are unchanged) are kept in --state. Inputs are
+hashed when the stage becomes ready, i.e. after its dependencies wrote their
+outputs, so an upstream stage that reproduces identical files does not rerun
+its dependents. A failed stage is not recorded and its dependents are not run;
+independent stages still complete. Stage output written to stdout replaces the
+target only when the command succeeds (output_cache.atomic_replace), so a failed
+run never leaves a truncated result.
+
+Usage:
+    python3 bin/fund_pipeline.py                        # Run what is out of date
+    python3 bin/fund_pipeline.py --dry-run              # Show what would run
+    python3 bin/fund_pipeline.py charts report_md       # Only these stages (their inputs as they are)
+    python3 bin/fund_pipeline.py --force ingest --jobs 2
+
+Python deps: requests (fetch stage; plus the deps of the scripts the stages run)
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from output_cache import atomic_replace, write_atomic
+
+PROJECT_ROOT_DIR = Path(os.path.abspath(__file__)).parent.parent
+DEFAULT_STATE_PATH = PROJECT_ROOT_DIR / ".pipeline_state.json"
+SNAPSHOT_URL = "https://static.pensionsmyndigheten.se/fond/kurser.csv"
+PY = sys.executable
+CACHE_ARGS = ["--cache-dir", ".output_cache"]
+EMAILER_ARGS = CACHE_ARGS + ["--score-store", "results/score_history", "--rank-changes"]
+PYTHON_CODE = "bin/*.py"
+RESULTS = {
+    "results/fund_series_charts.stdout.html": "docs/latest_fund_series_charts.html",
+    "results/fund_series_scores.stdout.html": "docs/latest_fund_series_scores.html",
+    "results/growth-recommendations.md": "docs/growth-recommendations.md",
+    "results/growth-recommendations.html": "docs/growth-recommendations.html",
+}
+
+
+def fetch_snapshot(root: Path, run_date: str) -> None:
+    """Downloads today's price list to data/fonder_<run_date>.csv (with the retrying session, not the cache)."""
+    from http_cache import get_session
+
+    resp = get_session().get(SNAPSHOT_URL, timeout=60)
+    resp.raise_for_status()
+    write_atomic(root / "data" / f"fonder_{run_date}.csv", resp.content)
+
+
+def concat_tables(root: Path, run_date: str) -> None:
+    """Writes tables/fund_tables_concat.txt: the fund tables in table number order."""
+    tables = sorted((root / "tables").glob("fund_tables_*.csv"), key=lambda path: int(path.stem.rsplit("_", 1)[1]))
+    write_atomic(root / "tables" / "fund_tables_concat.txt", b"".join(path.read_bytes() for path in tables))
+
+
+def publish_results(root: Path, run_date: str) -> None:
+    """Copies the results to the GitHub Pages docs directory."""
+    for source, target in RESULTS.items():
+        (root / target).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(root / source, root / target)
+
+
+# A step is an argv list (run in the project root; "stdout" names the file its output goes to) or a
+# function called with (project root, run date). "{date}" in patterns is the run date (UTC).
+STAGES: List[Dict[str, Any]] = [
+    {"name": "fetch", "inputs": [], "outputs": ["data/fonder_{date}.csv"],
+     "steps": [fetch_snapshot]},
+    {"name": "ingest", "inputs": ["data/fonder_*.csv", "bin/fund_names.yaml", "bin/slice_fond_files.pl"],
+     "outputs": ["tables/fund_tables_*.csv", "tables/fund_tables_concat.txt"],
+     "steps": [{"argv": ["perl", "bin/slice_fond_files.pl", "-nt", "-i17", "-w", "data", "-d", "tables"]}, concat_tables]},
+    {"name": "charts", "inputs": ["tables/fund_tables_*.csv", PYTHON_CODE],
+     "outputs": ["results/fund_series_charts.stdout.html"],
+     "steps": [{"argv": [PY, "bin/interactive_fund_plot.py", "-t", "tables", "-r", ":internal:"] + CACHE_ARGS,
+                "stdout": "results/fund_series_charts.stdout.html"}]},
+    {"name": "bar_scores", "inputs": ["tables/fund_tables_*.csv", PYTHON_CODE],
+     "outputs": ["results/fund_series_scores.stdout.html"],
+     "steps": [{"argv": [PY, "bin/interactive_fund_plot.py", "--bar", "-t", "tables", "-r", ":internal:"] + CACHE_ARGS,
+                "stdout": "results/fund_series_scores.stdout.html"}]},
+    # Both reports append today's run to the score history (the same file, renamed into place); rank
+    # changes compare with earlier runs only, so neither report waits for the other.
+    {"name": "report_md", "inputs": ["tables/fund_tables_*.csv", "bin/fund_name_bundles.yaml", PYTHON_CODE],
+     "outputs": ["results/growth-recommendations.md", "results/score_history/{date}.npz"],
+     "steps": [{"argv": [PY, "bin/fund_momentum_emailer.py"] + EMAILER_ARGS, "stdout": "results/growth-recommendations.md"}]},
+    {"name": "report_html", "inputs": ["tables/fund_tables_*.csv", "bin/fund_name_bundles.yaml", PYTHON_CODE],
+     "outputs": ["results/growth-recommendations.html"],
+     "steps": [{"argv": [PY, "bin/fund_momentum_emailer.py", "--email"] + EMAILER_ARGS, "stdout": "results/growth-recommendations.html"}]},
+    {"name": "publish", "inputs": list(RESULTS), "outputs": list(RESULTS.values()),
+     "steps": [publish_results]},
+]
+
+
+def stage_dependencies(stages: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Stage name -> names of the stages producing one of its inputs (an input pattern matching an output pattern)."""
+    deps: Dict[str, List[str]] = {}
+    for stage in stages:
+        deps[stage["name"]] = [other["name"] for other in stages if other is not stage and any(
+            fnmatch.fnmatch(output, pattern) or fnmatch.fnmatch(pattern, output)
+            for pattern in stage["inputs"] for output in other["outputs"])]
+    return deps
+
+
+def expand(root: Path, pattern: str, run_date: str) -> List[Path]:
+    return sorted(path for path in root.glob(pattern.format(date=run_date)) if path.is_file())
+
+
+def step_spec(step: Any) -> Any:
+    """JSON-able description of a step, part of the stage fingerprint."""
+    return step if isinstance(step, dict) else f"{step.__module__}.{step.__name__}"
+
+
+def file_digest(path: Path, digests: Dict[str, List[Any]]) -> str:
+    """SHA-256 of a file's content, reusing the recorded digest while its size and mtime are unchanged."""
+    stat = path.stat()
+    key = str(path)
+    recorded = digests.get(key)
+    if recorded and recorded[0] == stat.st_size and recorded[1] == stat.st_mtime_ns:
+        return recorded[2]
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digests[key] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+    return digests[key][2]
+
+
+def stage_fingerprint(root: Path, stage: Dict[str, Any], run_date: str, digests: Dict[str, List[Any]]) -> str:
+    h = hashlib.sha256(json.dumps([step_spec(step) for step in stage["steps"]], sort_keys=True).encode("utf-8"))
+    for pattern in stage["inputs"]:
+        h.update(f"\0{pattern}\0".encode("utf-8"))
+        for path in expand(root, pattern, run_date):
+            h.update(f"{path.relative_to(root)}\0{file_digest(path, digests)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def outputs_exist(root: Path, stage: Dict[str, Any], run_date: str) -> bool:
+    return all(expand(root, pattern, run_date) for pattern in stage["outputs"])
+
+
+def run_stage(root: Path, stage: Dict[str, Any], run_date: str) -> str:
+    """Runs the steps of a stage; returns their collected stderr. Raises RuntimeError when a command fails."""
+    log: List[str] = []
+    for step in stage["steps"]:
+        if not isinstance(step, dict):
+            step(root, run_date)
+            continue
+        target = root / step["stdout"] if "stdout" in step else None
+        if target is None:
+            check_step(step, subprocess.run(step["argv"], cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE), log)
+        else:
+            # A failed command raises inside the block, which discards its output
+            with atomic_replace(target) as tmp_path, tmp_path.open("wb") as out:
+                check_step(step, subprocess.run(step["argv"], cwd=root, stdout=out, stderr=subprocess.PIPE), log)
+    return "".join(log)
+
+
+def check_step(step: Dict[str, Any], proc: subprocess.CompletedProcess, log: List[str]) -> None:
+    """Adds the stderr of a finished step to `log`. Raises RuntimeError when the command failed."""
+    log.append(proc.stderr.decode("utf-8", errors="replace"))
+    if proc.returncode != 0:
+        raise RuntimeError(f"'{' '.join(step['argv'])}' exited with status {proc.returncode}\n{''.join(log).rstrip()}")
+
+
+def load_state(path: Path) -> Dict[str, Any]:
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {"stages": {}, "files": {}}
+    state.setdefault("stages", {})
+    state.setdefault("files", {})
+    return state
+
+
+def run_pipeline(root: Path, selected: List[str], run_date: str, state_path: Path, jobs: int,
+                 force: List[str], dry_run: bool = False, verbose: bool = False,
+                 report: Callable[[str], None] = lambda line: print(line, file=sys.stderr)) -> bool:
+    """Runs the selected stages in dependency order, skipping unchanged ones. Returns False if a stage failed."""
+    stages = {stage["name"]: stage for stage in STAGES if stage["name"] in selected}
+    deps = {name: [dep for dep in stage_deps if dep in stages] for name, stage_deps in stage_dependencies(STAGES).items() if name in stages}
+    state = load_state(state_path)
+    done: Dict[str, str] = {} # name -> "ran" | "skipped" | "failed" | "blocked"
+    started = time.perf_counter()
+
+    def save_state() -> None:
+        if not dry_run:
+            write_atomic(state_path, json.dumps(state, indent=1, sort_keys=True).encode("utf-8"))
+
+    def ready(name: str) -> bool:
+        return name not in done and name not in running.values() and all(dep in done for dep in deps[name])
+
+    def timed_run(stage: Dict[str, Any]) -> Tuple[str, float]:
+        stage_started = time.perf_counter()
+        return run_stage(root, stage, run_date), time.perf_counter() - stage_started
+
+    running: Dict[Any, str] = {}
+    fingerprints: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while len(done) < len(stages):
+            for name in [name for name in stages if ready(name)]:
+                stage = stages[name]
+                if any(done[dep] in ("failed", "blocked") for dep in deps[name]):
+                    done[name] = "blocked"
+                    report(f"{name}: not run (a dependency failed)")
+                    continue
+                fingerprints[name] = stage_fingerprint(root, stage, run_date, state["files"])
+                recorded = state["stages"].get(name, {}).get("fingerprint")
+                unchanged = (recorded == fingerprints[name]) if stage["inputs"] else True
+                if name not in force and unchanged and outputs_exist(root, stage, run_date):
+                    done[name] = "skipped"
+                    report(f"{name}: skipped (inputs unchanged)")
+                elif dry_run:
+                    done[name] = "ran"
+                    report(f"{name}: would run")
+                else:
+                    report(f"{name}: started")
+                    running[pool.submit(timed_run, stage)] = name
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    log, elapsed = future.result()
+                except Exception as e:
+                    done[name] = "failed"
+                    report(f"{name}: FAILED: {e}")
+                    continue
+                done[name] = "ran"
+                state["stages"][name] = {"fingerprint": fingerprints[name], "finished_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                         "seconds": round(elapsed, 3)}
+                save_state()
+                report(f"{name}: done in {elapsed:.1f} s" + (f"\n{log.rstrip()}" if verbose and log.strip() else ""))
+    save_state()
+    counts = {status: sum(1 for value in done.values() if value == status) for status in ("ran", "skipped", "failed", "blocked")}
+    report(f"Pipeline finished in {time.perf_counter() - started:.1f} s: " + ", ".join(f"{count} {status}" for status, count in counts.items() if count))
+    return not (counts["failed"] or counts["blocked"])
+
+
+def main() -> None:
+    names = [stage["name"] for stage in STAGES]
+    parser = argparse.ArgumentParser(
+        description="Run the nightly fund pipeline, skipping stages whose inputs are unchanged.\n\nStages: " + ", ".join(names),
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("stages", nargs="*", metavar="STAGE", help="Stages to run (default: all). Unselected stages are not run; their outputs are used as they are.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Stages run at the same time (default: number of CPUs).")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE", help="Run STAGE even if its inputs are unchanged (repeatable; 'all' for every stage).")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run.")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE_PATH, help=f"Fingerprint file (default: {DEFAULT_STATE_PATH.name} in the project root).")
+    parser.add_argument("--verbose", action="store_true", help="Print the stderr of every stage that ran.")
+    args = parser.parse_args()
+
+    for name in args.stages + [name for name in args.force if name != "all"]:
+        if name not in names:
+            parser.error(f"Unknown stage '{name}'; stages: {', '.join(names)}")
+    run_date = datetime.now(timezone.utc).strftime("%Y-%m-%d") # As the emailer dates the score history
+    force = names if "all" in args.force else args.force
+    ok = run_pipeline(PROJECT_ROOT_DIR, args.stages or names, run_date, args.state, args.jobs, force, args.dry_run, args.verbose)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
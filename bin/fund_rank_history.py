@@ -0,0 +1,227 @@
+"""fund_rank_history.py
+
+Walk-forward ranking history: LongTermAdjustedPerf and LagAdjScore of every fund
+on every date of the bundled price matrix, as `fund_momentum_emailer.py --as-of
+<date>` would compute them on that date, and the matching rank matrices.
+
+Nothing loops over dates. Per fund, the position of its last value on or before
+each date is a running maximum down the matrix; each lookback target
+(`date - BDay(n)`) is computed once per date and found with one searchsorted
+over the dates, and the lookback value is read from the fund's last value on or
+before the target. The returns of every (date, fund) cell then come from
+elementwise array operations, the penalties of LongTermAdjustedPerf likewise,
+and the z-scores of LagAdjScore from per-date (row-wise) means and population
+standard deviations over the funds that have a return. Ranks follow the order of
+the ranking tables: higher scores first, ties in fund column order; funds with
+no value on or before a date have no score and no rank on it.
+
+Outputs (CSV, one row per date, one column per fund) in --output-dir:
+    long_term_scores.csv   LongTermAdjustedPerf
+    long_term_ranks.csv    its rank among the funds with a score that day (1 = best)
+    lag_adj_scores.csv     LagAdjScore
+    lag_adj_ranks.csv
+
+The whole history is always loaded, so lookbacks and 'All Dates' near the start
+of --since see the earlier prices; --since/--until only select the dates written.
+--verify N recomputes N dates spread over the written range with
+compute_momentum_tables(as_of=date) and compares the scores (exit status 1 on a
+difference).
+
+Usage:
+    python3 bin/fund_rank_history.py
+    python3 bin/fund_rank_history.py --since 2024-01-01 --output-dir /tmp/rank_history --verify 5
+
+Python deps: numpy, pandas (plus the deps of fund_momentum_emailer.py)
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import fund_momentum_emailer as emailer
+from fund_momentum_emailer import (ALL_DATES_KEY, LAG_ADJ_WEIGHTS, LOG_VALUE_CLIP_MAX, LOG_VALUE_CLIP_MIN, LOOKBACKS_BD,
+                                   LONG_TERM_AD_1Y_PENALTY_FACTOR, LONG_TERM_AD_1Y_THRESHOLD, LONG_TERM_AD_2M_PENALTY_FACTOR,
+                                   LONG_TERM_AD_2M_THRESHOLD, ONE_YEAR_LOOKBACK_KEY, TWO_MONTH_LOOKBACK_KEY)
+from fund_tables_io import iso_date_arg
+
+SCORE_COLUMNS = ("LongTermAdjustedPerf", "LagAdjScore")
+OUTPUT_FILES = {"LongTermAdjustedPerf": ("long_term_scores.csv", "long_term_ranks.csv"),
+                "LagAdjScore": ("lag_adj_scores.csv", "lag_adj_ranks.csv")}
+DEFAULT_OUTPUT_DIR = emailer.PROJECT_ROOT_DIR / "results" / "rank_history"
+
+
+def load_bundled_prices(tables: Path, until: str | None = None, jobs: int = 1,
+                        purpose: str = "rank") -> Tuple[Dict[str, List[str]], pd.DataFrame]:
+    """
+    The fund name bundles (YAML_DATA_URL) and the bundled log10 price matrix of `tables` up to `until`, sorted
+    by date, as the command-line tools load them. Exits with an error if either cannot be loaded.
+    """
+    try:
+        fund_bundles = emailer.parse_fund_bundles(emailer.fetch_data(emailer.YAML_URL, emailer.YAML_ENCODING))
+    except Exception as e:
+        sys.exit(f"Error: Could not load the fund name bundles: {e}")
+    print(f"Loading and parsing fund tables from {tables}...", file=sys.stderr)
+    raw_prices_df = emailer.load_and_parse_individual_csv_files(tables, until=until, jobs=jobs)
+    log_prices = emailer.bundle_funds(raw_prices_df, fund_bundles).sort_index()
+    if log_prices.empty:
+        sys.exit(f"Error: No fund prices to {purpose}.")
+    return fund_bundles, log_prices
+
+
+def return_history(log_prices: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Date x fund return matrices of every lookback and 'All Dates' for the sorted, date-indexed
+    log price matrix: cell (d, f) is the return fund f shows when ranked on date d. NaN where the
+    fund has no value on or before d, or no value on or before the lookback target.
+    Also returns the 'included' mask: funds with a value on or before each date.
+    """
+    values = log_prices.to_numpy(dtype=np.float64, na_value=np.nan).clip(LOG_VALUE_CLIP_MIN, LOG_VALUE_CLIP_MAX)
+    n_dates, n_funds = values.shape
+    fund_positions = np.arange(n_funds)
+    valid = ~np.isnan(values)
+    # Row of each fund's last value on or before each date (-1 before its first value)
+    last_row = np.maximum.accumulate(np.where(valid, np.arange(n_dates)[:, None], -1), axis=0)
+    included = last_row >= 0
+    current = np.where(included, values[np.maximum(last_row, 0), fund_positions], np.nan)
+
+    first_row = valid.argmax(axis=0)
+    first_value = values[first_row, fund_positions]
+    history: Dict[str, np.ndarray] = {"included": included}
+    with np.errstate(invalid="ignore"):
+        history[ALL_DATES_KEY] = np.power(10.0, current - first_value) - 1
+
+    dates = log_prices.index
+    for period_label, business_days_offset in LOOKBACKS_BD.items():
+        # Last date on or before each date's lookback target, then the fund's last value on or before that date
+        target_row = dates.searchsorted(dates - pd.tseries.offsets.BDay(business_days_offset), side="right") - 1
+        past_date_row = target_row[np.maximum(last_row, 0)]
+        past_row = np.where(included & (past_date_row >= 0),
+                            last_row[np.maximum(past_date_row, 0), fund_positions], -1)
+        past_value = np.where(past_row >= 0, values[np.maximum(past_row, 0), fund_positions], np.nan)
+        with np.errstate(invalid="ignore"):
+            history[period_label] = np.power(10.0, current - past_value) - 1
+    return history
+
+
+def score_history(log_prices: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    LongTermAdjustedPerf and LagAdjScore of every fund on every date of `log_prices` (log10 prices,
+    dates x funds), as compute_momentum_tables(log_prices, as_of=date) computes them for each date.
+    Returns {score column: date x fund DataFrame}; NaN where the fund has no value yet.
+    """
+    log_prices = log_prices.sort_index()
+    history = return_history(log_prices)
+    included = history["included"]
+    all_dates = history[ALL_DATES_KEY]
+
+    long_term = all_dates.copy()
+    with np.errstate(invalid="ignore"):
+        one_year, two_month = history[ONE_YEAR_LOOKBACK_KEY], history[TWO_MONTH_LOOKBACK_KEY]
+        poor_1y = one_year < LONG_TERM_AD_1Y_THRESHOLD # NaN compares False, as the reference's notna() masks
+        long_term -= np.where(poor_1y, (LONG_TERM_AD_1Y_THRESHOLD - one_year) * np.abs(all_dates) * LONG_TERM_AD_1Y_PENALTY_FACTOR, 0.0)
+        loss_2m = two_month < LONG_TERM_AD_2M_THRESHOLD
+        long_term -= np.where(loss_2m, np.abs(two_month - LONG_TERM_AD_2M_THRESHOLD) * np.abs(all_dates) * LONG_TERM_AD_2M_PENALTY_FACTOR, 0.0)
+
+    lag_adj = np.zeros_like(all_dates)
+    for period, weight in LAG_ADJ_WEIGHTS.items():
+        returns = history[period]
+        present = ~np.isnan(returns)
+        count = present.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(present, returns, 0.0).sum(axis=1, keepdims=True) / count
+            std = np.sqrt(np.where(present, (returns - mean) ** 2, 0.0).sum(axis=1, keepdims=True) / count)
+            z_scores = np.where((count >= 2) & (std != 0), (returns - mean) / std, 0.0)
+        lag_adj += weight * np.nan_to_num(z_scores, nan=0.0)
+
+    scores = {"LongTermAdjustedPerf": np.where(included, long_term, np.nan),
+              "LagAdjScore": np.where(included, lag_adj, np.nan)}
+    return {column: pd.DataFrame(matrix, index=log_prices.index, columns=log_prices.columns) for column, matrix in scores.items()}
+
+
+def rank_history(scores: pd.DataFrame) -> pd.DataFrame:
+    """Rank of each fund on each date (1 = best): higher scores first, ties in column order, NaN unranked."""
+    return scores.rank(axis=1, method="first", ascending=False, na_option="keep").astype("Int64")
+
+
+def verify_dates(log_prices: pd.DataFrame, scores: Dict[str, pd.DataFrame], dates: pd.DatetimeIndex,
+                 rtol: float = 1e-9, atol: float = 1e-12) -> bool:
+    """Recomputes `dates` with compute_momentum_tables(as_of=date) and reports whether every score matches."""
+    all_equal = True
+    for date in dates:
+        with contextlib.redirect_stderr(io.StringIO()): # The reference warns about every fund that is not normalized to the date
+            _, _, perf_df = emailer.compute_momentum_tables(log_prices, expect_normalized_latest=False, as_of=date.strftime("%Y-%m-%d"))
+        perf_df = perf_df.set_index("Fund") if "Fund" in perf_df.columns else pd.DataFrame(columns=list(SCORE_COLUMNS)) # No fund has a value yet
+        for column in SCORE_COLUMNS:
+            expected = perf_df[column].reindex(log_prices.columns).to_numpy(dtype=np.float64)
+            actual = scores[column].loc[date].to_numpy(dtype=np.float64)
+            if not np.allclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True):
+                differing = np.flatnonzero(~np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True))
+                print(f"  {date:%Y-%m-%d} {column}: {len(differing)} fund(s) differ, e.g. {log_prices.columns[differing[0]]}: "
+                      f"{actual[differing[0]]!r} != {expected[differing[0]]!r}", file=sys.stderr)
+                all_equal = False
+    return all_equal
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Write the LongTermAdjustedPerf and LagAdjScore score and rank history of every fund.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--tables", type=Path, default=emailer.DEFAULT_TABLES_DIR,
+                        help="Fund tables: a directory, fund_tables.zip or fund_tables_concat.txt\n"
+                             "(default: the committed tables/).")
+    parser.add_argument("--since", type=iso_date_arg, metavar="YYYY-MM-DD", default=None,
+                        help="First date to write (default: the first date of the tables).\n"
+                             "Earlier prices are still used for the lookbacks.")
+    parser.add_argument("--until", type=iso_date_arg, metavar="YYYY-MM-DD", default=None, help="Last date to write and load (default: the latest).")
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
+                        help="Directory for the score and rank CSVs (default: results/rank_history).")
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="Recompute N dates spread over the written range with compute_momentum_tables\n"
+                             "and compare the scores (default: 0, no check).")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to parse the fund tables (default: 1).")
+    args = parser.parse_args()
+
+    if args.since and args.until and args.since > args.until:
+        parser.error("--since must not be after --until")
+    if args.verify < 0:
+        parser.error("--verify must not be negative")
+
+    _, log_prices = load_bundled_prices(args.tables, until=args.until, jobs=args.jobs)
+
+    start = time.perf_counter()
+    scores = score_history(log_prices)
+    ranks = {column: rank_history(matrix) for column, matrix in scores.items()}
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(log_prices.index)} dates x {len(log_prices.columns)} funds in {elapsed:.2f} s", file=sys.stderr)
+
+    written = log_prices.index
+    if args.since:
+        written = written[written >= pd.Timestamp(args.since)]
+    if written.empty:
+        sys.exit(f"Error: No dates on or after {args.since}.")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for column, (scores_file, ranks_file) in OUTPUT_FILES.items():
+        scores[column].loc[written].to_csv(args.output_dir / scores_file, index_label="Date", date_format="%Y-%m-%d")
+        ranks[column].loc[written].to_csv(args.output_dir / ranks_file, index_label="Date", date_format="%Y-%m-%d")
+    print(f"Wrote {len(written)} dates ({written[0]:%Y-%m-%d} to {written[-1]:%Y-%m-%d}) to {args.output_dir}", file=sys.stderr)
+
+    if args.verify:
+        check_dates = written[np.unique(np.linspace(0, len(written) - 1, min(args.verify, len(written))).round().astype(int))]
+        print(f"Verifying {len(check_dates)} date(s) against compute_momentum_tables...", file=sys.stderr)
+        if not verify_dates(log_prices, scores, check_dates):
+            sys.exit("Error: The score history differs from compute_momentum_tables.")
+        print("Verified: the score history matches compute_momentum_tables.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
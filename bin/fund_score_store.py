@@ -0,0 +1,147 @@
+"""fund_score_store.py
+
+Append-only history of the nightly per-fund results (`fund_momentum_emailer.py
+--score-store DIR`), keyed by run date.
+
+Each run adds one file, `<DIR>/<YYYY-MM-DD>.npz`: the fund names and one float64
+array per column of STORE_COLUMNS (every lookback return, 'All Dates',
+LongTermAdjustedPerf, LagAdjScore, the --bar dashboard score and gradient at
+the default weights and the fund's rank in both assessments), in the run's
+fund order. Runs are never modified afterwards; a second run for the same date
+replaces that date's file (output_cache.atomic_replace).
+The store is columnar: an npz member is read only when it is accessed, so the
+history of one column reads that column from each run and nothing else, and
+the rows of a few funds in one run read the fund names and the wanted columns.
+
+    load_runs(DIR)                          run dates, oldest first
+    previous_run(DIR, date)                 latest run before a date
+    load_run(DIR, date, columns)            fund x column DataFrame of one run
+    load_history(DIR, column, since, until) date x fund DataFrame of one column
+
+Funds missing from a run are NaN in load_history; columns added to
+STORE_COLUMNS after a run was written read as NaN from that run.
+
+Usage (exports one column's history as CSV):
+    python3 bin/fund_score_store.py --store results/score_history --column LagAdjScore > lag_adj_history.csv
+    python3 bin/fund_score_store.py --store results/score_history   # Lists the stored runs
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from fund_bar_scores import score_funds
+from output_cache import atomic_replace
+
+BAR_SCORE_COLUMNS = ["BarScore", "BarGradient"]
+# Assessment score column -> column of the fund's rank in it (1 = best, in the order of the ranking tables)
+RANK_COLUMNS = {"LongTermAdjustedPerf": "LongTermRank", "LagAdjScore": "LagAdjRank"}
+# Lookback returns (fund_momentum_emailer.LOOKBACKS_BD order), the two assessments, the --bar score and the ranks
+STORE_COLUMNS = (["2w", "1m", "2m", "3m", "6m", "1y", "All Dates", "LongTermAdjustedPerf", "LagAdjScore"]
+                 + BAR_SCORE_COLUMNS + list(RANK_COLUMNS.values()))
+FUNDS_KEY = "__funds__"
+RUN_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.npz$")
+
+
+def bar_score_columns(log_prices: pd.DataFrame) -> pd.DataFrame:
+    """--bar dashboard score and gradient (default weights) of every fund column of a log10 price matrix."""
+    series_by_fund = {str(name): values for name in log_prices.columns
+                      if len(values := log_prices[name].dropna().to_numpy(dtype=np.float64))}
+    scored = score_funds(series_by_fund)
+    return pd.DataFrame({"BarScore": scored["scores"], "BarGradient": scored["gradients"]}, index=pd.Index(scored["names"], name="Fund"))
+
+
+def run_path(store_dir: Path, run_date: str) -> Path:
+    return Path(store_dir) / f"{run_date}.npz"
+
+
+def append_run(store_dir: Path, run_date: str, perf_df: pd.DataFrame) -> Path:
+    """
+    Writes the run of `run_date` (YYYY-MM-DD) from `perf_df` (a 'Fund' column or index plus any of
+    STORE_COLUMNS; missing columns are stored as NaN). Replaces an earlier run of the same date.
+    """
+    if not RUN_FILE.match(f"{run_date}.npz"):
+        raise ValueError(f"Run date must be YYYY-MM-DD, got '{run_date}'")
+    if "Fund" in perf_df.columns:
+        perf_df = perf_df.set_index("Fund")
+    arrays: Dict[str, np.ndarray] = {FUNDS_KEY: np.asarray(perf_df.index.astype(str), dtype=np.str_)}
+    for column in STORE_COLUMNS:
+        arrays[column] = (pd.to_numeric(perf_df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                          if column in perf_df.columns else np.full(len(perf_df), np.nan))
+
+    path = run_path(store_dir, run_date)
+    with atomic_replace(path, suffix=".npz") as tmp_path, tmp_path.open("wb") as f:
+        np.savez(f, **arrays)
+    return path
+
+
+def load_runs(store_dir: Path) -> List[str]:
+    """Dates (YYYY-MM-DD) of the stored runs, oldest first."""
+    store_dir = Path(store_dir)
+    if not store_dir.is_dir():
+        return []
+    return sorted(match.group(1) for path in store_dir.iterdir() if (match := RUN_FILE.match(path.name)))
+
+
+def previous_run(store_dir: Path, run_date: str) -> str | None:
+    """Date of the latest stored run before `run_date`, or None."""
+    earlier = [date for date in load_runs(store_dir) if date < run_date]
+    return earlier[-1] if earlier else None
+
+
+def load_run(store_dir: Path, run_date: str, columns: List[str] | None = None) -> pd.DataFrame:
+    """
+    The stored run of `run_date` as a fund x column DataFrame (all STORE_COLUMNS by default). Only the
+    requested columns are read; index the result by fund (.reindex / .loc) for the rows of given funds.
+    """
+    with np.load(run_path(store_dir, run_date), allow_pickle=False) as run:
+        funds = run[FUNDS_KEY]
+        return pd.DataFrame({column: run[column] if column in run.files else np.full(len(funds), np.nan)
+                             for column in (columns or STORE_COLUMNS)},
+                            index=pd.Index(funds, name="Fund"))
+
+
+def load_history(store_dir: Path, column: str, since: str | None = None, until: str | None = None) -> pd.DataFrame:
+    """One column over the stored runs from `since` to `until` (inclusive) as a date x fund DataFrame."""
+    if column not in STORE_COLUMNS:
+        raise ValueError(f"Unknown column '{column}'; stored: {', '.join(STORE_COLUMNS)}")
+    rows: Dict[pd.Timestamp, pd.Series] = {}
+    for run_date in load_runs(store_dir):
+        if (since and run_date < since) or (until and run_date > until):
+            continue
+        with np.load(run_path(store_dir, run_date), allow_pickle=False) as run:
+            if column in run.files:
+                rows[pd.Timestamp(run_date)] = pd.Series(run[column], index=run[FUNDS_KEY])
+    if not rows:
+        return pd.DataFrame()
+    history = pd.DataFrame.from_dict(rows, orient="index")
+    history.index.name = "Date"
+    return history
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List the runs in a score history store or export one column's history as CSV.")
+    parser.add_argument("--store", type=Path, required=True, help="Score history directory (fund_momentum_emailer.py --score-store).")
+    parser.add_argument("--column", choices=STORE_COLUMNS, default=None, help="Column to export (default: list the runs).")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", default=None, help="First run date to export.")
+    parser.add_argument("--until", metavar="YYYY-MM-DD", default=None, help="Last run date to export.")
+    args = parser.parse_args()
+
+    if args.column is None:
+        runs = load_runs(args.store)
+        print("\n".join(runs) if runs else f"No runs in {args.store}")
+        return
+    history = load_history(args.store, args.column, args.since, args.until)
+    if history.empty:
+        sys.exit(f"Error: No runs in {args.store} for the selected dates.")
+    history.to_csv(sys.stdout, date_format="%Y-%m-%d")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+"""fund_service.py
+
+Local HTTP service that keeps the fund data in memory.
+
+The fund tables are parsed and bundled once at start-up; the bundled price
+matrix, the momentum tables (fund_momentum_emailer.compute_momentum_tables) and
+the --bar window contributions (fund_bar_scores.score_funds) stay in memory
+and are served as JSON, so a ranking or chart query takes milliseconds instead
+of a full script run.
+
+The tables (a directory, fund_tables.zip or fund_tables_concat.txt, see
+--tables) and the bundles YAML are polled every --poll seconds. Only changed
+tables are parsed again: tables in a directory are compared by size and
+modification time, archive members by content hash; /bar regressions are
+redone only for funds whose series changed. A new data/fonder_*.csv
+newer than the tables marks them as stale in /status; with --rebuild-command
+that command (e.g. a slice_fond_files.pl run) is started to regenerate the
+tables, which are then picked up by the next poll.
+
+Responses are kept in an LRU cache (--cache-size entries) per endpoint and
+normalized query (weights, fund list, date range); a reload empties it.
+
+Endpoints (GET; funds are comma-separated, quoted if they contain commas, as
+for --compare; dates are YYYY-MM-DD):
+    /status                               Data version, shape, load times, staleness, cache counters
+    /rankings?since=&until=&full=1        Both top-20 tables (and the full perf table with full=1)
+    /compare?funds=A,B&since=&until=      Returns, scores and ranks of the given funds
+    /bar?weights=w1,...,w8&funds=&top=    Bar dashboard scores, gradients and per-window contributions
+    /chart?funds=A,B&since=&until=        Daily interpolated series as Plotly figure JSON
+    /chart.html?funds=A,B&since=&until=   Standalone chart page (interactive_fund_plot.fund_chart_html)
+    /reload                               Check for changed tables now (also POST)
+
+"since" loads only the range for the lookback returns; "All Dates" still starts
+at the fund's first value, as with fund_momentum_emailer.py --since.
+
+Usage:
+    python3 bin/fund_service.py                                      # http://127.0.0.1:8765/
+    python3 bin/fund_service.py --tables tables/fund_tables.zip --port 9000 --poll 60
+    python3 bin/fund_service.py --rebuild-command "perl bin/slice_fond_files.pl -t tables"
+    curl 'http://127.0.0.1:8765/compare?funds=seb%20aktiespar,d%26g%20aktiefond'
+
+Python deps: those of fund_momentum_emailer.py and interactive_fund_plot.py
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import fund_momentum_emailer as emailer
+import interactive_fund_plot as plot
+from fund_bar_scores import BAR_WINDOWS, BAR_INIT_WEIGHTS, GRADIENT_LOOKBACK_DAYS, score_funds
+from fund_tables_io import iso_date_arg, iter_table_sources, list_table_files
+from fund_top_k import top_k_positions
+
+DEFAULT_DATA_DIR = emailer.PROJECT_ROOT_DIR / "data"
+DATA_FILE_GLOB = "fonder_*.csv"
+RANGE_BAR_CACHE_SIZE = 8 # Bar contributions kept per date range (each costs a full regression pass)
+
+
+def log(message: str) -> None:
+    print(f"{datetime.now().strftime('%H:%M:%S')} {message}", file=sys.stderr)
+
+
+def json_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame rows as dicts with NaN and +-inf as None (JSON null)."""
+    cleaned = df.replace([np.inf, -np.inf], np.nan).astype(object)
+    return cleaned.where(cleaned.notna(), None).to_dict(orient="records")
+
+
+def json_floats(values: Any) -> List[Any]:
+    return [float(v) if np.isfinite(v) else None for v in np.asarray(values, dtype=np.float64).ravel()]
+
+
+def parse_fund_list(value: str) -> List[str]:
+    """Comma-separated fund names, quotes allowed around names with commas (as --compare)."""
+    return [name.strip() for name in next(csv.reader(StringIO(value), skipinitialspace=True), []) if name.strip()]
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of encoded responses."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Any, Tuple[bytes, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Tuple[bytes, str] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Any, entry: Tuple[bytes, str]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class BarContributions:
+    """
+    score_funds output as arrays, so scores and gradients for any weights are two matrix products.
+    Funds whose series equal those in `previous` reuse its rows instead of being fitted again.
+    """
+
+    def __init__(self, series_by_fund: Dict[str, np.ndarray], previous: BarContributions | None = None) -> None:
+        self.series = series_by_fund
+        self.names: List[str] = sorted(series_by_fund)
+        previous_rows = {name: i for i, name in enumerate(previous.names)} if previous else {}
+        reused = {name for name in self.names if name in previous_rows
+                  and np.array_equal(previous.series[name], series_by_fund[name])}
+        scored = score_funds({name: series_by_fund[name] for name in self.names if name not in reused})
+        scored_rows = {name: i for i, name in enumerate(scored["names"])}
+        self.main = np.zeros((len(self.names), len(BAR_WINDOWS)))
+        self.historical = np.zeros((len(self.names), GRADIENT_LOOKBACK_DAYS, len(BAR_WINDOWS)))
+        self.has_gradient = np.zeros(len(self.names), dtype=bool)
+        for row, name in enumerate(self.names):
+            if name in reused:
+                source = previous_rows[name]
+                self.main[row], self.historical[row] = previous.main[source], previous.historical[source]
+                self.has_gradient[row] = previous.has_gradient[source]
+            else:
+                source = scored_rows[name]
+                self.main[row] = scored["main_contributions"][source]
+                self.historical[row] = scored["historical_contributions"][name]
+                self.has_gradient[row] = np.isfinite(scored["gradients"][source])
+        self.fitted = len(self.names) - len(reused)
+
+    def scores_and_gradients(self, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores and score trends for `weights`, computed as score_funds does for its weights."""
+        scores = np.nan_to_num(self.main @ weights, nan=0.0, posinf=0.0, neginf=0.0)
+        day_scores = np.nan_to_num(self.historical @ weights, nan=0.0, posinf=0.0, neginf=0.0) # funds x days back
+        gradients = np.full(len(self.names), np.nan)
+        if self.has_gradient.any(): # Line through the scores from oldest to newest day
+            gradients[self.has_gradient] = np.polyfit(np.arange(GRADIENT_LOOKBACK_DAYS),
+                                                      day_scores[self.has_gradient, ::-1].T, 1)[0]
+        return scores, gradients
+
+
+class DataSnapshot:
+    """One immutable load of the fund data; requests read it while the next one is built."""
+
+    def __init__(self, version: int, raw_prices: pd.DataFrame, bundles: Dict[str, List[str]], load_info: Dict[str, Any],
+                 previous: DataSnapshot | None = None) -> None:
+        self.version = version
+        self.raw_prices = raw_prices
+        self.bundles = bundles
+        self.load_info = load_info
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull): # Keep the emailer's warnings out of the log
+            self.prices = emailer.bundle_funds(raw_prices, bundles)
+            self.momentum = emailer.compute_momentum_tables(self.prices)
+        # (first date, first value) per fund, so "All Dates" keeps its full-history start for 'since' queries
+        self.all_dates_anchors = {name: (column.first_valid_index().strftime("%Y-%m-%d"), float(column.loc[column.first_valid_index()]))
+                                  for name, column in self.prices.items() if column.first_valid_index() is not None}
+        self.bar = BarContributions(plot.bar_series_from_prices(raw_prices), previous.bar if previous else None)
+        self._range_momentum: OrderedDict[Tuple[str | None, str | None], Any] = OrderedDict()
+        self._range_bar: OrderedDict[Tuple[str | None, str | None], BarContributions] = OrderedDict()
+        self._range_lock = threading.Lock()
+        self.load_info["bar_funds_fitted"] = self.bar.fitted
+        self.load_info["derive_s"] = round(time.perf_counter() - start, 3)
+
+    def _cached_range(self, cache: OrderedDict, key: Tuple[str | None, str | None], build: Callable[[], Any]) -> Any:
+        with self._range_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = build()
+        with self._range_lock:
+            cache[key] = value
+            while len(cache) > RANGE_BAR_CACHE_SIZE:
+                cache.popitem(last=False)
+        return value
+
+    def momentum_for_range(self, since: str | None, until: str | None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        if not since and not until:
+            return self.momentum
+        def build() -> Any:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+                return emailer.compute_momentum_tables(self.prices.loc[since:until].dropna(axis=1, how="all"),
+                                                       all_dates_anchors=self.all_dates_anchors if since else None,
+                                                       expect_normalized_latest=until is None)
+        return self._cached_range(self._range_momentum, (since, until), build)
+
+    def bar_for_range(self, since: str | None, until: str | None) -> BarContributions:
+        if not since and not until:
+            return self.bar
+        return self._cached_range(self._range_bar, (since, until),
+                                  lambda: BarContributions(plot.bar_series_from_prices(self.raw_prices.loc[since:until])))
+
+
+class FundDataStore:
+    """Loads the fund data, reloads changed tables, and holds the current snapshot and the response cache."""
+
+    def __init__(self, tables_path: Path, yaml_url: str, data_dir: Path, rebuild_command: str | None, cache_size: int) -> None:
+        self.tables_path = tables_path
+        self.yaml_url = yaml_url
+        self.data_dir = data_dir
+        self.rebuild_command = rebuild_command
+        self.cache = ResponseCache(cache_size)
+        self.snapshot: DataSnapshot | None = None
+        self._reload_lock = threading.Lock()
+        self._blocks: Dict[str, Tuple[Any, Any]] = {} # table name -> (fingerprint, parsed block or None)
+        self._tables_fingerprint: Any = None
+        self._yaml_fingerprint: Any = None
+        self._bundles: Dict[str, List[str]] = {}
+        self._rebuilt_for: str | None = None # Newest data file the rebuild command last ran for
+
+    def _stat_fingerprint(self, path: Path) -> Tuple[int, int] | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _table_fingerprints(self) -> Dict[str, Any]:
+        if self.tables_path.is_dir():
+            return {path.name: self._stat_fingerprint(path) for path in list_table_files(self.tables_path)}
+        return {self.tables_path.name: self._stat_fingerprint(self.tables_path)}
+
+    def _yaml_file(self) -> Path | None:
+        return Path(self.yaml_url[7:]) if self.yaml_url.startswith("file:///") else None
+
+    def _newest_data_file(self) -> Path | None:
+        data_files = sorted(self.data_dir.glob(DATA_FILE_GLOB)) if self.data_dir.is_dir() else []
+        return data_files[-1] if data_files else None # fonder_YYYY-MM-DD.csv sorts by date
+
+    def _tables_mtime(self) -> float:
+        paths = list_table_files(self.tables_path) if self.tables_path.is_dir() else [self.tables_path]
+        return max((path.stat().st_mtime for path in paths if path.exists()), default=0.0)
+
+    def _check_data_files(self) -> Dict[str, Any]:
+        """Reports the newest data/fonder_*.csv and whether the tables are older; runs --rebuild-command once per new file."""
+        newest = self._newest_data_file()
+        stale = newest is not None and newest.stat().st_mtime > self._tables_mtime()
+        if stale and self.rebuild_command and self._rebuilt_for != newest.name:
+            self._rebuilt_for = newest.name
+            log(f"New data file {newest.name}; running: {self.rebuild_command}")
+            completed = subprocess.run(shlex.split(self.rebuild_command), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if completed.returncode != 0:
+                log(f"Rebuild command failed (exit {completed.returncode}): {completed.stderr.strip()[-500:]}")
+            stale = newest.stat().st_mtime > self._tables_mtime()
+        return {"newest_data_file": newest.name if newest else None, "tables_stale": stale}
+
+    def _parse_changed_tables(self) -> Tuple[List[Any], int]:
+        """Parses new or changed tables only; returns the blocks in table order and how many were parsed."""
+        parsed = 0
+        blocks: Dict[str, Tuple[Any, Any]] = {}
+        if self.tables_path.is_dir(): # Compare size and mtime before reading anything
+            for path in list_table_files(self.tables_path):
+                fingerprint = self._stat_fingerprint(path)
+                previous = self._blocks.get(path.name)
+                if previous is not None and previous[0] == fingerprint:
+                    blocks[path.name] = previous
+                    continue
+                blocks[path.name] = (fingerprint, emailer.parse_table_block(path.name, path.read_bytes(), parser="streaming"))
+                parsed += 1
+        else: # Archive or concatenated file: only its members' contents tell what changed
+            for name, table_bytes in iter_table_sources(self.tables_path):
+                fingerprint = hashlib.sha1(table_bytes).hexdigest()
+                previous = self._blocks.get(name)
+                if previous is not None and previous[0] == fingerprint:
+                    blocks[name] = previous
+                    continue
+                blocks[name] = (fingerprint, emailer.parse_table_block(name, table_bytes, parser="streaming"))
+                parsed += 1
+        removed = len(set(self._blocks) - set(blocks))
+        self._blocks = blocks
+        return [block for _, block in blocks.values() if block is not None], parsed + removed
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reloads if the tables or the bundles YAML changed (or force); returns True if a new snapshot was made."""
+        with self._reload_lock:
+            data_status = self._check_data_files()
+            tables_fingerprint = self._table_fingerprints()
+            yaml_file = self._yaml_file()
+            yaml_fingerprint = self._stat_fingerprint(yaml_file) if yaml_file else self.yaml_url
+            unchanged = tables_fingerprint == self._tables_fingerprint and yaml_fingerprint == self._yaml_fingerprint
+            if self.snapshot is not None and unchanged and not force:
+                self.snapshot.load_info.update(data_status)
+                return False
+
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull): # Per-table progress lines
+                if yaml_fingerprint != self._yaml_fingerprint or force or not self._bundles:
+                    self._bundles = emailer.parse_fund_bundles(emailer.fetch_data(self.yaml_url, expected_encoding=emailer.YAML_ENCODING))
+                file_blocks, changed_tables = self._parse_changed_tables()
+            if not file_blocks:
+                raise ValueError(f"No fund tables could be parsed from {self.tables_path}")
+            raw_prices = emailer.assemble_price_matrix(file_blocks)
+            parse_s = time.perf_counter() - start
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            load_info = {"loaded_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                         "tables": len(self._blocks), "changed_tables": changed_tables, "parse_s": round(parse_s, 3), **data_status}
+            self.snapshot = DataSnapshot(version, raw_prices, self._bundles, load_info, previous=self.snapshot)
+            self._tables_fingerprint, self._yaml_fingerprint = tables_fingerprint, yaml_fingerprint
+            self.cache.clear()
+            log(f"Loaded data version {version}: {changed_tables} changed table(s), matrix {raw_prices.shape}, "
+                f"{self.snapshot.prices.shape[1]} funds in {time.perf_counter() - start:.2f}s")
+            return True
+
+    def poll_forever(self, interval_s: float) -> None:
+        while True:
+            time.sleep(interval_s)
+            try:
+                self.refresh()
+            except Exception as e: # Keep serving the last good snapshot
+                log(f"Reload failed: {e}")
+
+
+# --- Endpoints: (snapshot, normalized query) -> JSON-ready object ---
+
+def parse_query(query: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Validates and normalizes the query parameters; raises ValueError with a message for the client."""
+    single = {key: values[-1] for key, values in query.items()}
+    params: Dict[str, Any] = {}
+    for key in ("since", "until"):
+        if single.get(key):
+            try:
+                params[key] = iso_date_arg(single[key])
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(str(e))
+    if params.get("since") and params.get("until") and params["since"] > params["until"]:
+        raise ValueError("since must not be later than until")
+    if single.get("funds"):
+        params["funds"] = tuple(parse_fund_list(single["funds"]))
+    if single.get("weights"):
+        try:
+            params["weights"] = tuple(float(w) for w in single["weights"].split(","))
+        except ValueError:
+            raise ValueError("weights must be comma-separated numbers")
+        if len(params["weights"]) != len(BAR_WINDOWS):
+            raise ValueError(f"weights needs {len(BAR_WINDOWS)} values, one per window {BAR_WINDOWS}")
+    if single.get("top"):
+        if not single["top"].isdigit():
+            raise ValueError("top must be a positive integer")
+        params["top"] = int(single["top"])
+    params["full"] = single.get("full", "") in ("1", "true", "yes")
+    return params
+
+
+def status_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"version": snapshot.version, "tables_path": str(store.tables_path), "matrix_shape": list(snapshot.raw_prices.shape),
+            "funds": snapshot.prices.shape[1], "first_date": str(snapshot.prices.index.min().date()),
+            "last_date": str(snapshot.prices.index.max().date()), **snapshot.load_info, "cache": store.cache.stats()}
+
+
+def rankings_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    long_term_top, lag_adj_top, perf_df = snapshot.momentum_for_range(params.get("since"), params.get("until"))
+    result = {"version": snapshot.version, "since": params.get("since"), "until": params.get("until"),
+              "long_term_top": json_records(long_term_top), "lag_adj_top": json_records(lag_adj_top)}
+    if params["full"]:
+        result["perf"] = json_records(perf_df)
+    return result
+
+
+def compare_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    funds = params.get("funds")
+    if not funds:
+        raise ValueError("compare needs funds=A,B,...")
+    _, _, perf_df = snapshot.momentum_for_range(params.get("since"), params.get("until"))
+    perf_df = (perf_df.set_index("Fund") if "Fund" in perf_df.columns # No fund has a value in the range: all missing
+               else pd.DataFrame(columns=["LongTermAdjustedPerf", "LagAdjScore"], index=pd.Index([], name="Fund")))
+    ranks = {column: perf_df[column].rank(ascending=False, method="first") for column in ("LongTermAdjustedPerf", "LagAdjScore")
+             if column in perf_df.columns}
+    found = [fund for fund in funds if fund in perf_df.index]
+    rows = perf_df.loc[found].reset_index()
+    for column, rank in ranks.items():
+        rows[f"{column}Rank"] = [int(rank[fund]) for fund in found]
+    return {"version": snapshot.version, "since": params.get("since"), "until": params.get("until"), "ranked_funds": len(perf_df),
+            "funds": json_records(rows), "missing": [fund for fund in funds if fund not in perf_df.index]}
+
+
+def bar_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    bar = snapshot.bar_for_range(params.get("since"), params.get("until"))
+    weights = np.array(params.get("weights", BAR_INIT_WEIGHTS), dtype=np.float64)
+    scores, gradients = bar.scores_and_gradients(weights)
+    positions = np.arange(len(bar.names))
+    if params.get("funds"):
+        wanted = set(params["funds"])
+        positions = np.array([i for i, name in enumerate(bar.names) if name in wanted], dtype=int)
+    positions = positions[top_k_positions(scores[positions], params.get("top") or len(positions))] # Best score first
+    return {"version": snapshot.version, "windows": BAR_WINDOWS, "weights": weights.tolist(),
+            "gradient_days": GRADIENT_LOOKBACK_DAYS,
+            "funds": [{"name": bar.names[i], "score": json_floats(scores[i])[0], "gradient": json_floats(gradients[i])[0],
+                       "contributions": json_floats(bar.main[i])} for i in positions]}
+
+
+def chart_frame(snapshot: DataSnapshot, params: Dict[str, Any]) -> pd.DataFrame:
+    funds = params.get("funds")
+    if not funds:
+        raise ValueError("chart needs funds=A,B,...")
+    found = [fund for fund in funds if fund in snapshot.prices.columns]
+    if not found:
+        raise ValueError("none of the funds are in the bundled data")
+    return snapshot.prices.loc[params.get("since"):params.get("until"), found]
+
+
+def chart_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> Dict[str, Any]:
+    df, last_dates = plot.daily_chart_frame(chart_frame(snapshot, params))
+    dates = df["Date"].dt.strftime("%Y-%m-%d").tolist()
+    traces = [{"type": "scatter", "mode": "lines", "name": f"{fund}<br>{last_dates[fund]}" if fund in last_dates else fund,
+               "x": dates, "y": json_floats(df[fund])} for fund in df.columns if fund != "Date"]
+    layout = {"hovermode": "closest", "template": "plotly_white", "xaxis": {"title": "Date"},
+              "yaxis": {"zeroline": True, "zerolinewidth": 3, "title": "Normalized Value (log10 scale, 0 = Last Date)"}}
+    return {"data": traces, "layout": layout}
+
+
+def chart_html_endpoint(store: FundDataStore, snapshot: DataSnapshot, params: Dict[str, Any]) -> str:
+    return plot.fund_chart_html(chart_frame(snapshot, params), title="Selected Fund Series")
+
+
+ENDPOINTS: Dict[str, Callable[[FundDataStore, DataSnapshot, Dict[str, Any]], Any]] = {
+    "/status": status_endpoint,
+    "/rankings": rankings_endpoint,
+    "/compare": compare_endpoint,
+    "/bar": bar_endpoint,
+    "/chart": chart_endpoint,
+    "/chart.html": chart_html_endpoint,
+}
+UNCACHED_ENDPOINTS = {"/status"}
+
+
+class FundRequestHandler(BaseHTTPRequestHandler):
+    server_version = "FundService/1.0"
+    store: FundDataStore # Set on the handler class by main()
+    quiet = False
+
+    def _send(self, status: int, body: bytes, content_type: str, extra_headers: Dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Any, extra_headers: Dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(payload, allow_nan=False).encode("utf-8"), "application/json; charset=utf-8", extra_headers)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path in ("/reload", "/reload/"):
+            self._reload()
+            return
+        endpoint = ENDPOINTS.get(url.path.rstrip("/") or "/status")
+        if endpoint is None:
+            self._send_json(404, {"error": f"unknown endpoint {url.path}", "endpoints": sorted(ENDPOINTS) + ["/reload"]})
+            return
+        snapshot = self.store.snapshot
+        try:
+            params = parse_query(parse_qs(url.query))
+            key = (snapshot.version, url.path, tuple(sorted(params.items())))
+            cached = None if url.path in UNCACHED_ENDPOINTS else self.store.cache.get(key)
+            if cached is None:
+                result = endpoint(self.store, snapshot, params)
+                if isinstance(result, str):
+                    cached = (result.encode("utf-8"), "text/html; charset=utf-8")
+                else:
+                    cached = (json.dumps(result, allow_nan=False).encode("utf-8"), "application/json; charset=utf-8")
+                if url.path not in UNCACHED_ENDPOINTS:
+                    self.store.cache.put(key, cached)
+                cache_state = "miss"
+            else:
+                cache_state = "hit"
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e: # An endpoint bug must still answer the request
+            log(f"{url.path} failed:\n{traceback.format_exc().rstrip()}")
+            self._send_json(500, {"error": f"internal error: {type(e).__name__}: {e}"})
+            return
+        self._send(200, cached[0], cached[1], {"X-Data-Version": str(snapshot.version), "X-Cache": cache_state})
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path.rstrip("/") == "/reload":
+            self._reload()
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def _reload(self) -> None:
+        try:
+            reloaded = self.store.refresh(force=False)
+        except Exception as e:
+            self._send_json(500, {"error": f"reload failed: {e}"})
+            return
+        self._send_json(200, {"reloaded": reloaded, "version": self.store.snapshot.version})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.quiet:
+            log(f"{self.address_string()} {format % args}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve fund rankings, comparisons, bar scores and charts from data kept in memory.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1, local only).")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    parser.add_argument("--tables", type=Path, default=emailer.DEFAULT_TABLES_DIR,
+                        help="Fund tables directory, fund_tables.zip or fund_tables_concat.txt (default: tables/).")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR,
+                        help=f"Directory with the {DATA_FILE_GLOB} downloads the tables are made from (default: data/).")
+    parser.add_argument("--rebuild-command", default=None,
+                        help="Command that regenerates the tables, run when a data file newer than the tables appears.")
+    parser.add_argument("--poll", type=float, default=30.0, help="Seconds between checks for changed tables (default: 30; 0 = never).")
+    parser.add_argument("--cache-size", type=int, default=256, help="Responses kept in the LRU cache (default: 256).")
+    parser.add_argument("--quiet", action="store_true", help="Do not log requests.")
+    args = parser.parse_args()
+
+    store = FundDataStore(args.tables, emailer.YAML_URL, args.data_dir, args.rebuild_command, args.cache_size)
+    try:
+        store.refresh(force=True)
+    except Exception as e:
+        sys.exit(f"Error: Could not load the fund data: {e}")
+    if args.poll > 0:
+        threading.Thread(target=store.poll_forever, args=(args.poll,), daemon=True).start()
+
+    FundRequestHandler.store = store
+    FundRequestHandler.quiet = args.quiet
+    server = ThreadingHTTPServer((args.host, args.port), FundRequestHandler)
+    log(f"Serving on http://{args.host}:{args.port}/ (endpoints: {', '.join(sorted(ENDPOINTS))}, /reload)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
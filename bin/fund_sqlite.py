@@ -0,0 +1,227 @@
+"""fund_sqlite.py
+
+Local SQLite database of the fund data for ad-hoc questions.
+
+`export` bulk-loads into a new database:
+
+    prices      (fund, date, log_price)    bundled log10 prices, as the emailer ranks them
+    aliases     (fund, alias)              table column names of each fund (fund_name_bundles.yaml)
+    fund_status (name, last_date, missing, discontinued)
+                                           data/cache metadata per table column name: the last date in
+                                           lastdates.txt and whether missing.txt / discontinued.txt list it
+    scores      (fund, date, ret_2w, ret_1m, ret_2m, ret_3m, ret_6m, ret_1y, ret_all,
+                 long_term, lag_adj, long_term_rank, lag_adj_rank)
+                                           every lookback return, both assessments and their ranks on
+                                           every date (fund_rank_history.py: as the report would have
+                                           shown them that day)
+    export_info (key, value)               source paths and export time
+
+Dates are ISO text (YYYY-MM-DD). prices and scores are keyed by (fund, date) and
+also indexed by date, aliases by alias. Rows are inserted with executemany in
+batches of BATCH_ROWS inside one transaction, with the indexes created after the
+load; the database is built in a temporary file next to --db that replaces it
+when complete (output_cache.atomic_replace), so queries never see a
+half-written export.
+
+`query` runs one SQL statement on a read-only connection and prints the result
+as an aligned table or CSV.
+
+Usage:
+    python3 bin/fund_sqlite.py export
+    python3 bin/fund_sqlite.py export --db /tmp/funds.sqlite --tables tables/fund_tables.zip
+    python3 bin/fund_sqlite.py query "SELECT fund, ret_6m FROM scores WHERE date = (SELECT MAX(date) FROM scores WHERE date <= '2025-03-31') ORDER BY ret_6m DESC LIMIT 10"
+    python3 bin/fund_sqlite.py query --csv "SELECT date, log_price FROM prices WHERE fund = 'seb aktiespar' AND date >= '2025-01-01'"
+
+Python deps: numpy, pandas (plus the deps of fund_momentum_emailer.py)
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import fund_momentum_emailer as emailer
+from fund_momentum_emailer import ALL_DATES_KEY, LOOKBACKS_BD
+from fund_rank_history import load_bundled_prices, rank_history, return_history, score_history
+from output_cache import atomic_replace
+
+DEFAULT_DB_PATH = emailer.PROJECT_ROOT_DIR / "fund_data.sqlite"
+DEFAULT_CACHE_DIR = emailer.PROJECT_ROOT_DIR / "data" / "cache"
+CACHE_ENCODING = "iso-8859-15"
+BATCH_ROWS = 50_000
+
+# scores column -> return_history key, in table order
+RETURN_COLUMNS = {f"ret_{key}": key for key in LOOKBACKS_BD} | {"ret_all": ALL_DATES_KEY}
+
+SCHEMA = f"""
+CREATE TABLE prices (fund TEXT NOT NULL, date TEXT NOT NULL, log_price REAL NOT NULL, PRIMARY KEY (fund, date)) WITHOUT ROWID;
+CREATE TABLE aliases (fund TEXT NOT NULL, alias TEXT NOT NULL, PRIMARY KEY (fund, alias)) WITHOUT ROWID;
+CREATE TABLE fund_status (name TEXT PRIMARY KEY, last_date TEXT, missing INTEGER NOT NULL, discontinued INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE scores (fund TEXT NOT NULL, date TEXT NOT NULL, {", ".join(f"{column} REAL" for column in RETURN_COLUMNS)},
+                     long_term REAL, lag_adj REAL, long_term_rank INTEGER, lag_adj_rank INTEGER,
+                     PRIMARY KEY (fund, date)) WITHOUT ROWID;
+CREATE TABLE export_info (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+"""
+INDEXES = """
+CREATE INDEX prices_date ON prices (date, fund);
+CREATE INDEX aliases_alias ON aliases (alias);
+CREATE INDEX scores_date ON scores (date, fund);
+"""
+
+
+def batched(rows: Iterable[tuple], size: int = BATCH_ROWS) -> Iterator[List[tuple]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def insert_rows(connection: sqlite3.Connection, table: str, n_columns: int, rows: Iterable[tuple]) -> int:
+    """Inserts `rows` into `table` in batches of BATCH_ROWS; returns the row count."""
+    statement = f"INSERT INTO {table} VALUES ({', '.join('?' * n_columns)})"
+    count = 0
+    for batch in batched(rows):
+        connection.executemany(statement, batch)
+        count += len(batch)
+    return count
+
+
+def matrix_rows(dates: List[str], funds: List[str], present: np.ndarray, *matrices: np.ndarray) -> Iterator[tuple]:
+    """(fund, date, value per matrix) for every `present` (date x fund) cell, fund by fund (the key order); NaN as None."""
+    for fund_position, fund in enumerate(funds):
+        rows = np.flatnonzero(present[:, fund_position])
+        columns = [[None if np.isnan(v) else float(v) for v in matrix[rows, fund_position]] for matrix in matrices]
+        yield from zip([fund] * len(rows), [dates[row] for row in rows], *columns)
+
+
+def read_cache_list(path: Path) -> List[str]:
+    """Fund names of missing.txt / discontinued.txt (after the 'N ... funds found.' line); [] if absent."""
+    if not path.is_file():
+        return []
+    lines = path.read_text(encoding=CACHE_ENCODING).splitlines()
+    return [line.strip() for line in lines[1:] if line.strip()]
+
+
+def read_last_dates(path: Path) -> Dict[str, str]:
+    """{fund name: last date} of lastdates.txt ('name: YYYY-MM-DD' lines after '---'); {} if absent."""
+    if not path.is_file():
+        return {}
+    last_dates: Dict[str, str] = {}
+    for line in path.read_text(encoding=CACHE_ENCODING).splitlines():
+        name, separator, date = line.rpartition(": ")
+        if separator and name.strip():
+            last_dates[name.strip()] = date.strip()
+    return last_dates
+
+
+def fund_status_rows(cache_dir: Path) -> List[Tuple[str, str | None, int, int]]:
+    last_dates = read_last_dates(cache_dir / "lastdates.txt")
+    missing = set(read_cache_list(cache_dir / "missing.txt"))
+    discontinued = set(read_cache_list(cache_dir / "discontinued.txt"))
+    return [(name, last_dates.get(name), int(name in missing), int(name in discontinued))
+            for name in sorted(set(last_dates) | missing | discontinued)]
+
+
+def export_database(db_path: Path, log_prices: pd.DataFrame, fund_bundles: Dict[str, List[str]], cache_dir: Path,
+                    info: Dict[str, str]) -> Dict[str, int]:
+    """Builds the database at `db_path` (replacing it) from the bundled log prices; returns the row count per table."""
+    log_prices = log_prices.sort_index()
+    dates = [date.strftime("%Y-%m-%d") for date in log_prices.index]
+    funds = [str(fund) for fund in log_prices.columns]
+    returns = return_history(log_prices)
+    scores = score_history(log_prices)
+    ranks = {column: rank_history(matrix).to_numpy(dtype=np.float64, na_value=np.nan) for column, matrix in scores.items()}
+    prices = log_prices.to_numpy(dtype=np.float64, na_value=np.nan)
+    score_matrices = ([returns[key] for key in RETURN_COLUMNS.values()]
+                      + [scores["LongTermAdjustedPerf"].to_numpy(), scores["LagAdjScore"].to_numpy(),
+                         ranks["LongTermAdjustedPerf"], ranks["LagAdjScore"]])
+
+    counts: Dict[str, int] = {}
+    with atomic_replace(db_path, suffix=".sqlite") as tmp_path:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF") # A fresh file that is discarded on failure needs no journal
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.executescript(SCHEMA)
+            with connection:
+                counts["prices"] = insert_rows(connection, "prices", 3, matrix_rows(dates, funds, ~np.isnan(prices), prices))
+                # A fund is scored on every date from its first value on
+                counts["scores"] = insert_rows(connection, "scores", 2 + len(score_matrices),
+                                               matrix_rows(dates, funds, returns["included"], *score_matrices))
+                counts["aliases"] = insert_rows(connection, "aliases", 2,
+                                                sorted({(fund, alias) for fund, aliases in fund_bundles.items() for alias in aliases}))
+                counts["fund_status"] = insert_rows(connection, "fund_status", 4, fund_status_rows(cache_dir))
+                insert_rows(connection, "export_info", 2, sorted(info.items()))
+            connection.executescript(INDEXES)
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+    return counts
+
+
+def run_query(db_path: Path, sql: str, as_csv: bool = False) -> None:
+    """Runs `sql` on a read-only connection to the database and prints the result."""
+    connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(sql)
+        columns = [description[0] for description in cursor.description or []]
+        result = pd.DataFrame(cursor.fetchall(), columns=columns)
+    finally:
+        connection.close()
+    if as_csv:
+        result.to_csv(sys.stdout, index=False)
+    elif result.empty:
+        print("(no rows)")
+    else:
+        print(result.to_string(index=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export the fund data to a local SQLite database, or query it.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Build the database from the fund tables.",
+                                          formatter_class=argparse.RawTextHelpFormatter)
+    export_parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help=f"Database file (default: {DEFAULT_DB_PATH.name} in the project root).")
+    export_parser.add_argument("--tables", type=Path, default=emailer.DEFAULT_TABLES_DIR,
+                               help="Fund tables: a directory, fund_tables.zip or fund_tables_concat.txt\n"
+                                    "(default: the committed tables/).")
+    export_parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                               help="Directory with lastdates.txt, missing.txt and discontinued.txt (default: data/cache).")
+    export_parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to parse the fund tables (default: 1).")
+    query_parser = subparsers.add_parser("query", help="Run one SQL statement on the database.")
+    query_parser.add_argument("sql", help="The SQL statement (the connection is read-only).")
+    query_parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help=f"Database file (default: {DEFAULT_DB_PATH.name} in the project root).")
+    query_parser.add_argument("--csv", action="store_true", help="Print CSV instead of an aligned table.")
+    args = parser.parse_args()
+
+    if args.command == "query":
+        if not args.db.is_file():
+            sys.exit(f"Error: No database at {args.db}; run 'fund_sqlite.py export' first.")
+        try:
+            run_query(args.db, args.sql, args.csv)
+        except sqlite3.Error as e:
+            sys.exit(f"Error: {e}")
+        return
+
+    fund_bundles, log_prices = load_bundled_prices(args.tables, jobs=args.jobs, purpose="export")
+
+    started = time.perf_counter()
+    info = {"tables": str(args.tables), "bundles": emailer.YAML_URL, "cache_dir": str(args.cache_dir),
+            "exported_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+    counts = export_database(args.db, log_prices, fund_bundles, args.cache_dir, info)
+    print(f"Exported {', '.join(f'{count} {table}' for table, count in counts.items())} rows to {args.db} "
+          f"in {time.perf_counter() - started:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""fund_tables_io.py
+
+Shared helpers for reading the fund tables written by `slice_fond_files.pl`
+(`tables/fund_tables_<n>.csv`), used by both `fund_momentum_emailer.py` and
+`interactive_fund_plot.py`.
+
+Table layout (ISO-8859-15):
+    <zero or more blank lines>
+    # ;[current name][former name]...;[...];...   (alias header, one bracket group per fund column)
+    # ;fund name 1;fund name 2;...                 (fund name header)
+    2023-11-21;-0,046;;0,015;...                   (date;log10 values with comma decimals)
+
+Fund table index
+----------------
+To look at one fund (or a short --compare list) the scripts would otherwise have to
+parse all tables. `load_table_index` keeps a small JSON index next to the tables
+(`fund_tables_index.json`) mapping each fund name and alias to its table file,
+field position in the data rows, and the byte range of data rows holding values
+for that fund. The index records the size and mtime of every table and is rebuilt
+automatically whenever a table is added, removed or changed.
+`read_fund_columns` then reads only the requested fields of the rows in that
+byte range. The index also records each fund's first date and value, so a load
+restricted with --since still knows the anchor for the "All Dates" return.
+
+Date ranges
+-----------
+`filter_table_lines` drops data rows outside a --since/--until range while the
+table text is read, so pandas never parses or converts them. Dates are ISO
+'YYYY-MM-DD' strings and compare correctly as plain strings.
+
+Numeric parsing
+---------------
+`parse_table_values` is a low-memory alternative to reading a table with pandas
+as strings: it streams the data rows and converts each comma-decimal cell
+straight into a float row of a preallocated array (grown by doubling), so no
+per-cell string objects outlive their line.
+
+Table sources
+-------------
+Besides a directory of tables, `iter_table_sources` accepts the zip archive
+(`fund_tables.zip`) and the concatenated text file (`fund_tables_concat.txt`)
+that `slice_fond_files.pl` writes next to them. Zip members are read straight
+from the archive and the concatenated file is split at each '# ;' header pair,
+so nothing is extracted to disk. The fund table index only covers directories.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import math
+import re
+import sys
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Any
+
+import numpy as np
+
+from output_cache import atomic_replace
+
+TABLE_GLOB = "fund_tables_*.csv"
+TABLE_NAME_PATTERN = re.compile(r"fund_tables_(\d+)\.csv$")
+TABLE_ENCODING = "iso-8859-15"
+INDEX_FILE_NAME = "fund_tables_index.json"
+INDEX_VERSION = 2
+
+HEADER_PREFIX = b"# ;"
+
+
+def iso_date_arg(value: str) -> str:
+    """argparse type for --since/--until: validates a YYYY-MM-DD date and returns it normalized."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a date in YYYY-MM-DD format")
+
+
+def date_in_range(date_str: str, since: str | None, until: str | None) -> bool:
+    """True if the ISO date string lies within [since, until]; either bound may be None."""
+    return (since is None or date_str >= since) and (until is None or date_str <= until)
+
+
+def _looks_like_date(field: str) -> bool:
+    return len(field) == 10 and field[4] == "-" and field[7] == "-"
+
+
+def filter_table_lines(lines: Iterable[str], since: str | None, until: str | None) -> Iterator[str]:
+    """
+    Yields the lines of a fund table, skipping data rows dated outside [since, until].
+    Leading blank lines, the two '# ;' header lines and any non-date lines are passed through,
+    so the result can be handed to the same pandas options as the unfiltered file.
+    """
+    headers_seen = 0
+    for line in lines:
+        if headers_seen < 2:
+            if line.startswith("# ;"):
+                headers_seen += 1
+            yield line
+            continue
+        date_field = line.split(";", 1)[0].strip()
+        if not _looks_like_date(date_field) or date_in_range(date_field, since, until):
+            yield line
+
+
+def read_table_text(table_path: Path, since: str | None = None, until: str | None = None, encoding: str = TABLE_ENCODING) -> str:
+    """Returns the text of a fund table with data rows outside [since, until] removed."""
+    with table_path.open("r", encoding=encoding) as f:
+        return "".join(filter_table_lines(f, since, until))
+
+
+def list_table_files(tables_dir: Path) -> List[Path]:
+    """Returns the fund_tables_*.csv files in `tables_dir`, in the (lexicographic) order the loaders use."""
+    return sorted(tables_dir.glob(TABLE_GLOB))
+
+
+def split_concatenated_tables(data: bytes) -> List[bytes]:
+    """
+    Splits the contents of fund_tables_concat.txt into the original tables. A table starts at a
+    '# ;' line directly followed by another '# ;' line; blank lines just before it belong to it.
+    """
+    lines = data.splitlines(keepends=True)
+    starts: List[int] = []
+    offset = 0
+    blank_run_offset: int | None = None
+    for i, line in enumerate(lines):
+        if not line.strip():
+            if blank_run_offset is None:
+                blank_run_offset = offset
+        else:
+            if line.startswith(HEADER_PREFIX) and i + 1 < len(lines) and lines[i + 1].startswith(HEADER_PREFIX) \
+                    and not (i > 0 and lines[i - 1].startswith(HEADER_PREFIX)):
+                starts.append(offset if blank_run_offset is None else blank_run_offset)
+            blank_run_offset = None
+        offset += len(line)
+    if not starts:
+        return []
+    starts[0] = 0
+    return [data[start:end] for start, end in zip(starts, starts[1:] + [len(data)])]
+
+
+def iter_table_sources(source: Path) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (table name, raw bytes) for the fund tables in `source`, in the loaders' lexicographic
+    name order. `source` is a directory of fund_tables_<n>.csv files, a zip archive holding such
+    files (at any depth; read without extracting), or fund_tables_concat.txt, whose tables are
+    named fund_tables_<n>.csv by position since slice_fond_files.pl concatenates them in numeric order.
+    Raises FileNotFoundError if `source` does not exist.
+    """
+    if source.is_dir():
+        for table_path in list_table_files(source):
+            yield table_path.name, table_path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            members = {Path(info.filename).name: info for info in archive.infolist()
+                       if not info.is_dir() and TABLE_NAME_PATTERN.match(Path(info.filename).name)}
+            for name in sorted(members):
+                yield name, archive.read(members[name])
+    elif source.is_file():
+        tables = split_concatenated_tables(source.read_bytes())
+        yield from sorted((f"fund_tables_{n}.csv", table) for n, table in enumerate(tables, start=1))
+    else:
+        raise FileNotFoundError(f"Fund tables not found: {source}")
+
+
+def _open_table(table: Path | bytes) -> BinaryIO:
+    return table.open("rb") if isinstance(table, Path) else io.BytesIO(table)
+
+
+def split_header_fields(header_line: str) -> List[str]:
+    """Splits a '# ;a;b;c;' header line into its stripped fields (empty trailing field dropped)."""
+    fields = [p.strip() for p in header_line.strip()[3:].split(";")]
+    if fields and fields[-1] == "":
+        fields.pop()
+    return fields
+
+
+def parse_alias_group(field: str) -> List[str]:
+    """Parses '[name a][name b]' from the alias header into ['name a', 'name b']."""
+    return [a.strip() for a in field.strip().strip("[]").split("][") if a.strip()]
+
+
+def read_table_headers(table_path: Path | bytes, encoding: str = TABLE_ENCODING) -> Tuple[List[str], List[List[str]], int]:
+    """
+    Reads the two '# ;' header lines of a fund table (a file or its raw bytes).
+    Returns (fund_names, alias_groups, data_offset) where data_offset is the byte offset
+    of the first line after the headers. Raises ValueError if the headers are missing.
+    """
+    with _open_table(table_path) as f:
+        line = f.readline()
+        while line and not line.strip():
+            line = f.readline()
+        alias_line, name_line = line, f.readline()
+        data_offset = f.tell()
+
+    if not (alias_line.startswith(HEADER_PREFIX) and name_line.startswith(HEADER_PREFIX)):
+        table_name = table_path.name if isinstance(table_path, Path) else "fund table"
+        raise ValueError(f"{table_name} does not start with two '# ;' header lines")
+
+    fund_names = split_header_fields(name_line.decode(encoding))
+    alias_fields = split_header_fields(alias_line.decode(encoding))
+    alias_groups = [parse_alias_group(alias_fields[i]) if i < len(alias_fields) else [] for i in range(len(fund_names))]
+    return fund_names, alias_groups, data_offset
+
+
+def _table_signature(table_path: Path) -> Dict[str, int]:
+    stat = table_path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _index_table(table_path: Path, encoding: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Scans one table and returns its index entry plus one location record per fund column."""
+    fund_names, alias_groups, data_offset = read_table_headers(table_path, encoding)
+    num_funds = len(fund_names)
+    first_offsets: List[int | None] = [None] * num_funds
+    end_offsets: List[int | None] = [None] * num_funds
+    first_dates: List[str | None] = [None] * num_funds
+    first_values: List[float | None] = [None] * num_funds
+
+    with table_path.open("rb") as f:
+        f.seek(data_offset)
+        offset = data_offset
+        for raw_line in f:
+            line_end = offset + len(raw_line)
+            fields = raw_line.rstrip(b"\r\n").split(b";")
+            if fields[0].strip() and not fields[0].startswith(b"#"):
+                for i in range(min(num_funds, len(fields) - 1)):
+                    if fields[i + 1].strip():
+                        if first_offsets[i] is None:
+                            first_offsets[i] = offset
+                        end_offsets[i] = line_end
+                        if first_dates[i] is None:
+                            value = parse_decimal_comma(fields[i + 1].decode(encoding))
+                            if math.isfinite(value):
+                                first_dates[i] = fields[0].strip().decode(encoding)
+                                first_values[i] = value
+            offset = line_end
+
+    table_entry = {**_table_signature(table_path), "data_offset": data_offset, "funds": fund_names}
+    locations = [
+        {
+            "name": name,
+            "aliases": [a for a in alias_groups[i] if a != name],
+            "table": table_path.name,
+            "field": i + 1, # Field position in a data row; field 0 is the date
+            "first_offset": first_offsets[i],
+            "end_offset": end_offsets[i],
+            "first_date": first_dates[i],
+            "first_value": first_values[i],
+        }
+        for i, name in enumerate(fund_names)
+    ]
+    return table_entry, locations
+
+
+def build_table_index(tables_dir: Path, encoding: str = TABLE_ENCODING) -> Dict[str, Any]:
+    """Scans every fund table in `tables_dir` and returns a fresh index dictionary."""
+    index: Dict[str, Any] = {"version": INDEX_VERSION, "encoding": encoding, "tables": {}, "funds": {}, "aliases": {}}
+    pending_aliases: List[Tuple[str, str]] = []
+
+    for table_path in list_table_files(tables_dir):
+        try:
+            table_entry, locations = _index_table(table_path, encoding)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            print(f"Warning: Could not index {table_path.name}: {e}. Skipping.", file=sys.stderr)
+            continue
+        index["tables"][table_path.name] = table_entry
+        for location in locations:
+            name = location.pop("name")
+            aliases = location.pop("aliases")
+            # Keep the first occurrence, as the loaders do for duplicate columns
+            if name not in index["funds"]:
+                index["funds"][name] = location
+                pending_aliases.extend((alias, name) for alias in aliases)
+
+    for alias, name in pending_aliases:
+        if alias not in index["funds"]:
+            index["aliases"].setdefault(alias, name)
+    return index
+
+
+def _index_is_current(index: Dict[str, Any], tables_dir: Path, encoding: str) -> bool:
+    if index.get("version") != INDEX_VERSION or index.get("encoding") != encoding:
+        return False
+    table_paths = list_table_files(tables_dir)
+    if sorted(index.get("tables", {})) != sorted(p.name for p in table_paths):
+        return False
+    for table_path in table_paths:
+        entry = index["tables"][table_path.name]
+        if {k: entry.get(k) for k in ("size", "mtime_ns")} != _table_signature(table_path):
+            return False
+    return True
+
+
+def load_table_index(tables_dir: Path, encoding: str = TABLE_ENCODING, index_path: Path | None = None) -> Dict[str, Any]:
+    """
+    Returns the fund table index for `tables_dir`, rebuilding and saving it if it is
+    missing or any table changed since it was written. If the index cannot be saved
+    (e.g. read-only checkout) the freshly built index is still returned.
+    """
+    index_path = index_path or tables_dir / INDEX_FILE_NAME
+    try:
+        with index_path.open("r", encoding="utf-8") as f:
+            index = json.load(f)
+        if _index_is_current(index, tables_dir, encoding):
+            return index
+        print(f"Info: Fund table index {index_path} is stale, rebuilding.", file=sys.stderr)
+    except FileNotFoundError:
+        print(f"Info: No fund table index at {index_path}, building it.", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read fund table index {index_path}: {e}. Rebuilding.", file=sys.stderr)
+
+    index = build_table_index(tables_dir, encoding)
+    try:
+        with atomic_replace(index_path) as tmp_path, tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"Warning: Could not save fund table index to {index_path}: {e}", file=sys.stderr)
+    return index
+
+
+def resolve_fund_name(index: Dict[str, Any], name: str) -> str | None:
+    """Returns the table column name for a fund name or alias, or None if unknown."""
+    if name in index["funds"]:
+        return name
+    return index["aliases"].get(name)
+
+
+def parse_decimal_comma(cell: str) -> float:
+    """Converts one comma-decimal table cell to float; blanks and malformed cells become NaN."""
+    cell = cell.strip()
+    if not cell:
+        return math.nan
+    try:
+        return float(cell.replace(",", "."))
+    except ValueError:
+        return math.nan
+
+
+def parse_table_values(table_path: Path | bytes, since: str | None = None, until: str | None = None,
+                       encoding: str = TABLE_ENCODING, dtype: Any = np.float64) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    Streams a fund table (a file or its raw bytes) into (dates, fund_names, values), values being a len(dates) x len(fund_names)
+    array with NaN for blank or malformed cells. Rows whose first field is not a YYYY-MM-DD date, or
+    that lie outside [since, until], are skipped. As with the pandas loader, header columns beyond
+    the widest data row are dropped.
+    Raises ValueError if the two '# ;' header lines are missing.
+    """
+    fund_names, _, data_offset = read_table_headers(table_path, encoding)
+    n_columns = len(fund_names)
+    values = np.full((1024, n_columns), np.nan, dtype=dtype)
+    dates: List[str] = []
+    widest_row = 0
+
+    with _open_table(table_path) as f:
+        f.seek(data_offset)
+        for raw_line in f:
+            line = raw_line.decode(encoding).rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split(";")
+            widest_row = max(widest_row, len(fields) - 1)
+            date_str = fields[0].strip()
+            if not _looks_like_date(date_str) or not date_in_range(date_str, since, until):
+                continue
+            if len(dates) == values.shape[0]:
+                grown = np.full((2 * values.shape[0], n_columns), np.nan, dtype=dtype)
+                grown[:len(dates)] = values
+                values = grown
+            cells = fields[1:n_columns + 1]
+            values[len(dates), :len(cells)] = [parse_decimal_comma(cell) for cell in cells]
+            dates.append(date_str)
+
+    n_kept_columns = min(n_columns, widest_row)
+    return dates, fund_names[:n_kept_columns], values[:len(dates), :n_kept_columns]
+
+
+def first_values_for_bundles(index: Dict[str, Any], fund_bundles: Dict[str, List[str]]) -> Dict[str, Tuple[str, float]]:
+    """
+    Returns {canonical name: (first date, first log value)} over each bundle's alias columns.
+    When aliases start on the same date the earlier alias wins, matching bundle_funds' combine_first.
+    """
+    anchors: Dict[str, Tuple[str, float]] = {}
+    for canonical_name, aliases in fund_bundles.items():
+        for alias in aliases:
+            location = index["funds"].get(alias)
+            if location is None or location.get("first_date") is None:
+                continue
+            if canonical_name not in anchors or location["first_date"] < anchors[canonical_name][0]:
+                anchors[canonical_name] = (location["first_date"], location["first_value"])
+    return anchors
+
+
+def read_fund_columns(tables_dir: Path, index: Dict[str, Any], names: List[str],
+                      since: str | None = None, until: str | None = None) -> Tuple[List[str], Dict[str, List[float]]]:
+    """
+    Reads only the columns for `names` (fund names or aliases) using the index.
+    Each table holding a requested fund is read once, starting at the first row with data for
+    any requested fund in it and stopping after the last such row.
+    Returns (dates, {column_name: values}) where dates are the sorted 'YYYY-MM-DD' strings on
+    which at least one requested fund has a value and each values list is aligned to dates
+    (NaN where absent).
+    Rows dated outside [since, until] are skipped. Unknown names are skipped with a warning.
+    """
+    encoding = index.get("encoding", TABLE_ENCODING)
+    by_table: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for name in names:
+        column_name = resolve_fund_name(index, name)
+        if column_name is None:
+            print(f"Warning: Fund '{name}' not found in fund table index.", file=sys.stderr)
+            continue
+        location = index["funds"][column_name]
+        if location["first_offset"] is None:
+            continue # Column exists but holds no data
+        group = by_table.setdefault(location["table"], [])
+        if all(existing != column_name for existing, _ in group):
+            group.append((column_name, location))
+
+    per_column: Dict[str, Dict[str, float]] = {}
+    for table_name, group in by_table.items():
+        start = min(loc["first_offset"] for _, loc in group)
+        end = max(loc["end_offset"] for _, loc in group)
+        for column_name, _ in group:
+            per_column[column_name] = {}
+        with (tables_dir / table_name).open("rb") as f:
+            f.seek(start)
+            block = f.read(end - start).decode(encoding)
+        for line in block.splitlines():
+            fields = line.split(";")
+            date_str = fields[0].strip()
+            if not date_str or date_str.startswith("#") or not date_in_range(date_str, since, until):
+                continue
+            for column_name, loc in group:
+                field = loc["field"]
+                if field < len(fields) and fields[field].strip():
+                    per_column[column_name][date_str] = parse_decimal_comma(fields[field])
+
+    dates = sorted({d for values in per_column.values() for d in values})
+    columns = {name: [values.get(d, math.nan) for d in dates] for name, values in per_column.items()}
+    return dates, columns
@@ -0,0 +1,55 @@
+"""fund_top_k.py
+
+Top-K selection for the ranking tables (`fund_momentum_emailer.py --top-k`,
+`fund_service.py`).
+
+`top_k_positions` selects the K best of N scores with `np.argpartition` (O(N))
+and sorts only those K, instead of sorting all N. The order is deterministic:
+higher scores first (lower with ascending=True), ties in original row order, as
+a stable sort would give, and NaN scores last. Rows tied with the K-th score are
+all taken into account before the cut, so which tied row makes the table never
+depends on the partition.
+
+The K best in order are a prefix of the 2K best in order, so tables for several
+K values can be sliced from one selection with the largest K. `rank_values`
+gives every row its place in that order (the rank it would have in a table of
+all rows).
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_TOP_K = 20
+
+
+def top_k_positions(scores, k: int, ascending: bool = False) -> np.ndarray:
+    """Positions of the `k` best `scores` (array-like), best first; ties in position order, NaN last."""
+    values = np.asarray(scores, dtype=np.float64)
+    k = max(0, min(int(k), len(values)))
+    if k == 0:
+        return np.zeros(0, dtype=np.intp)
+    missing = np.isnan(values)
+    keys = np.where(missing, np.inf, values if ascending else -values) # Ascending keys; NaN sorts with +inf, then after it
+    candidates = np.arange(len(values))
+    if k < len(values):
+        candidates = np.argpartition(keys, k - 1)[:k]
+        kth_key = keys[candidates].max()
+        # Everything tied with the k-th key competes for the last places on (NaN flag, position)
+        candidates = np.union1d(candidates[keys[candidates] < kth_key], np.flatnonzero(keys == kth_key))
+    order = np.lexsort((candidates, keys[candidates], missing[candidates]))
+    return candidates[order][:k]
+
+
+def top_k_rows(df: pd.DataFrame, column: str, k: int, ascending: bool = False) -> pd.DataFrame:
+    """The `k` rows of `df` with the best `column` values, best first (see top_k_positions)."""
+    return df.iloc[top_k_positions(df[column].to_numpy(dtype=np.float64, na_value=np.nan), k, ascending)]
+
+
+def rank_values(scores, ascending: bool = False) -> np.ndarray:
+    """Rank (1 = best) of every score in top_k_positions order, as floats; NaN scores get NaN."""
+    values = np.asarray(scores, dtype=np.float64)
+    ranks = np.full(len(values), np.nan)
+    ranks[top_k_positions(values, len(values), ascending)] = np.arange(1, len(values) + 1)
+    ranks[np.isnan(values)] = np.nan
+    return ranks
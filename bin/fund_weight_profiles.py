@@ -0,0 +1,88 @@
+"""fund_weight_profiles.py
+
+Named scoring weight profiles, read from a YAML file (default: bin/weight_profiles.yaml).
+
+    lag_adjusted:            # fund_momentum_emailer.py: weights of the lookback z-scores
+      <name>: {1m: 0.40, 3m: 0.35, 6m: 0.20, 1y: 0.05}
+    long_term:               # fund_momentum_emailer.py: long-term penalty parameters
+      <name>: {threshold_1y: 0.0, penalty_factor_1y: 0.5, threshold_2m: -0.05, penalty_factor_2m: 0.3}
+    bar:                     # interactive_fund_plot.py --bar: slider presets, one weight per window
+      <name>: [0.3, 1.5, 2.5, 4, 3, 2, 1.5, 1]
+
+Every section is optional. The emailer scores all lag-adjusted profiles with one
+product of the fund x lookback z-score matrix and a lookback x profile weight
+matrix, and all long-term parameter sets with one broadcast over a fund x set
+matrix, so N profiles cost one pass instead of N runs. Lookback keys are checked
+by the emailer, bar preset lengths by the plot tool.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+SCRIPT_DIR = Path(os.path.abspath(__file__)).parent
+DEFAULT_WEIGHT_PROFILES_FILE = SCRIPT_DIR / "weight_profiles.yaml"
+PROFILE_SECTIONS = ("lag_adjusted", "long_term", "bar")
+LONG_TERM_PARAMETERS = ("threshold_1y", "penalty_factor_1y", "threshold_2m", "penalty_factor_2m")
+
+
+def _number(value: Any, where: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where}: expected a number, got {value!r}")
+    return float(value)
+
+
+def parse_weight_profiles(yaml_text: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses and checks a weight profile document. Returns {section: {profile name: profile}} for all
+    three sections (missing ones empty): lag_adjusted profiles as {lookback key: weight}, long_term
+    ones as {parameter: value} with all LONG_TERM_PARAMETERS, bar ones as [weight, ...].
+    Raises ValueError on an unknown section or parameter, a missing parameter or a non-numeric weight.
+    """
+    import yaml # Deferred: interactive_fund_plot.py imports this module for every run, the YAML parser only with --weight-profiles
+
+    document = yaml.safe_load(yaml_text) or {}
+    if not isinstance(document, dict):
+        raise ValueError("The weight profile file must map section names to profiles")
+    unknown_sections = [section for section in document if section not in PROFILE_SECTIONS]
+    if unknown_sections:
+        raise ValueError(f"Unknown weight profile section(s) {unknown_sections}; known: {', '.join(PROFILE_SECTIONS)}")
+
+    profiles: Dict[str, Dict[str, Any]] = {section: {} for section in PROFILE_SECTIONS}
+    for section in PROFILE_SECTIONS:
+        entries = document.get(section) or {}
+        if not isinstance(entries, dict):
+            raise ValueError(f"Section '{section}' must map profile names to profiles")
+        for name, profile in entries.items():
+            where = f"{section}.{name}"
+            if section == "bar":
+                if not isinstance(profile, list) or not profile:
+                    raise ValueError(f"{where}: expected a list of weights")
+                profiles[section][str(name)] = [_number(weight, where) for weight in profile]
+                continue
+            if not isinstance(profile, dict) or not profile:
+                raise ValueError(f"{where}: expected a mapping")
+            if section == "lag_adjusted":
+                profiles[section][str(name)] = {str(period): _number(weight, f"{where}.{period}") for period, weight in profile.items()}
+            else:
+                unknown = [key for key in profile if key not in LONG_TERM_PARAMETERS]
+                missing = [key for key in LONG_TERM_PARAMETERS if key not in profile]
+                if unknown or missing:
+                    raise ValueError(f"{where}: unknown parameter(s) {unknown}, missing {missing}")
+                profiles[section][str(name)] = {key: _number(profile[key], f"{where}.{key}") for key in LONG_TERM_PARAMETERS}
+    return profiles
+
+
+def load_weight_profiles(path: Path = DEFAULT_WEIGHT_PROFILES_FILE) -> Dict[str, Dict[str, Any]]:
+    """Reads and parses a weight profile file (see parse_weight_profiles)."""
+    return parse_weight_profiles(Path(path).read_text(encoding="utf-8"))
+
+
+def bar_presets(profiles: Dict[str, Dict[str, Any]], windows: Sequence[int]) -> Dict[str, List[float]]:
+    """The bar presets of `profiles`; raises ValueError unless each has one weight per window."""
+    presets = profiles.get("bar", {})
+    for name, weights in presets.items():
+        if len(weights) != len(windows):
+            raise ValueError(f"bar.{name}: {len(weights)} weights for {len(windows)} windows ({', '.join(map(str, windows))} days)")
+    return presets
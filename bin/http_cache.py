@@ -0,0 +1,127 @@
+"""http_cache.py
+
+HTTP layer of `fund_momentum_emailer.fetch_data` for remote bundle files
+(YAML_DATA_URL=http(s)://...): one pooled `requests` session with retry and
+backoff, conditional GETs against an on-disk cache, and the cached copy as a
+fallback when the remote is down.
+
+For every URL the cache directory holds `<sha256 of the URL>.body` (the last
+downloaded content) and `<same>.json` (the URL, its ETag and Last-Modified
+headers, the Content-Type and when it was fetched). A request for a cached URL
+sends If-None-Match / If-Modified-Since; a 304 answer returns the cached body
+without transferring it again. Connection errors, timeouts and 429/5xx answers
+are retried RETRIES times with exponential backoff (honouring Retry-After);
+if the server is still unreachable or failing, the cached body is returned
+with a warning on stderr. Other HTTP errors (e.g. 404) are raised. Both files
+are replaced with output_cache.write_atomic, the body first, so the metadata
+never describes a body that was not stored.
+
+The cache directory is HTTP_CACHE_DIR (default: .http_cache in the project
+root). `fetch_url` takes a cache directory and a session, so it can be pointed
+at a stand-in server (http.server) and a scratch directory.
+
+Python deps: requests (imported on first use)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from output_cache import write_atomic
+
+PROJECT_ROOT_DIR = Path(os.path.abspath(__file__)).parent.parent
+DEFAULT_CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", PROJECT_ROOT_DIR / ".http_cache"))
+TIMEOUT_S = 30
+RETRIES = 3
+BACKOFF_FACTOR = 0.5 # Seconds; waits 0.5, 1, 2, ... between attempts
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+
+
+def get_session():
+    """The process-wide requests session: pooled keep-alive connections and retry with backoff for GET."""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET"]), respect_retry_after_header=True, raise_on_status=False)
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def cache_paths(cache_dir: Path, url: str) -> Tuple[Path, Path]:
+    stem = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return Path(cache_dir) / f"{stem}.body", Path(cache_dir) / f"{stem}.json"
+
+
+def load_cached(cache_dir: Path, url: str) -> Tuple[bytes, Dict[str, Any]] | None:
+    """The cached (body, metadata) of `url`, or None."""
+    body_path, meta_path = cache_paths(cache_dir, url)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("url") != url:
+            return None
+        return body_path.read_bytes(), meta
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def store_cached(cache_dir: Path, url: str, body: bytes, headers) -> Dict[str, Any]:
+    body_path, meta_path = cache_paths(cache_dir, url)
+    meta = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type"),
+            "fetched_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+    write_atomic(body_path, body)
+    write_atomic(meta_path, json.dumps(meta, indent=1).encode("utf-8"))
+    return meta
+
+
+def fetch_url(url: str, cache_dir: Path | None, session=None, timeout: float = TIMEOUT_S) -> Tuple[bytes, Dict[str, Any], str]:
+    """
+    Returns (body, metadata, source) for `url`, where source is 'downloaded', 'not-modified' (304, body
+    from the cache) or 'stale-cache' (remote unreachable or failing, body from the cache). cache_dir=None
+    disables the cache. Raises requests.exceptions.RequestException when there is nothing to fall back to.
+    """
+    import requests
+
+    session = session or get_session()
+    cached = load_cached(cache_dir, url) if cache_dir is not None else None
+    headers = {}
+    if cached:
+        if cached[1].get("etag"):
+            headers["If-None-Match"] = cached[1]["etag"]
+        if cached[1].get("last_modified"):
+            headers["If-Modified-Since"] = cached[1]["last_modified"]
+    try:
+        resp = session.get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and cached:
+            return cached[0], cached[1], "not-modified"
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        if cached and (status is None or status in RETRY_STATUSES):
+            print(f"Warning: {url} unavailable ({e}); using the copy cached {cached[1].get('fetched_utc', '?')}", file=sys.stderr)
+            return cached[0], cached[1], "stale-cache"
+        raise
+    meta = store_cached(cache_dir, url, resp.content, resp.headers) if cache_dir is not None else {"content_type": resp.headers.get("Content-Type")}
+    return resp.content, meta, "downloaded"
+
+
+def fallback_encoding(meta: Dict[str, Any]) -> str:
+    """The charset of the stored Content-Type, else what requests would assume for it."""
+    from requests.utils import get_encoding_from_headers
+
+    return get_encoding_from_headers({"content-type": meta.get("content_type") or ""}) or "utf-8"
@@ -1,13 +1,13 @@
 """
 # Synopsis
 
-`python3 interactive_fund_plot.py [--bar] [-t  <directory>]  -r <directory> | :internal:`
+`python3 interactive_fund_plot.py [--bar [--top-k <K>] [--weight-profiles [<file>]]] [--fund <names>] [--since <YYYY-MM-DD>] [--until <YYYY-MM-DD>] [--profile <file>] [--cache-dir <directory>] [-t  <directory>]  -r <directory> | :internal:`
 
 Generates interactive fund series charts from CSV files.
 Supports:
 - Directory mode: Reads all fund_tables_<n>.csv in a directory, outputs individual HTMLs and a master index.
 - STDIN mode: Reads a single CSV from stdin if no -t provided, outputs one chart.
-- `-r :internal:` mode: Stores HTML in-memory (internal_html) and prints the master HTML to STDOUT.
+- `-r :internal:` mode: Streams the master HTML to STDOUT, rendering one chart at a time.
 - `--bar`: Creates fund score performance chart with change gradients
 
 # Description
@@ -39,6 +39,7 @@ The charts all converge to value 0 (zero) at the end which is the latest date. T
   If '`:internal:`' is given no individual fund charts will be written and the aggregated html containing all charts will be printed on STDOUT. See examples below.
 - -t
   Specifies the directory where the csv fund tables that were generated by `slice_fond_files.pl` are located. The csv fund tables are expected to have names as '`fund_tables_<number>.csv'`. This is how the names will be created by the analysis part '`slice_fond_files.pl`'.
+  Instead of a directory, `-t` can also be given the archive '`fund_tables.zip`' or the concatenated file '`fund_tables_concat.txt`' that `slice_fond_files.pl` writes next to the tables. The tables are then read straight from that file without extracting anything to disk.
   If `-t` is omitted, input is expected on STDIN in the same format as the the csv fund tables. Only one csv table is expected when receiving from STDIN. If a directory is given with `-r` the result will be written to the file '`fund_series_chart.html`'. If `-r :internal:` is given the output will to STDOUT. See examples below.
 
 - --trace
@@ -46,6 +47,39 @@ The charts all converge to value 0 (zero) at the end which is the latest date. T
   Important for the weight calculations as the weight window will be set to zero if there are not enough data points for the period, and all longer periods.
   Short data availability (e.g. for new funds) will heavily affect fund scoring since only the shorter periods will be included in the score.
 
+- --top-k
+  Works in conjunction with the `--bar` switch. Number of funds listed in the dashboard's fund table (default 20). The table picks the best funds for the current weights and sort column with a bounded heap instead of sorting all funds on every slider change; funds with equal values keep their alphabetical order.
+
+- --weight-profiles
+  Works in conjunction with the `--bar` switch. Adds the `bar` presets of a weight profile YAML file (default when no file is given: '`bin/weight_profiles.yaml`') to the dashboard as a selector next to the Defaults button; choosing a preset sets all weight sliders at once. Each preset lists one weight per window, shortest window first. The same file holds the `lag_adjusted` and `long_term` profiles that `fund_momentum_emailer.py --weight-profiles` ranks the funds under.
+
+- --fund
+  Comma-separated list of fund names to plot (or score together with `--bar`), e.g. `--fund "seb teknologifond","avanza zero"`. Former fund names listed in the table headers are also accepted.
+  Only the columns of these funds are read. Their table file, column and byte range are looked up in the fund table index '`fund_tables_index.json`' in the `-t` directory, which is created on first use and rebuilt automatically when the tables change.
+  Without `--bar` a single chart '`fund_series_chart_selected.html`' is written to the `-r` directory (or to STDOUT with `-r :internal:`).
+
+- --since, --until
+  Only read table rows dated on or after `--since` and/or on or before `--until` (`YYYY-MM-DD`). Rows outside the range are dropped while the tables are read, before they are parsed. Works in all modes, including STDIN.
+  With `--bar`, periods longer than the loaded range get weight zero in the same way as for funds with short histories.
+
+- --profile
+  Writes a JSON document to the given file with wall time, CPU time and `tracemalloc` memory peak for each stage: `read`, `reindex_interpolate`, `figure_build`, `serialize`, `write` and, with `--bar`, `bar_regression`. Stages run once per table are summed and `calls` counts them. `fund_momentum_emailer.py --profile` writes the same format, so nightly profiles can be archived and diffed. Profiling slows the run down.
+
+- --cache-dir
+  Content-addressed output cache for the page printed with `-r :internal:` (not for STDIN input). The key is a SHA-256 hash of the table bytes, the options that change the page (`--bar`, `--fund`, `--since`, `--until`, `--top-k` and the `--weight-profiles` presets) and the code version (this script, the modules it imports from `bin/` and the numpy, pandas and plotly versions). When a page with that key was printed before, it is printed again from the cache directory without parsing the tables or building any chart; STDERR reports `Output cache hit <key>` or `Output cache miss <key>`. The most recently used pages are kept. `fund_momentum_emailer.py --cache-dir` caches its ranked tables the same way.
+
+# Library use
+
+The script can be imported (with `bin/` on `sys.path`) to render charts in a long-running process without starting Python, pandas and plotly again for every page. Everything works on price frames: a pandas DataFrame with a DatetimeIndex and one column of log10 values per fund, as in the fund tables.
+
+- `table_to_prices(read_fund_table(source, since=None, until=None))` reads one fund table (path, bytes or text stream) into a price frame.
+- `fund_chart_html(prices, title)` returns a standalone chart page.
+- `charts_page_html({chart_id: prices, ...})` returns the single page that `-r :internal:` prints; `write_charts_page(stream, ...)` streams it one chart at a time.
+- `bar_dashboard_html(series_by_fund, weight_presets=None, top_k=20)` returns the `--bar` dashboard and `write_bar_dashboard(stream, series_by_fund, weight_presets=None, top_k=20)` streams it (`weight_presets` is `{name: [weight per window]}` for the preset selector, `top_k` the table length); `bar_series_from_prices(prices)` gives the `series_by_fund` input.
+- `profiler` is a disabled `StageProfiler`; replace it with an enabled one to profile library calls.
+
+`main(argv)` is the command line.
+
 # Examples
 
 - Read all csv tables in directory '`../tables`' named ' `fund_tables_<number>.csv'` and create a fund chart for each table in directory '`../results`'. Charts will be named '`fund_series_chart_<number>.html`'.
@@ -71,46 +105,48 @@ The charts all converge to value 0 (zero) at the end which is the latest date. T
 - Create fund performance chart and print on STDOUT
 
   `python3 bin/interactive_fund_plot.py --bar -t tables -r :internal: > results/fund_series_scores.stdout.html
+
+- Plot two funds only, without parsing the other tables
+
+  `python3 bin/interactive_fund_plot.py --fund "seb teknologifond","avanza zero" -t tables -r :internal: > results/selected_funds.html`
+
+- Create the fund charts straight from the zip archive
+
+  `python3 bin/interactive_fund_plot.py -t tables/fund_tables.zip -r :internal: > results/fund_series_charts.stdout.html`
+
+- Create the fund performance chart, reusing yesterday's page if the tables have not changed
+
+  `python3 bin/interactive_fund_plot.py --bar -t tables -r :internal: --cache-dir .output_cache > results/fund_series_scores.stdout.html`
+
+- Plot the last year only
+
+  `python3 bin/interactive_fund_plot.py --since 2024-05-21 -t tables -r :internal: > results/fund_series_charts_last_year.html`
 """
 
 import os
-import re
 import sys
 import argparse
+import atexit
+import csv
 import json
+import shutil
 import html # Added for HTML escaping
+from io import BytesIO, StringIO
+from pathlib import Path
 import numpy as np
 import pandas as pd
-import plotly.graph_objs as go
-import plotly.utils # Added this import for PlotlyJSONEncoder
+# plotly is imported by the functions that build figures; it is the slowest import and --help or
+# argument errors should not wait for it
 
-# Parse command-line arguments
-parser = argparse.ArgumentParser(
-    description='Generate fund series charts from CSVs; supports time-series, bar-score mode, and stdin.'
-)
-parser.add_argument(
-    '-t', dest='input_dir', default='.',
-    help='Directory containing fund_tables_<n>.csv'
-)
-parser.add_argument(
-    '-r', dest='output_dir', default='.',
-    help='Directory to save HTML or ":internal:" to output HTML to stdout'
-)
-parser.add_argument(
-    '--bar', dest='bar_mode', action='store_true',
-    help='Generate performance bar chart instead of time-series'
-)
-parser.add_argument(
-    '--trace', dest='trace_mode', action='store_true',
-    help='Enable diagnostic trace messages to STDERR for bar chart mode calculations.'
-)
-args = parser.parse_args()
+from stage_profiler import StageProfiler
+from fund_bar_scores import BAR_WINDOWS, BAR_INIT_WEIGHTS, BAR_PERIOD_LABELS, GRADIENT_LOOKBACK_DAYS, score_funds
+from fund_tables_io import load_table_index, read_fund_columns, filter_table_lines, iso_date_arg, iter_table_sources, TABLE_NAME_PATTERN
+from fund_top_k import DEFAULT_TOP_K
+from fund_weight_profiles import DEFAULT_WEIGHT_PROFILES_FILE, load_weight_profiles, bar_presets
+from output_cache import artifact_tempfile, cache_key, code_version, find_artifact, short_key, store_artifact_file, table_source_digest
 
-# Determine modes
-internal_only = (args.output_dir == ':internal:')
-use_stdin = (args.input_dir == '.' and not sys.stdin.isatty()) # Check if not a TTY and input_dir is default
-if not internal_only and not use_stdin and not os.path.exists(args.output_dir) :
-    os.makedirs(args.output_dir, exist_ok=True)
+# Stage profile; main() replaces it with an enabled profiler for --profile. Library callers can do the same.
+profiler = StageProfiler('interactive_fund_plot', enabled=False)
 
 # Common pandas CSV options
 df_kwargs = dict(
@@ -118,6 +154,17 @@ df_kwargs = dict(
     parse_dates=[0], dayfirst=False, na_values=[''], encoding='latin1'
 )
 
+# Read one fund table (path, raw bytes or text stream) with df_kwargs; with since/until (YYYY-MM-DD), rows outside the range are dropped before parsing
+def read_fund_table(source, since=None, until=None):
+    with profiler.stage('read'):
+        if isinstance(source, bytes): source = BytesIO(source) if not (since or until) else StringIO(source.decode(df_kwargs['encoding']))
+        if not (since or until): return pd.read_csv(source, **df_kwargs)
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, encoding=df_kwargs['encoding']) as f: text = ''.join(filter_table_lines(f, since, until))
+        else:
+            text = ''.join(filter_table_lines(source, since, until))
+        return pd.read_csv(StringIO(text), **{k: v for k, v in df_kwargs.items() if k != 'encoding'})
+
 # --- JavaScript snippets for individual charts OR single page ---
 
 styling_constants_js = """
@@ -339,11 +386,178 @@ selection_and_hover_js_logic = """
 """
 
 
+internal_master_js = r"""
+<script>
+    // [SINGLE-PAGE MASTER JS] Loaded
+    document.addEventListener('DOMContentLoaded', function() {
+        const globalFundSelector = document.getElementById('global-fund-selector');
+        const applyFundSelectionButton = document.getElementById('apply-fund-selection');
+        const resetFundSelectionButton = document.getElementById('reset-fund-selection');
+        const createOverlayChartButton = document.getElementById('create-overlay-chart');
+        const overlayChartContainer = document.getElementById('overlay-chart-container');
+        const overlayChartPlotDiv = document.getElementById('overlay-chart-plot-inner');
+        const closeOverlayButton = document.getElementById('close-overlay-button');
+        let currentSelectedFundsForMaster = [];
+
+        if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); }
+
+        function handleSelectionChange() {
+            const selectedOptionsRaw = globalFundSelector ? Array.from(globalFundSelector.selectedOptions).map(opt => opt.value) : [];
+            currentSelectedFundsForMaster = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { console.error('[SINGLE-PAGE] Error parsing option value for master:', val, e); return null; } }).filter(value => value !== null);
+            if (typeof updateAllChartsOnPage === 'function') { updateAllChartsOnPage(currentSelectedFundsForMaster); }
+            else { console.error('[SINGLE-PAGE] updateAllChartsOnPage function not found.'); }
+        }
+
+        if (applyFundSelectionButton) { applyFundSelectionButton.addEventListener('click', handleSelectionChange); }
+        if (resetFundSelectionButton) { resetFundSelectionButton.addEventListener('click', function() { if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); } handleSelectionChange(); }); }
+
+        if (createOverlayChartButton) {
+            createOverlayChartButton.addEventListener('click', function() {
+                if (currentSelectedFundsForMaster.length === 0) {
+                    const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "Select funds first!"; setTimeout(() => { createOverlayChartButton.textContent = ob; }, 2000); return;
+                }
+                let overlayTraces = [];
+                document.querySelectorAll('.plotly-graph-div').forEach(gdElement => {
+                    if (gdElement.id === 'overlay-chart-plot-inner' || !gdElement.data || !gdElement.layout) return; // Skip overlay div itself and non-plotly divs
+                    gdElement.data.forEach(trace => {
+                        const baseTraceName = (trace.name || '').split('<br>')[0];
+                        if (currentSelectedFundsForMaster.includes(baseTraceName)) { overlayTraces.push(JSON.parse(JSON.stringify(trace))); }
+                    });
+                });
+                if (overlayTraces.length > 0) {
+                    const uniqueOverlayTraces = []; const seenFundNames = new Set();
+                    for (const trace of overlayTraces) { const baseName = (trace.name || '').split('<br>')[0]; if (!seenFundNames.has(baseName)) { uniqueOverlayTraces.push(trace); seenFundNames.add(baseName); }}
+
+                    uniqueOverlayTraces.forEach(trace => { // Normalize line styles for overlay
+                        trace.line = trace.line || {};
+                        trace.line.width = typeof defaultLineWidth !== 'undefined' ? defaultLineWidth : 2; // Use global const or fallback
+                        trace.opacity = typeof defaultOpacity !== 'undefined' ? defaultOpacity : 1.0; // Use global const or fallback
+                    });
+
+                    const overlayLayout = { title: 'Selected Funds Overlay', showlegend: true, legend: { traceorder: 'normal' }, yaxis: { zeroline: true, zerolinewidth: 2, title: 'Normalized Value (log10 scale, 0 = Last Date)'}, xaxis: { title: 'Date' }, hovermode: 'closest', template: 'plotly_white', autosize: true };
+                    Plotly.newPlot(overlayChartPlotDiv, uniqueOverlayTraces, overlayLayout);
+                    overlayChartContainer.style.display = 'flex'; // Make container visible
+                    document.body.classList.add('overlay-active');
+                    Plotly.Plots.resize(overlayChartPlotDiv); // Crucial: Resize after visible and plotted
+                } else { const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "No data for selection!"; setTimeout(() => { createOverlayChartButton.textContent = ob; }, 2000); }
+            });
+        }
+        if (closeOverlayButton) { closeOverlayButton.addEventListener('click', function() { overlayChartContainer.style.display = 'none'; document.body.classList.remove('overlay-active'); Plotly.purge(overlayChartPlotDiv); }); }
+        handleSelectionChange(); // Initial call
+    });
+</script>
+"""
+fund_selector_master_js = r"""
+<script>
+    // [PARENT IFRAME MASTER JS] Loaded
+    document.addEventListener('DOMContentLoaded', function() {
+        const globalFundSelector = document.getElementById('global-fund-selector');
+        const applyFundSelectionButton = document.getElementById('apply-fund-selection');
+        const resetFundSelectionButton = document.getElementById('reset-fund-selection');
+        const createOverlayChartButton = document.getElementById('create-overlay-chart');
+        const iframes = document.querySelectorAll('iframe');
+        const overlayChartContainer = document.getElementById('overlay-chart-container');
+        const overlayChartPlotDiv = document.getElementById('overlay-chart-plot-inner');
+        const closeOverlayButton = document.getElementById('close-overlay-button');
+        let currentSelectedFundsForParent = [];
+
+        if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); }
+
+        function dispatchSelectionUpdate() {
+            const selectedOptionsRaw = globalFundSelector ? Array.from(globalFundSelector.selectedOptions).map(opt => opt.value) : [];
+            currentSelectedFundsForParent = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { console.error('[PARENT IFRAME] Error parsing option value:', val, e); return null; }}).filter(value => value !== null);
+            const message = { type: 'fundSelectionUpdate', selectedFunds: currentSelectedFundsForParent };
+            iframes.forEach((iframe) => { if (iframe.contentWindow) { iframe.contentWindow.postMessage(message, '*'); } });
+        }
+
+        if (applyFundSelectionButton) { applyFundSelectionButton.addEventListener('click', dispatchSelectionUpdate); }
+        if (resetFundSelectionButton) { resetFundSelectionButton.addEventListener('click', function() { if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); } dispatchSelectionUpdate(); }); }
+
+        if (createOverlayChartButton) {
+            createOverlayChartButton.addEventListener('click', function() {
+                if (currentSelectedFundsForParent.length === 0) { const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "Select funds first!"; setTimeout(() => {createOverlayChartButton.textContent = ob;}, 2000); return; }
+                let collectedOverlayTraces = [];
+                let expectedResponses = 0;
+                iframes.forEach(iframe => { if (iframe.contentWindow) expectedResponses++; }); // Count only iframes we can message
+
+                let receivedResponses = 0; const requestId = 'overlayDataRequest_' + Date.now();
+
+                if (expectedResponses === 0) {
+                     const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "No charts to overlay!"; setTimeout(() => {createOverlayChartButton.textContent = ob;}, 2000); return;
+                }
+
+                iframes.forEach(iframe => { if (iframe.contentWindow) { iframe.contentWindow.postMessage({ type: 'getFundDataForOverlay', selectedFunds: currentSelectedFundsForParent, requestId: requestId }, '*'); }});
+
+                const responseTimeout = setTimeout(() => { if (receivedResponses < expectedResponses) { console.warn(`Timeout: Received responses from ${receivedResponses}/${expectedResponses} iframes for overlay data.`); } finalizeOverlayChart(collectedOverlayTraces); window.removeEventListener('message', handleIframeDataResponse);}, 5000);
+
+                function handleIframeDataResponse(event) {
+                    if (event.data && event.data.type === 'fundDataResponse' && event.data.requestId === requestId) {
+                        if (event.data.traces && Array.isArray(event.data.traces)) { collectedOverlayTraces.push(...event.data.traces); }
+                        receivedResponses++;
+                        if (receivedResponses === expectedResponses) { clearTimeout(responseTimeout); finalizeOverlayChart(collectedOverlayTraces); window.removeEventListener('message', handleIframeDataResponse); }
+                    }
+                }
+                window.addEventListener('message', handleIframeDataResponse);
+            });
+        }
+
+        function finalizeOverlayChart(traces) {
+            if (traces.length > 0) {
+                const uniqueOverlayTraces = []; const seenFundNames = new Set();
+                for (const trace of traces) { const baseName = (trace.name || '').split('<br>')[0]; if (!seenFundNames.has(baseName)) { uniqueOverlayTraces.push(trace); seenFundNames.add(baseName); }}
+
+                uniqueOverlayTraces.forEach(trace => { // Normalize line styles for overlay
+                    trace.line = trace.line || {};
+                    trace.line.width = 2; // Standard thin line width (use global defaultLineWidth if available)
+                    trace.opacity = 1.0;  // Standard full opacity (use global defaultOpacity if available)
+                });
+
+                const overlayLayout = { title: 'Selected Funds Overlay (from iFrames)', showlegend: true, legend: { traceorder: 'normal' }, yaxis: { zeroline: true, zerolinewidth: 2, title: 'Normalized Value (log10 scale, 0 = Last Date)'}, xaxis: { title: 'Date' }, hovermode: 'closest', template: 'plotly_white', autosize: true };
+                Plotly.newPlot(overlayChartPlotDiv, uniqueOverlayTraces, overlayLayout);
+                overlayChartContainer.style.display = 'flex';
+                document.body.classList.add('overlay-active');
+                Plotly.Plots.resize(overlayChartPlotDiv); // Resize after visible
+            } else { const ob = document.getElementById('create-overlay-chart').textContent; document.getElementById('create-overlay-chart').textContent = "No data for selection!"; setTimeout(() => { document.getElementById('create-overlay-chart').textContent = ob; }, 2000); }
+        }
+
+        if (closeOverlayButton) { closeOverlayButton.addEventListener('click', function() { overlayChartContainer.style.display = 'none'; document.body.classList.remove('overlay-active'); Plotly.purge(overlayChartPlotDiv); }); }
+
+        window.addEventListener('message', function(event) {
+            if (event.data && event.data.type === 'iframeReady') {
+                if (event.source && globalFundSelector) {
+                    const selectedOptionsRaw = Array.from(globalFundSelector.selectedOptions).map(opt => opt.value);
+                    const selectedFundsOnInit = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { return null; }}).filter(value => value !== null);
+                    event.source.postMessage({ type: 'fundSelectionUpdate', selectedFunds: selectedFundsOnInit }, '*');
+                }
+            }
+        });
+        dispatchSelectionUpdate(); // Initial dispatch
+    });
+</script>
+"""
+
+# Helper: write HTML lines to a stream as they are produced, separated exactly like "\n".join(lines)
+class HtmlLineWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = False
+
+    def write(self, line):
+        if self.started: self.stream.write('\n')
+        self.stream.write(line)
+        self.started = True
+
+    def write_lines(self, lines):
+        for line in lines: self.write(line)
+
+
 # Helper: build HTML for time-series chart (for individual files)
 def df_to_html_individual_file(df, title=None, last_dates=None):
     num_series = len(df.columns) - 1 if 'Date' in df.columns else len(df.columns)
     base_h = max(500, num_series*25 + 100)
     height_px = int(base_h * 1.5)
+    import plotly.graph_objs as go
+    profiler.start('figure_build')
     fig = go.Figure()
     for col in df.columns:
         if col=='Date': continue
@@ -369,9 +583,11 @@ def df_to_html_individual_file(df, title=None, last_dates=None):
                   autosize=True) # Ensure autosize for individual charts too
     if title: layout['title'] = dict(text=title, x=0.5, xanchor='center')
     fig.update_layout(**layout)
+    profiler.stop('figure_build')
 
     plotly_cdn_script = '<script src="https://cdn.plot.ly/plotly-3.0.1.min.js"></script>'
-    chart_div_and_script = fig.to_html(include_plotlyjs=False, full_html=False)
+    with profiler.stage('serialize'):
+        chart_div_and_script = fig.to_html(include_plotlyjs=False, full_html=False)
     escaped_title = html.escape(title if title else "Fund Series Chart")
 
     html_output = f"""<!DOCTYPE html>
@@ -395,7 +611,9 @@ def df_to_html_chart_content_internal(df, chart_id_suffix, title=None, last_date
     base_h = max(500, num_series*25 + 100)
     height_px = int(base_h * 1.5) # This height is for the container div
     div_id = f"plotlyChartDiv_{chart_id_suffix}"
+    import plotly.graph_objs as go, plotly.utils # plotly.utils for PlotlyJSONEncoder
 
+    profiler.start('figure_build')
     fig = go.Figure()
     for col in df.columns:
         if col=='Date': continue
@@ -414,10 +632,13 @@ def df_to_html_chart_content_internal(df, chart_id_suffix, title=None, last_date
                   autosize=True) # Plotly chart itself will autosize within its div
     if title: layout['title'] = dict(text=title, x=0.5, xanchor='center')
     fig.update_layout(**layout)
+    profiler.stop('figure_build')
 
     chart_div_html = f'<div id="{div_id}" class="plotly-graph-div" style="height:{height_px}px; width:100%;"></div>'
+    profiler.start('serialize')
     fig_data_json = json.dumps(fig.data, cls=plotly.utils.PlotlyJSONEncoder)
     fig_layout_json = json.dumps(fig.layout, cls=plotly.utils.PlotlyJSONEncoder)
+    profiler.stop('serialize')
 
     plotly_script_html = f"""
 <script type="text/javascript">
@@ -433,99 +654,178 @@ def df_to_html_chart_content_internal(df, chart_id_suffix, title=None, last_date
     return chart_div_html + "\n" + plotly_script_html
 
 
-# Bar-chart mode function
-def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
-    # This function remains unchanged as the request is for the standard time-series mode
-    import os, re, json, numpy as np, pandas as pd, plotly.graph_objs as go
-
-    py_windows = [5, 10, 21, 64, 129, 261, 390, 522]
-    py_init_weights = [0.3, 1.5, 2.5, 4, 3, 2, 1.5, 1]
-    py_period_label_map = {
-        5: 'Week', 10: 'Fortnight', 21: 'Month', 64: 'Quarter',
-        129: 'Half year', 261: 'Year', 390: '1.5 years', 522: '2 years'
-    }
-    num_gradient_lookback_days = 10
-
-    def get_window_contributions_py(ys_series, current_windows, fund_name_for_trace, context_label_for_trace):
-        pct_contributions = []
-        if not isinstance(ys_series, np.ndarray): ys_series = np.array(ys_series)
-        for w_val in current_windows:
-            if len(ys_series) < w_val:
-                pct_contributions.append(0.0)
-            else:
-                m, _ = np.polyfit(np.arange(w_val), ys_series[-w_val:], 1)
-                raw_contrib = m * (w_val - 1) * 100
-                pct_contributions.append(raw_contrib if np.isfinite(raw_contrib) else 0.0)
-        return pct_contributions
-
-    pat = re.compile(r'fund_tables_(\d+)\.csv$')
-    all_funds_raw_log_series = {}
-    if not os.path.isdir(input_dir): sys.exit(f"Error: Input directory '{input_dir}' not found.")
-
-    for fname in sorted(f for f in os.listdir(input_dir) if pat.match(f)):
-        try:
-            df_temp = pd.read_csv(os.path.join(input_dir, fname), **df_kwargs)
-            if df_temp.empty: continue
-            for col_name_raw in df_temp.columns:
-                col_name = str(col_name_raw).strip()
-                if col_name.lower() in ['date', 'datum', '#'] or col_name.startswith('Unnamed:') or not col_name: continue
-                current_ys = pd.to_numeric(df_temp[col_name_raw], errors='coerce').dropna().values
-                if len(current_ys) > 0: all_funds_raw_log_series[col_name] = current_ys
-        except Exception as e: print(f"Error processing file {fname}: {e}", file=sys.stderr)
+# --- Library API: price frames in, HTML out ---
+# A price frame is a DataFrame with a DatetimeIndex and one column of log10 values per fund (0 on the fund's latest date),
+# e.g. from table_to_prices(read_fund_table(path)). Each function either returns the page or streams it to a text stream.
+
+# Helper: fund table as returned by read_fund_table -> price frame; raises ValueError if the table holds no data
+def table_to_prices(table_df):
+    if table_df.empty: raise ValueError('table is empty')
+    table_df = table_df.rename(columns={table_df.columns[0]: 'Date'})
+    table_df = table_df.dropna(axis=1, how='all').dropna(subset=['Date'], how='all')
+    if table_df.empty: raise ValueError('no data after NA handling')
+    return table_df.set_index('Date')
+
+# Helper: price frame -> (daily time-interpolated frame with a 'Date' column, {fund: last quote date}) as the charts plot it;
+# raises ValueError if nothing is left to plot
+def daily_chart_frame(prices):
+    prices = prices.dropna(axis=1, how='all')
+    if prices.empty: raise ValueError('no valid series')
+    last_dates={c:prices[c].last_valid_index().strftime('%Y-%m-%d') for c in prices.columns if pd.notna(prices[c].last_valid_index())}
+    if not prices.index.is_monotonic_increasing: prices = prices.sort_index()
+    prices.index = pd.to_datetime(prices.index, errors='coerce')
+    prices = prices[pd.notna(prices.index)]
+    if prices.empty: raise ValueError('no valid dates')
+    min_date, max_date = prices.index.min(), prices.index.max()
+    if pd.isna(min_date) or pd.isna(max_date): raise ValueError('invalid date range')
+
+    with profiler.stage('reindex_interpolate'):
+        idxr=pd.date_range(min_date,max_date,freq='D')
+        df=prices.reindex(idxr).interpolate(method='time').reset_index(names=['Date'])
+    other_columns_df = df.drop(columns=['Date']).dropna(axis=1, how='all')
+    if other_columns_df.empty: raise ValueError('no data series to plot')
+    return pd.concat([df['Date'], other_columns_df], axis=1), last_dates
+
+# Helper: standalone HTML page with one chart of all funds in a price frame
+def fund_chart_html(prices, title='Fund Series Chart'):
+    df, last_dates = daily_chart_frame(prices)
+    return df_to_html_individual_file(df, title=title, last_dates=last_dates)
+
+# Helper: stream the aggregated page. With charts [(chart id, title, daily frame, last dates)] every chart is rendered
+# into the page one at a time (the -r :internal: page; the list is emptied as it goes); otherwise the page embeds the
+# separately written chart files in iframes [{'title': ..., 'content': file name}]. fund_names fill the global selector.
+def write_charts_page(stream, fund_names, charts=None, iframes=()):
+    page = HtmlLineWriter(stream)
+
+    page.write_lines(['<!DOCTYPE html>','<html lang="en">','<head>','  <meta charset="utf-8">',
+               '<meta name="viewport" content="width=device-width, initial-scale=1">',
+               '<title>Aggregated Fund Series Charts</title>',
+               '<style>',
+               '    body { font-family: Arial, sans-serif; margin: 10px; padding: 0; background-color: #f4f4f4; }',
+               '    iframe { border: 1px solid #ccc; margin-bottom: 10px; width:100%; height:850px; }',
+               '    .chart-container { margin-bottom: 20px; padding:10px; background-color: #fff; border: 1px solid #ddd; border-radius: 5px;}',
+               '    #global-selector-area { text-align: center; margin-bottom: 20px; }',
+               '    #fund-selector-container { display: inline-flex; align-items: flex-start; background-color: #fff; padding: 15px; border-radius: 5px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }',
+               '    #global-fund-selector { width: auto; min-width: 300px; max-width: 60%; flex-shrink: 0; border: 1px solid #ccc; border-radius: 4px; padding: 8px; margin-right: 10px; }',
+               '    #fund-selector-buttons { display: flex; flex-direction: column; }',
+               '    .selector-button { padding: 10px 15px; border-radius: 4px; border: none; cursor: pointer; font-size: 14px; color: white; margin-bottom: 10px; width: 150px; text-align: center;}',
+               '    #apply-fund-selection { background-color: #5cb85c; } #apply-fund-selection:hover { background-color: #4cae4c; }',
+               '    #reset-fund-selection { background-color: #d9534f; } #reset-fund-selection:hover { background-color: #c9302c; }',
+               '    #create-overlay-chart { background-color: #007bff; } #create-overlay-chart:hover { background-color: #0056b3; }',
+               '    #overlay-chart-container { position: fixed; top: 0; left: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.7); z-index: 1000; display: none; justify-content: center; align-items: center; }',
+               '    #overlay-chart-content { background-color: white; padding: 20px; border-radius: 10px; box-shadow: 0 0 15px rgba(0,0,0,0.5); width: 90%; height: 90%; position: relative; display: flex; flex-direction: column; }',
+               '    #overlay-chart-plot-inner { flex-grow: 1; width: 100%; height: 100%; }', # Ensures the div takes up space
+               '    #close-overlay-button { position: absolute; bottom: 10px; right: 10px; padding: 8px 12px; background-color: #f44336; color: white; border: none; border-radius: 5px; cursor: pointer; z-index: 1001;}', # Moved to bottom right
+               '    body.overlay-active > *:not(#overlay-chart-container) { filter: blur(5px) brightness(0.7); pointer-events: none; }',
+               '</style>',
+               '<script src="https://cdn.plot.ly/plotly-3.0.1.min.js"></script>'])
 
-    if not all_funds_raw_log_series: sys.exit(f"No valid fund data collected from {input_dir}.")
+    if charts is not None:
+        page.write(styling_constants_js)
+        page.write(selection_and_hover_js_logic) # Included once for internal_only mode
 
-    sorted_fund_names = sorted(all_funds_raw_log_series.keys())
-    output_fund_names, main_score_contributions_list_for_js, initial_scores_list_py, initial_gradients_list_py = [], [], [], []
-    historical_contributions_for_all_funds_js = {}
-    min_total_length_for_gradient = (py_windows[0] if py_windows else 5) + (num_gradient_lookback_days - 1)
+    page.write_lines(['</head>','<body>'])
+    page.write('<h1 style="text-align:center; margin-top:20px; margin-bottom:20px;">Aggregated Fund Series Charts</h1>')
 
-    for fund_name in sorted_fund_names:
-        original_ys = all_funds_raw_log_series[fund_name]
-        output_fund_names.append(fund_name)
-        main_contributions_py = get_window_contributions_py(original_ys, py_windows, fund_name, "MAIN")
-        main_score_contributions_list_for_js.append(main_contributions_py)
-        initial_main_score_py = sum(p * wt for p, wt in zip(main_contributions_py, py_init_weights))
-        initial_scores_list_py.append(initial_main_score_py if np.isfinite(initial_main_score_py) else 0.0)
+    # Global Fund Selector HTML
+    if fund_names:
+        page.write('<div id="global-selector-area">')
+        page.write('  <h3 style="margin-bottom: 10px;">Global Fund Selector</h3>')
+        page.write('  <div id="fund-selector-container">')
+        page.write('    <select id="global-fund-selector" multiple size="10">')
+        for fund_name in sorted(fund_names):
+            json_string_value = json.dumps(fund_name)
+            html_escaped_value_attr = html.escape(json_string_value, quote=True)
+            html_escaped_text_content = html.escape(fund_name)
+            page.write(f'      <option value="{html_escaped_value_attr}">{html_escaped_text_content}</option>')
+        page.write('    </select>')
+        page.write('    <div id="fund-selector-buttons">')
+        page.write('      <button id="apply-fund-selection" class="selector-button">Apply Selection</button>')
+        page.write('      <button id="reset-fund-selection" class="selector-button" title="Clear fund selection">Reset Selection</button>')
+        page.write('      <button id="create-overlay-chart" class="selector-button" title="Overlay selected funds">Overlay Selected</button>')
+        page.write('    </div>')
+        page.write('  </div>')
+        page.write('</div>')
 
-        fund_historical_contrib_sets_for_js = []
-        if len(original_ys) < min_total_length_for_gradient:
-            for _ in range(num_gradient_lookback_days): fund_historical_contrib_sets_for_js.append([0.0] * len(py_windows))
-        else:
-            for k in range(num_gradient_lookback_days):
-                historical_series_segment = original_ys[:len(original_ys) - k]
-                current_hist_contribs = [0.0] * len(py_windows)
-                if len(historical_series_segment) >= (py_windows[0] if py_windows else 5):
-                    renormalized_historical_segment = historical_series_segment - historical_series_segment[-1]
-                    current_hist_contribs = get_window_contributions_py(renormalized_historical_segment, py_windows, fund_name, f"HIST_D-{k}")
-                fund_historical_contrib_sets_for_js.append(current_hist_contribs)
-        historical_contributions_for_all_funds_js[fund_name] = fund_historical_contrib_sets_for_js
-
-        initial_historical_scores_for_gradient = []
-        if len(original_ys) >= min_total_length_for_gradient:
-            for k_init_grad in range(num_gradient_lookback_days):
-                hist_score = sum(p * wt for p, wt in zip(fund_historical_contrib_sets_for_js[k_init_grad], py_init_weights))
-                initial_historical_scores_for_gradient.append(hist_score if np.isfinite(hist_score) else 0.0)
-
-            if len([s for s in initial_historical_scores_for_gradient if np.isfinite(s)]) == num_gradient_lookback_days:
-                slope, _ = np.polyfit(np.arange(num_gradient_lookback_days), initial_historical_scores_for_gradient[::-1], 1)
-                initial_gradients_list_py.append(slope)
-            else: initial_gradients_list_py.append(np.nan)
-        else: initial_gradients_list_py.append(np.nan)
+    # Overlay Container HTML
+    page.write('<div id="overlay-chart-container">')
+    page.write('  <div id="overlay-chart-content">')
+    page.write('    <button id="close-overlay-button">Close</button>')
+    page.write('    <div id="overlay-chart-plot-inner" class="plotly-graph-div"></div>')
+    page.write('  </div>')
+    page.write('</div>')
+
+    if charts is not None:
+        while charts: # Render, write and release one chart at a time
+            chart_id, chart_title, df, last_dates = charts.pop(0)
+            chart_html = df_to_html_chart_content_internal(df, chart_id_suffix=str(chart_id), title=chart_title, last_dates=last_dates)
+            with profiler.stage('write'):
+                page.write('<div class="chart-container">')
+                page.write(chart_html)
+                page.write('</div>')
+            del chart_html
+        page.write(internal_master_js)
+    else: # iframe mode
+        page.write(fund_selector_master_js)
+        for chart_info in iframes:
+            page.write(f'<iframe title="{html.escape(chart_info["title"])}" src="{html.escape(chart_info["content"])}" sandbox="allow-scripts allow-same-origin allow-modals allow-popups allow-forms allow-downloads allow-popups-to-escape-sandbox"></iframe>') # Expanded sandbox
+
+    page.write_lines(['</body>','</html>'])
+
+# Helper: the single aggregated page (as -r :internal: prints it) for {chart id: price frame}, returned as a string
+def charts_page_html(prices_by_chart):
+    charts, fund_names = [], set()
+    for chart_id, prices in prices_by_chart.items():
+        df, last_dates = daily_chart_frame(prices)
+        fund_names.update(str(c).strip() for c in df.columns if c != 'Date')
+        charts.append((chart_id, f'Fund Series Chart {chart_id}', df, last_dates))
+    out = StringIO()
+    write_charts_page(out, fund_names, charts=charts)
+    return out.getvalue()
+
+# Helper: {fund: log10 values without NaNs, oldest first} from a price frame, as the --bar dashboard scores them
+def bar_series_from_prices(prices):
+    series_by_fund = {}
+    for col_name_raw in prices.columns:
+        col_name = str(col_name_raw).strip()
+        if col_name.lower() in ['date', 'datum', '#'] or col_name.startswith('Unnamed:') or not col_name: continue
+        current_ys = pd.to_numeric(prices[col_name_raw], errors='coerce').dropna().values
+        if len(current_ys) > 0: series_by_fund[col_name] = current_ys
+    return series_by_fund
+
+# Helper: stream the --bar score dashboard for {fund: log10 values} (see bar_series_from_prices);
+# weight_presets {name: [weight per window]} adds a preset selector for the sliders; the table lists the top_k funds
+def write_bar_dashboard(stream, series_by_fund, weight_presets=None, top_k=DEFAULT_TOP_K):
+    import plotly.graph_objs as go
+
+    py_windows = BAR_WINDOWS
+    py_init_weights = BAR_INIT_WEIGHTS
+    py_period_label_map = BAR_PERIOD_LABELS
+    num_gradient_lookback_days = GRADIENT_LOOKBACK_DAYS
+
+    with profiler.stage('bar_regression'):
+        bar_scores = score_funds(series_by_fund, py_windows, py_init_weights, num_gradient_lookback_days)
+    output_fund_names = bar_scores['names']
+    main_score_contributions_list_for_js = bar_scores['main_contributions']
+    historical_contributions_for_all_funds_js = bar_scores['historical_contributions']
+    initial_scores_list_py, initial_gradients_list_py = bar_scores['scores'], bar_scores['gradients']
 
     initial_scores_list_py = [s if np.isfinite(s) else None for s in initial_scores_list_py]
     cleaned_initial_gradients_py = [g if np.isfinite(g) else None for g in initial_gradients_list_py]
     custom_data_for_plot_py = [[cleaned_initial_gradients_py[i] if i < len(cleaned_initial_gradients_py) else None] for i in range(len(output_fund_names))]
 
+    profiler.start('figure_build')
     fig = go.Figure(go.Bar(x=output_fund_names, y=initial_scores_list_py, customdata=custom_data_for_plot_py, marker_color='steelblue', name='Fund Scores',
                             hovertemplate='<b>Fund:</b> %{x}<br><b>Score:</b> %{y:.2f}<br><b>Score Trend (' + str(num_gradient_lookback_days) + 'd):</b> %{customdata[0]:.2f}<extra></extra>'))
     fig.update_layout(title='Current fund performance', template='plotly_white', height=600, xaxis=dict(showticklabels=False, title='Funds (Scroll/Isolate to see names)'), yaxis=dict(title='Score', autorange=True, type='linear'), barmode='group')
+    profiler.stop('figure_build')
 
     def clean_fig_dict_infs_nans(obj):
         if isinstance(obj, dict): return {k: clean_fig_dict_infs_nans(v) for k, v in obj.items()}
         if isinstance(obj, list): return [clean_fig_dict_infs_nans(elem) for elem in obj]
         return None if isinstance(obj, float) and not np.isfinite(obj) else obj
-    fig_json = json.dumps(clean_fig_dict_infs_nans(fig.to_dict()))
+    with profiler.stage('serialize'):
+        fig_json = json.dumps(clean_fig_dict_infs_nans(fig.to_dict()))
 
     body = (f'<div id="bar-chart" style="width:100%; height:600px; margin-bottom:30px;"></div>'
             f'<script src="https://cdn.plot.ly/plotly-3.0.1.min.js"></script>'
@@ -539,6 +839,10 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         for i, d in enumerate(py_windows)]) + '</tr></table>'
 
     defaults_button_html = '<button id="reset-weights-button" title="Reset weights to default values" style="font-size: 0.8em; padding: 4px 8px; margin-left: 10px; background-color: #6c757d; color:white; border:none; border-radius:4px; cursor:pointer; vertical-align: middle;">Defaults</button>'
+    if weight_presets:
+        preset_options_html = ''.join(f'<option value="{html.escape(name)}">{html.escape(name)}</option>' for name in weight_presets)
+        defaults_button_html += ('<select id="weight-preset-select" title="Set the weights from a weight profile" style="font-size: 0.8em; padding: 3px; margin-left: 10px; vertical-align: middle;">'
+                                 f'<option value="">Presets</option>{preset_options_html}</select>')
     slider_section_title_html = f'<h3 style="text-align:center;color:#555;">Adjust Scoring Weights {defaults_button_html}</h3>'
 
 
@@ -551,7 +855,8 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         '      <button id="isolate" style="margin:5px; padding: 8px 15px; border-radius:5px; background-color:#4CAF50; color:white; border:none; cursor:pointer;">Isolate</button>'
         '      <button id="reset" style="margin:5px; padding: 8px 15px; border-radius:5px; background-color:#f44336; color:white; border:none; cursor:pointer;">Reset</button>'
         '    </div></div>'
-        '  <div id="dynamic-fund-table-container" style="flex: 1.5; min-width: 400px; padding:10px;"><h3 style="text-align:center; color:#555;">Top Funds</h3></div></div>')
+        '  <div id="dynamic-fund-table-container" style="flex: 1.5; min-width: 400px; padding:10px;"><h3 style="text-align:center; color:#555;">'
+        f'Top {top_k} Funds</h3></div></div>')
 
     csv_button_html = """
 <div id="csv-export-area" style="text-align:center; margin-top:5px; margin-bottom: 20px;">
@@ -565,6 +870,7 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
   const pyInitialWeightsJS = {json.dumps(py_init_weights)};
   const allFundNamesJS = {json.dumps(output_fund_names)};
   const numGradientLookbackDaysJS = {json.dumps(num_gradient_lookback_days)};
+  const topKJS = {json.dumps(top_k)};
 </script>"""
     main_js_logic = """<script>
   const weightSliders = Array.from(document.querySelectorAll('input.weight-slider'));
@@ -584,6 +890,24 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
     if(validPts<2)return null; const denom=(validPts*sumXX-sumX*sumX); if(denom===0)return null;
     const slope=(validPts*sumXY-sumX*sumY)/denom; return Number.isFinite(slope)?slope:null;
   }
+  // The k first items in compare() order, without sorting all of them: a bounded heap keeps the k best seen so far
+  // with the one ranked last at the root. Ties keep the order of 'items', as the stable Array.sort does.
+  function selectTopK(items, k, compare) {
+    const heap=[];
+    const after=(a,b)=>{const c=compare(a.item,b.item);return c!==0?c>0:a.pos>b.pos;};
+    const swap=(i,j)=>{const t=heap[i];heap[i]=heap[j];heap[j]=t;};
+    const siftUp=i=>{while(i>0){const p=(i-1)>>1;if(!after(heap[i],heap[p]))break;swap(i,p);i=p;}};
+    const siftDown=i=>{for(;;){const l=2*i+1,r=l+1;let m=i;
+        if(l<heap.length&&after(heap[l],heap[m]))m=l;
+        if(r<heap.length&&after(heap[r],heap[m]))m=r;
+        if(m===i)return;swap(i,m);i=m;}};
+    items.forEach((item,pos)=>{
+        const entry={item,pos};
+        if(heap.length<k){heap.push(entry);siftUp(heap.length-1);}
+        else if(k>0&&after(heap[0],entry)){heap[0]=entry;siftDown(0);}
+    });
+    return heap.sort((a,b)=>after(a,b)?1:-1).map(e=>e.item);
+  }
   function renderDynamicTable(fundData) {
     const container=document.getElementById('dynamic-fund-table-container');
     const title=container.querySelector('h3');
@@ -595,7 +919,7 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         dataForCSVExport = [];
         return;
     }
-    fundData.sort((a,b)=>{
+    const topRows=selectTopK(fundData,topKJS,(a,b)=>{
         let vA=currentSortColumn==='score'?a.score:a.gradient;
         let vB=currentSortColumn==='score'?b.score:b.gradient;
         vA=(vA===null||isNaN(vA))?(currentSortAscending?Infinity:-Infinity):vA;
@@ -604,8 +928,7 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         if(vA>vB)return currentSortAscending?1:-1;
         return 0;
     });
-    const top20=fundData.slice(0,20);
-    dataForCSVExport = [...top20];
+    dataForCSVExport = [...topRows];
     const table=document.createElement('table');table.style.cssText='width:100%;border-collapse:collapse;margin-top:10px;';
     const head=table.createTHead().insertRow();
     const headers=[
@@ -628,7 +951,7 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         head.appendChild(th);
     });
     const tbody=table.createTBody();
-    top20.forEach(f=>{
+    topRows.forEach(f=>{
         const r=tbody.insertRow();
         const s=f.score,g=f.gradient;
         r.insertCell().textContent=f.name;
@@ -799,6 +1122,17 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
         });
     }
   });
+</script>"""
+    preset_js = '' if not weight_presets else f"""<script>
+  const weightPresetsJS = {json.dumps(weight_presets)};
+  const presetSelect = document.getElementById('weight-preset-select');
+  presetSelect.addEventListener('change', () => {{
+    const presetWeights = weightPresetsJS[presetSelect.value];
+    if (!presetWeights) return;
+    weightSliders.forEach((slider, index) => {{ slider.value = presetWeights[index].toFixed(1); }});
+    updateScoresAndGradients();
+    presetSelect.value = '';
+  }});
 </script>"""
     isolate_js = f"""<script>
   const fundSel = document.getElementById('fund-select');
@@ -848,376 +1182,308 @@ def bar_chart_mode(input_dir, output_dir, internal, trace_enabled):
   }}
 </script>"""
 
-    full_html = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Fund Scores</title><style>body{font-family:Arial,sans-serif;}</style></head><body>'
-                 '<h1 style="text-align:center;color:#333;">Fund Performance Dashboard</h1>' +
-                 slider_section_title_html +
-                 slider_html +
-                 '<h3 style="text-align:center;margin-top:30px;color:#555;">Fund Scores Bar Chart</h3>' + body +
-                 controls_and_table_html +
-                 csv_button_html +
-                 js_data_script + main_js_logic + isolate_js + '</body></html>')
-    if internal: print(full_html)
+    # Written piece by piece to the destination instead of being concatenated into one page string
+    page_parts = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Fund Scores</title><style>body{font-family:Arial,sans-serif;}</style></head><body>'
+                  '<h1 style="text-align:center;color:#333;">Fund Performance Dashboard</h1>',
+                  slider_section_title_html,
+                  slider_html,
+                  '<h3 style="text-align:center;margin-top:30px;color:#555;">Fund Scores Bar Chart</h3>', body,
+                  controls_and_table_html,
+                  csv_button_html,
+                  js_data_script, main_js_logic, preset_js, isolate_js, '</body></html>')
+    with profiler.stage('write'):
+        for part in page_parts: stream.write(part)
+
+# Helper: the --bar score dashboard for {fund: log10 values}, returned as a string
+def bar_dashboard_html(series_by_fund, weight_presets=None, top_k=DEFAULT_TOP_K):
+    out = StringIO()
+    write_bar_dashboard(out, series_by_fund, weight_presets, top_k)
+    return out.getvalue()
+
+
+# --- Command line ---
+
+# Helper: read only the selected funds' columns via the fund table index, as {column name: Series of log values}
+def read_selected_fund_series(input_dir, fund_names, since=None, until=None):
+    tables_dir = Path(input_dir)
+    if not tables_dir.is_dir(): raise ValueError(f"--fund needs -t to be a directory of fund tables (for the fund table index); '{input_dir}' is not.")
+    with profiler.stage('read'):
+        index = load_table_index(tables_dir)
+        date_strs, columns = read_fund_columns(tables_dir, index, fund_names, since=since, until=until)
+    dates = pd.to_datetime(date_strs, errors='coerce', format='%Y-%m-%d')
+    return {name: pd.Series(values, index=dates).dropna() for name, values in columns.items()}
+
+# Helper: collect the --bar input series from all tables (or only the --fund columns) of a directory, zip or concat file
+def read_bar_series(input_dir, fund_names=None, since=None, until=None):
+    if not os.path.exists(input_dir): raise ValueError(f"Input directory '{input_dir}' not found.")
+    series_by_fund = {}
+    if fund_names:
+        for col_name, series in read_selected_fund_series(input_dir, fund_names, since, until).items():
+            if len(series) > 0: series_by_fund[col_name] = series.values
+
+    for fname, table_bytes in (iter_table_sources(Path(input_dir)) if not fund_names else []):
+        try:
+            df_temp = read_fund_table(table_bytes, since, until)
+            if df_temp.empty: continue
+            series_by_fund.update(bar_series_from_prices(df_temp))
+        except Exception as e: print(f"Error processing file {fname}: {e}", file=sys.stderr)
+
+    if not series_by_fund: raise ValueError(f"No valid fund data collected from {input_dir}.")
+    return series_by_fund
+
+# Bar-chart mode: dashboard to STDOUT (internal) or to fund_series_scores.html in output_dir
+def bar_chart_mode(input_dir, output_dir, internal, trace_enabled, fund_names=None, since=None, until=None, weight_presets=None,
+                   top_k=DEFAULT_TOP_K):
+    try: series_by_fund = read_bar_series(input_dir, fund_names, since, until)
+    except ValueError as e: sys.exit(f"Error: {e}")
+    if internal:
+        write_bar_dashboard(sys.stdout, series_by_fund, weight_presets, top_k)
+        sys.stdout.write('\n')
     else:
         out_path = os.path.join(output_dir, 'fund_series_scores.html')
-        with open(out_path, 'w', encoding='utf-8') as f: f.write(full_html)
+        with open(out_path, 'w', encoding='utf-8') as f: write_bar_dashboard(f, series_by_fund, weight_presets, top_k)
         print(f"Saved score chart to {out_path}", file=sys.stderr)
 
-# --- Main script execution logic ---
-all_unique_fund_names = set()
-
-# STDIN single time-series mode
-if use_stdin and not args.bar_mode:
+# STDIN mode: one chart from the table on STDIN, to STDOUT and (unless internal) fund_series_chart_stdin.html
+def stdin_chart_mode(output_dir, internal, since=None, until=None):
     try:
-        df0 = pd.read_csv(sys.stdin, **df_kwargs)
-        if df0.empty: sys.exit("Received empty data from stdin.")
-        df0.rename(columns={df0.columns[0]:'Date'}, inplace=True)
-        df0.dropna(axis=1, how='all', inplace=True)
-        df0.dropna(subset=['Date'], how='all', inplace=True)
-        if df0.empty: sys.exit("Data empty after initial NA handling from stdin.")
-        df0.set_index('Date', inplace=True)
-        df0 = df0.dropna(axis=1, how='all')
-        if df0.empty: sys.exit("No valid data series in stdin.")
-
-        last_dates={c:df0[c].last_valid_index().strftime('%Y-%m-%d') for c in df0.columns if pd.notna(df0[c].last_valid_index())}
-        if not df0.index.is_monotonic_increasing: df0 = df0.sort_index()
-        df0.index = pd.to_datetime(df0.index, errors='coerce')
-        df0 = df0[pd.notna(df0.index)]
-        if df0.empty: sys.exit("No valid dates in stdin after conversion.")
-
-        min_date, max_date = df0.index.min(), df0.index.max()
-        if pd.isna(min_date) or pd.isna(max_date): sys.exit("Invalid date range from stdin.")
-
-        idx=pd.date_range(min_date, max_date, freq='D')
-        df=df0.reindex(idx).interpolate(method='time').reset_index(names=['Date'])
-
-        if 'Date' in df.columns:
-            date_col = df['Date']
-            other_cols = df.drop(columns=['Date']).dropna(axis=1, how='all')
-            if other_cols.empty : sys.exit("No valid data series to plot from stdin.")
-            df = pd.concat([date_col, other_cols], axis=1)
-        else: sys.exit("Date column missing after processing stdin.")
-
+        df, last_dates = daily_chart_frame(table_to_prices(read_fund_table(sys.stdin, since, until)))
         html_content=df_to_html_individual_file(df,title='Fund Series Chart (from stdin)',last_dates=last_dates)
-        print(html_content)
-        if not internal_only:
-            outf=os.path.join(args.output_dir,'fund_series_chart_stdin.html')
-            with open(outf,'w',encoding='utf-8') as f: f.write(html_content)
-            print(f"Saved {outf}",file=sys.stderr)
-
+        with profiler.stage('write'):
+            print(html_content)
+            if not internal:
+                outf=os.path.join(output_dir,'fund_series_chart_stdin.html')
+                with open(outf,'w',encoding='utf-8') as f: f.write(html_content)
+                print(f"Saved {outf}",file=sys.stderr)
     except Exception as e:
         print(f"Error processing stdin: {e}", file=sys.stderr)
         sys.exit(1)
-    sys.exit(0)
-
-# Bar chart mode
-if args.bar_mode:
-    if use_stdin: sys.exit("Bar mode cannot be used with stdin. Provide an input directory with -t.")
-    bar_chart_mode(args.input_dir, args.output_dir, internal_only, args.trace_mode)
-    sys.exit(0)
-
-# Default mode: Process multiple CSVs for time-series charts
-pat=re.compile(r'fund_tables_(\d+)\.csv$')
-csv_files = []
-if os.path.isdir(args.input_dir):
-    csv_files = sorted(
-        (int(m.group(1)), os.path.join(args.input_dir, f))
-        for f in os.listdir(args.input_dir) for m in [pat.match(f)] if m
-    )
-else:
-    if not (use_stdin or args.bar_mode): sys.exit(f"Error: Input directory '{args.input_dir}' not found.")
 
-if not csv_files and not (use_stdin or args.bar_mode):
-    sys.exit(f"No CSVs matching 'fund_tables_<n>.csv' found in {args.input_dir}")
-
-chart_html_parts = []
-html_file_outputs_for_index=[]
-generated_any_chart = False
-
-for idx_num, filepath in csv_files:
-    try:
-        df0=pd.read_csv(filepath,**df_kwargs)
-        if df0.empty: print(f"Warning: CSV {filepath} empty. Skipping.", file=sys.stderr); continue
-        df0.rename(columns={df0.columns[0]:'Date'},inplace=True)
-        df0.dropna(axis=1,how='all',inplace=True)
-        df0.dropna(subset=['Date'], how='all', inplace=True)
-        if df0.empty: print(f"Data empty for {filepath} after NA handling. Skipping.", file=sys.stderr); continue
-        df0.set_index('Date',inplace=True)
-        df0 = df0.dropna(axis=1, how='all')
-        if df0.empty: print(f"No valid series in {filepath}. Skipping.", file=sys.stderr); continue
-
-        for fund_col in df0.columns:
-            all_unique_fund_names.add(str(fund_col).strip())
-
-        last_dates={c:df0[c].last_valid_index().strftime('%Y-%m-%d') for c in df0.columns if pd.notna(df0[c].last_valid_index())}
-        if not df0.index.is_monotonic_increasing: df0 = df0.sort_index()
-        df0.index = pd.to_datetime(df0.index, errors='coerce')
-        df0 = df0[pd.notna(df0.index)]
-        if df0.empty: print(f"No valid dates in {filepath}. Skipping.", file=sys.stderr); continue
-
-        min_date, max_date = df0.index.min(), df0.index.max()
-        if pd.isna(min_date) or pd.isna(max_date): print(f"Invalid date range in {filepath}. Skipping.", file=sys.stderr); continue
-
-        idxr=pd.date_range(min_date,max_date,freq='D')
-        df=df0.reindex(idxr).interpolate(method='time').reset_index().rename(columns={'index':'Date'})
+# Selected funds mode: one chart with only the --fund series, read via the fund table index
+def selected_funds_mode(input_dir, output_dir, internal, fund_names, since=None, until=None):
+    try: series_by_fund = read_selected_fund_series(input_dir, fund_names, since, until)
+    except ValueError as e: sys.exit(f"Error: {e}")
+    if not series_by_fund: sys.exit("None of the --fund names were found in the fund table index.")
+    html_content = fund_chart_html(pd.DataFrame(series_by_fund).sort_index(), title='Selected Fund Series')
+    with profiler.stage('write'):
+        if internal: print(html_content)
+        else:
+            outf=os.path.join(output_dir,'fund_series_chart_selected.html')
+            with open(outf,'w',encoding='utf-8') as f: f.write(html_content)
+            print(f"Saved {outf}",file=sys.stderr)
 
-        if 'Date' in df.columns:
-            date_column_data = df['Date']
-            other_columns_df = df.drop(columns=['Date']).dropna(axis=1, how='all')
-            if other_columns_df.empty: print(f"No data series to plot in {filepath}. Skipping.", file=sys.stderr); continue
-            df = pd.concat([date_column_data, other_columns_df], axis=1)
-        else: print(f"Date column missing in {filepath}. Skipping.", file=sys.stderr); continue
+# Default mode: one chart per fund table; a single page to STDOUT (internal) or chart files plus an iframe index page
+def tables_mode(input_dir, output_dir, internal, since=None, until=None):
+    if not os.path.exists(input_dir): sys.exit(f"Error: Input directory '{input_dir}' not found.")
+    with profiler.stage('read'): # Directory, fund_tables.zip or fund_tables_concat.txt
+        csv_files = sorted(
+            (int(TABLE_NAME_PATTERN.match(name).group(1)), os.path.join(input_dir, name), table_bytes)
+            for name, table_bytes in iter_table_sources(Path(input_dir))
+        )
+    if not csv_files: sys.exit(f"No CSVs matching 'fund_tables_<n>.csv' found in {input_dir}")
+
+    all_unique_fund_names = set()
+    pending_internal_charts = [] # (idx_num, title, df, last_dates); rendered one at a time while streaming the page
+    html_file_outputs_for_index=[]
+    for idx_num, filepath, table_bytes in csv_files:
+        try:
+            df, last_dates = daily_chart_frame(table_to_prices(read_fund_table(table_bytes, since, until)))
+        except Exception as e:
+            print(f"Skipping {filepath}: {e}", file=sys.stderr)
+            continue
+        all_unique_fund_names.update(str(fund_col).strip() for fund_col in df.columns if fund_col != 'Date')
 
         chart_title = f'Fund Series Chart {idx_num}'
-        if internal_only:
-            chart_content_html = df_to_html_chart_content_internal(df, chart_id_suffix=str(idx_num), title=chart_title, last_dates=last_dates)
-            chart_html_parts.append(chart_content_html)
+        if internal:
+            pending_internal_charts.append((idx_num, chart_title, df, last_dates))
         else:
             full_chart_html=df_to_html_individual_file(df,title=chart_title,last_dates=last_dates)
             name=f'fund_series_chart_{idx_num}.html'
-            p=os.path.join(args.output_dir,name)
-            with open(p,'w',encoding='utf-8') as ff: ff.write(full_chart_html)
+            p=os.path.join(output_dir,name)
+            with profiler.stage('write'):
+                with open(p,'w',encoding='utf-8') as ff: ff.write(full_chart_html)
             print(f"Saved {p}"); html_file_outputs_for_index.append({'type': 'src', 'content': name, 'title': chart_title})
-        generated_any_chart = True
-    except Exception as e:
-        print(f"Error processing file {filepath}: {e}", file=sys.stderr)
-        continue
-
-if not generated_any_chart and not (use_stdin or args.bar_mode) :
-    print("No charts were generated from directory processing.", file=sys.stderr)
-
-
-# --- Assemble and print/save the final output for directory processing mode ---
-
-if not use_stdin and not args.bar_mode and generated_any_chart:
-
-    final_html_lines=['<!DOCTYPE html>','<html lang="en">','<head>','  <meta charset="utf-8">',
-               '<meta name="viewport" content="width=device-width, initial-scale=1">',
-               '<title>Aggregated Fund Series Charts</title>',
-               '<style>',
-               '    body { font-family: Arial, sans-serif; margin: 10px; padding: 0; background-color: #f4f4f4; }',
-               '    iframe { border: 1px solid #ccc; margin-bottom: 10px; width:100%; height:850px; }',
-               '    .chart-container { margin-bottom: 20px; padding:10px; background-color: #fff; border: 1px solid #ddd; border-radius: 5px;}',
-               '    #global-selector-area { text-align: center; margin-bottom: 20px; }',
-               '    #fund-selector-container { display: inline-flex; align-items: flex-start; background-color: #fff; padding: 15px; border-radius: 5px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }',
-               '    #global-fund-selector { width: auto; min-width: 300px; max-width: 60%; flex-shrink: 0; border: 1px solid #ccc; border-radius: 4px; padding: 8px; margin-right: 10px; }',
-               '    #fund-selector-buttons { display: flex; flex-direction: column; }',
-               '    .selector-button { padding: 10px 15px; border-radius: 4px; border: none; cursor: pointer; font-size: 14px; color: white; margin-bottom: 10px; width: 150px; text-align: center;}',
-               '    #apply-fund-selection { background-color: #5cb85c; } #apply-fund-selection:hover { background-color: #4cae4c; }',
-               '    #reset-fund-selection { background-color: #d9534f; } #reset-fund-selection:hover { background-color: #c9302c; }',
-               '    #create-overlay-chart { background-color: #007bff; } #create-overlay-chart:hover { background-color: #0056b3; }',
-               '    #overlay-chart-container { position: fixed; top: 0; left: 0; width: 100%; height: 100%; background-color: rgba(0,0,0,0.7); z-index: 1000; display: none; justify-content: center; align-items: center; }',
-               '    #overlay-chart-content { background-color: white; padding: 20px; border-radius: 10px; box-shadow: 0 0 15px rgba(0,0,0,0.5); width: 90%; height: 90%; position: relative; display: flex; flex-direction: column; }',
-               '    #overlay-chart-plot-inner { flex-grow: 1; width: 100%; height: 100%; }', # Ensures the div takes up space
-               '    #close-overlay-button { position: absolute; bottom: 10px; right: 10px; padding: 8px 12px; background-color: #f44336; color: white; border: none; border-radius: 5px; cursor: pointer; z-index: 1001;}', # Moved to bottom right
-               '    body.overlay-active > *:not(#overlay-chart-container) { filter: blur(5px) brightness(0.7); pointer-events: none; }',
-               '</style>',
-               '<script src="https://cdn.plot.ly/plotly-3.0.1.min.js"></script>']
-
-    if internal_only:
-        final_html_lines.append(styling_constants_js)
-        final_html_lines.append(selection_and_hover_js_logic) # Included once for internal_only mode
-
-    final_html_lines.extend(['</head>','<body>'])
-    final_html_lines.append('<h1 style="text-align:center; margin-top:20px; margin-bottom:20px;">Aggregated Fund Series Charts</h1>')
-
-    # Global Fund Selector HTML
-    if all_unique_fund_names:
-        final_html_lines.append('<div id="global-selector-area">')
-        final_html_lines.append('  <h3 style="margin-bottom: 10px;">Global Fund Selector</h3>')
-        final_html_lines.append('  <div id="fund-selector-container">')
-        final_html_lines.append('    <select id="global-fund-selector" multiple size="10">')
-        for fund_name in sorted(list(all_unique_fund_names)):
-            json_string_value = json.dumps(fund_name)
-            html_escaped_value_attr = html.escape(json_string_value, quote=True)
-            html_escaped_text_content = html.escape(fund_name)
-            final_html_lines.append(f'      <option value="{html_escaped_value_attr}">{html_escaped_text_content}</option>')
-        final_html_lines.append('    </select>')
-        final_html_lines.append('    <div id="fund-selector-buttons">')
-        final_html_lines.append('      <button id="apply-fund-selection" class="selector-button">Apply Selection</button>')
-        final_html_lines.append('      <button id="reset-fund-selection" class="selector-button" title="Clear fund selection">Reset Selection</button>')
-        final_html_lines.append('      <button id="create-overlay-chart" class="selector-button" title="Overlay selected funds">Overlay Selected</button>')
-        final_html_lines.append('    </div>')
-        final_html_lines.append('  </div>')
-        final_html_lines.append('</div>')
-
-    # Overlay Container HTML
-    final_html_lines.append('<div id="overlay-chart-container">')
-    final_html_lines.append('  <div id="overlay-chart-content">')
-    final_html_lines.append('    <button id="close-overlay-button">Close</button>')
-    final_html_lines.append('    <div id="overlay-chart-plot-inner" class="plotly-graph-div"></div>')
-    final_html_lines.append('  </div>')
-    final_html_lines.append('</div>')
-
-    if internal_only:
-        for chart_html_part in chart_html_parts:
-            final_html_lines.append('<div class="chart-container">')
-            final_html_lines.append(chart_html_part)
-            final_html_lines.append('</div>')
-
-        internal_master_js = r"""
-<script>
-    // [SINGLE-PAGE MASTER JS] Loaded
-    document.addEventListener('DOMContentLoaded', function() {
-        const globalFundSelector = document.getElementById('global-fund-selector');
-        const applyFundSelectionButton = document.getElementById('apply-fund-selection');
-        const resetFundSelectionButton = document.getElementById('reset-fund-selection');
-        const createOverlayChartButton = document.getElementById('create-overlay-chart');
-        const overlayChartContainer = document.getElementById('overlay-chart-container');
-        const overlayChartPlotDiv = document.getElementById('overlay-chart-plot-inner');
-        const closeOverlayButton = document.getElementById('close-overlay-button');
-        let currentSelectedFundsForMaster = [];
-
-        if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); }
-
-        function handleSelectionChange() {
-            const selectedOptionsRaw = globalFundSelector ? Array.from(globalFundSelector.selectedOptions).map(opt => opt.value) : [];
-            currentSelectedFundsForMaster = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { console.error('[SINGLE-PAGE] Error parsing option value for master:', val, e); return null; } }).filter(value => value !== null);
-            if (typeof updateAllChartsOnPage === 'function') { updateAllChartsOnPage(currentSelectedFundsForMaster); }
-            else { console.error('[SINGLE-PAGE] updateAllChartsOnPage function not found.'); }
-        }
-
-        if (applyFundSelectionButton) { applyFundSelectionButton.addEventListener('click', handleSelectionChange); }
-        if (resetFundSelectionButton) { resetFundSelectionButton.addEventListener('click', function() { if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); } handleSelectionChange(); }); }
-
-        if (createOverlayChartButton) {
-            createOverlayChartButton.addEventListener('click', function() {
-                if (currentSelectedFundsForMaster.length === 0) {
-                    const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "Select funds first!"; setTimeout(() => { createOverlayChartButton.textContent = ob; }, 2000); return;
-                }
-                let overlayTraces = [];
-                document.querySelectorAll('.plotly-graph-div').forEach(gdElement => {
-                    if (gdElement.id === 'overlay-chart-plot-inner' || !gdElement.data || !gdElement.layout) return; // Skip overlay div itself and non-plotly divs
-                    gdElement.data.forEach(trace => {
-                        const baseTraceName = (trace.name || '').split('<br>')[0];
-                        if (currentSelectedFundsForMaster.includes(baseTraceName)) { overlayTraces.push(JSON.parse(JSON.stringify(trace))); }
-                    });
-                });
-                if (overlayTraces.length > 0) {
-                    const uniqueOverlayTraces = []; const seenFundNames = new Set();
-                    for (const trace of overlayTraces) { const baseName = (trace.name || '').split('<br>')[0]; if (!seenFundNames.has(baseName)) { uniqueOverlayTraces.push(trace); seenFundNames.add(baseName); }}
 
-                    uniqueOverlayTraces.forEach(trace => { // Normalize line styles for overlay
-                        trace.line = trace.line || {};
-                        trace.line.width = typeof defaultLineWidth !== 'undefined' ? defaultLineWidth : 2; // Use global const or fallback
-                        trace.opacity = typeof defaultOpacity !== 'undefined' ? defaultOpacity : 1.0; // Use global const or fallback
-                    });
+    if not (pending_internal_charts or html_file_outputs_for_index):
+        print("No charts were generated from directory processing.", file=sys.stderr)
+        print("No charts to include in master index (no charts were generated).", file=sys.stderr)
+        return
 
-                    const overlayLayout = { title: 'Selected Funds Overlay', showlegend: true, legend: { traceorder: 'normal' }, yaxis: { zeroline: true, zerolinewidth: 2, title: 'Normalized Value (log10 scale, 0 = Last Date)'}, xaxis: { title: 'Date' }, hovermode: 'closest', template: 'plotly_white', autosize: true };
-                    Plotly.newPlot(overlayChartPlotDiv, uniqueOverlayTraces, overlayLayout);
-                    overlayChartContainer.style.display = 'flex'; // Make container visible
-                    document.body.classList.add('overlay-active');
-                    Plotly.Plots.resize(overlayChartPlotDiv); // Crucial: Resize after visible and plotted
-                } else { const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "No data for selection!"; setTimeout(() => { createOverlayChartButton.textContent = ob; }, 2000); }
-            });
-        }
-        if (closeOverlayButton) { closeOverlayButton.addEventListener('click', function() { overlayChartContainer.style.display = 'none'; document.body.classList.remove('overlay-active'); Plotly.purge(overlayChartPlotDiv); }); }
-        handleSelectionChange(); // Initial call
-    });
-</script>
-"""
-        final_html_lines.append(internal_master_js)
-    else: # iframe mode
-        fund_selector_master_js = r"""
-<script>
-    // [PARENT IFRAME MASTER JS] Loaded
-    document.addEventListener('DOMContentLoaded', function() {
-        const globalFundSelector = document.getElementById('global-fund-selector');
-        const applyFundSelectionButton = document.getElementById('apply-fund-selection');
-        const resetFundSelectionButton = document.getElementById('reset-fund-selection');
-        const createOverlayChartButton = document.getElementById('create-overlay-chart');
-        const iframes = document.querySelectorAll('iframe');
-        const overlayChartContainer = document.getElementById('overlay-chart-container');
-        const overlayChartPlotDiv = document.getElementById('overlay-chart-plot-inner');
-        const closeOverlayButton = document.getElementById('close-overlay-button');
-        let currentSelectedFundsForParent = [];
-
-        if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); }
-
-        function dispatchSelectionUpdate() {
-            const selectedOptionsRaw = globalFundSelector ? Array.from(globalFundSelector.selectedOptions).map(opt => opt.value) : [];
-            currentSelectedFundsForParent = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { console.error('[PARENT IFRAME] Error parsing option value:', val, e); return null; }}).filter(value => value !== null);
-            const message = { type: 'fundSelectionUpdate', selectedFunds: currentSelectedFundsForParent };
-            iframes.forEach((iframe) => { if (iframe.contentWindow) { iframe.contentWindow.postMessage(message, '*'); } });
-        }
-
-        if (applyFundSelectionButton) { applyFundSelectionButton.addEventListener('click', dispatchSelectionUpdate); }
-        if (resetFundSelectionButton) { resetFundSelectionButton.addEventListener('click', function() { if (globalFundSelector) { Array.from(globalFundSelector.options).forEach(opt => opt.selected = false); } dispatchSelectionUpdate(); }); }
-
-        if (createOverlayChartButton) {
-            createOverlayChartButton.addEventListener('click', function() {
-                if (currentSelectedFundsForParent.length === 0) { const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "Select funds first!"; setTimeout(() => {createOverlayChartButton.textContent = ob;}, 2000); return; }
-                let collectedOverlayTraces = [];
-                let expectedResponses = 0;
-                iframes.forEach(iframe => { if (iframe.contentWindow) expectedResponses++; }); // Count only iframes we can message
-
-                let receivedResponses = 0; const requestId = 'overlayDataRequest_' + Date.now();
-
-                if (expectedResponses === 0) {
-                     const ob = createOverlayChartButton.textContent; createOverlayChartButton.textContent = "No charts to overlay!"; setTimeout(() => {createOverlayChartButton.textContent = ob;}, 2000); return;
-                }
-
-                iframes.forEach(iframe => { if (iframe.contentWindow) { iframe.contentWindow.postMessage({ type: 'getFundDataForOverlay', selectedFunds: currentSelectedFundsForParent, requestId: requestId }, '*'); }});
-
-                const responseTimeout = setTimeout(() => { if (receivedResponses < expectedResponses) { console.warn(`Timeout: Received responses from ${receivedResponses}/${expectedResponses} iframes for overlay data.`); } finalizeOverlayChart(collectedOverlayTraces); window.removeEventListener('message', handleIframeDataResponse);}, 5000);
-
-                function handleIframeDataResponse(event) {
-                    if (event.data && event.data.type === 'fundDataResponse' && event.data.requestId === requestId) {
-                        if (event.data.traces && Array.isArray(event.data.traces)) { collectedOverlayTraces.push(...event.data.traces); }
-                        receivedResponses++;
-                        if (receivedResponses === expectedResponses) { clearTimeout(responseTimeout); finalizeOverlayChart(collectedOverlayTraces); window.removeEventListener('message', handleIframeDataResponse); }
-                    }
-                }
-                window.addEventListener('message', handleIframeDataResponse);
-            });
-        }
-
-        function finalizeOverlayChart(traces) {
-            if (traces.length > 0) {
-                const uniqueOverlayTraces = []; const seenFundNames = new Set();
-                for (const trace of traces) { const baseName = (trace.name || '').split('<br>')[0]; if (!seenFundNames.has(baseName)) { uniqueOverlayTraces.push(trace); seenFundNames.add(baseName); }}
+    if internal:
+        write_charts_page(sys.stdout, all_unique_fund_names, charts=pending_internal_charts)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        print(f"Printed single aggregated HTML page to stdout.", file=sys.stderr)
+    else:
+        idxp=os.path.join(output_dir,'fund_series_charts_index.html')
+        with open(idxp,'w',encoding='utf-8') as page_stream:
+            write_charts_page(page_stream, all_unique_fund_names, iframes=html_file_outputs_for_index)
+        print(f"Generated index at {idxp}")
 
-                uniqueOverlayTraces.forEach(trace => { // Normalize line styles for overlay
-                    trace.line = trace.line || {};
-                    trace.line.width = 2; // Standard thin line width (use global defaultLineWidth if available)
-                    trace.opacity = 1.0;  // Standard full opacity (use global defaultOpacity if available)
-                });
 
-                const overlayLayout = { title: 'Selected Funds Overlay (from iFrames)', showlegend: true, legend: { traceorder: 'normal' }, yaxis: { zeroline: true, zerolinewidth: 2, title: 'Normalized Value (log10 scale, 0 = Last Date)'}, xaxis: { title: 'Date' }, hovermode: 'closest', template: 'plotly_white', autosize: true };
-                Plotly.newPlot(overlayChartPlotDiv, uniqueOverlayTraces, overlayLayout);
-                overlayChartContainer.style.display = 'flex';
-                document.body.classList.add('overlay-active');
-                Plotly.Plots.resize(overlayChartPlotDiv); // Resize after visible
-            } else { const ob = document.getElementById('create-overlay-chart').textContent; document.getElementById('create-overlay-chart').textContent = "No data for selection!"; setTimeout(() => { document.getElementById('create-overlay-chart').textContent = ob; }, 2000); }
-        }
+# Helper: text stream passing writes through to `stream` while writing a UTF-8 copy to the file `fd` (the --cache-dir
+# artifact, built as the page streams so it never sits in memory)
+class TeeTextStream:
+    def __init__(self, stream, fd):
+        self.stream = stream
+        self.copy = open(fd, 'w', encoding='utf-8')
+
+    def write(self, text):
+        self.copy.write(text)
+        return self.stream.write(text)
+
+    def flush(self): self.stream.flush()
+
+    def close_copy(self):
+        """Closes the copy; returns whether anything was written to it."""
+        written = self.copy.tell() > 0
+        self.copy.close()
+        return written
+
+# Helper: --cache-dir key of the page printed with -r :internal: (table bytes, options that change the page, code version)
+def page_cache_key(args, selected_funds, weight_presets=None):
+    return cache_key({'tables': table_source_digest(Path(args.input_dir)),
+                      'options': {'bar': args.bar_mode, 'funds': selected_funds, 'since': args.since, 'until': args.until,
+                                  'weight_presets': weight_presets, 'top_k': args.top_k if args.bar_mode else None},
+                      'code': code_version()})
+
+# Helper: run the mode selected by the options
+def run_mode(args, internal_only, use_stdin, selected_funds, weight_presets=None):
+    if args.bar_mode:
+        if use_stdin: sys.exit("Bar mode cannot be used with stdin. Provide an input directory with -t.")
+        bar_chart_mode(args.input_dir, args.output_dir, internal_only, args.trace_mode, fund_names=selected_funds,
+                       since=args.since, until=args.until, weight_presets=weight_presets, top_k=args.top_k)
+    elif use_stdin:
+        stdin_chart_mode(args.output_dir, internal_only, since=args.since, until=args.until)
+    elif selected_funds:
+        selected_funds_mode(args.input_dir, args.output_dir, internal_only, selected_funds, since=args.since, until=args.until)
+    else:
+        tables_mode(args.input_dir, args.output_dir, internal_only, since=args.since, until=args.until)
 
-        if (closeOverlayButton) { closeOverlayButton.addEventListener('click', function() { overlayChartContainer.style.display = 'none'; document.body.classList.remove('overlay-active'); Plotly.purge(overlayChartPlotDiv); }); }
 
-        window.addEventListener('message', function(event) {
-            if (event.data && event.data.type === 'iframeReady') {
-                if (event.source && globalFundSelector) {
-                    const selectedOptionsRaw = Array.from(globalFundSelector.selectedOptions).map(opt => opt.value);
-                    const selectedFundsOnInit = selectedOptionsRaw.map(val => { try { return JSON.parse(val); } catch (e) { return null; }}).filter(value => value !== null);
-                    event.source.postMessage({ type: 'fundSelectionUpdate', selectedFunds: selectedFundsOnInit }, '*');
-                }
-            }
-        });
-        dispatchSelectionUpdate(); // Initial dispatch
-    });
-</script>
-"""
-        final_html_lines.append(fund_selector_master_js)
-        for chart_info in html_file_outputs_for_index:
-            final_html_lines.append(f'<iframe title="{html.escape(chart_info["title"])}" src="{html.escape(chart_info["content"])}" sandbox="allow-scripts allow-same-origin allow-modals allow-popups allow-forms allow-downloads allow-popups-to-escape-sandbox"></iframe>') # Expanded sandbox
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Generate fund series charts from CSVs; supports time-series, bar-score mode, and stdin.'
+    )
+    parser.add_argument(
+        '-t', dest='input_dir', default='.',
+        help='Directory containing fund_tables_<n>.csv, or the fund_tables.zip / fund_tables_concat.txt holding them'
+    )
+    parser.add_argument(
+        '-r', dest='output_dir', default='.',
+        help='Directory to save HTML or ":internal:" to output HTML to stdout'
+    )
+    parser.add_argument(
+        '--bar', dest='bar_mode', action='store_true',
+        help='Generate performance bar chart instead of time-series'
+    )
+    parser.add_argument(
+        '--trace', dest='trace_mode', action='store_true',
+        help='Enable diagnostic trace messages to STDERR for bar chart mode calculations.'
+    )
+    parser.add_argument(
+        '--fund', dest='funds', default=None,
+        help='Comma-separated fund names (current or former) to plot or score. Only their columns are read, '
+             'located via the fund table index in the -t directory.'
+    )
+    parser.add_argument(
+        '--since', dest='since', type=iso_date_arg, default=None,
+        help='Only read table rows dated on or after this YYYY-MM-DD date.'
+    )
+    parser.add_argument(
+        '--until', dest='until', type=iso_date_arg, default=None,
+        help='Only read table rows dated on or before this YYYY-MM-DD date.'
+    )
+    parser.add_argument(
+        '--profile', dest='profile', metavar='FILE', default=None,
+        help='Write a JSON profile with wall time, CPU time and tracemalloc peak per stage '
+             '(read, reindex_interpolate, figure_build, serialize, write, bar_regression) to FILE.'
+    )
+    parser.add_argument(
+        '--top-k', dest='top_k', type=int, default=DEFAULT_TOP_K, metavar='K',
+        help=f'With --bar: number of funds in the dashboard table (default: {DEFAULT_TOP_K}).'
+    )
+    parser.add_argument(
+        '--weight-profiles', dest='weight_profiles', type=Path, nargs='?', const=DEFAULT_WEIGHT_PROFILES_FILE, default=None, metavar='FILE',
+        help='With --bar: add the bar presets of the weight profile YAML FILE (default without FILE: bin/weight_profiles.yaml) '
+             'to the dashboard as a selector that sets the weight sliders.'
+    )
+    parser.add_argument(
+        '--cache-dir', dest='cache_dir', type=Path, default=None,
+        help='Content-addressed output cache for -r :internal: pages (not STDIN). A page is stored under DIR keyed by '
+             'a hash of the table bytes, the options and the code version, and printed from there while they are unchanged.'
+    )
+    return parser
+
+
+def main(argv=None):
+    global profiler
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.since and args.until and args.since > args.until:
+        parser.error('--since must not be later than --until')
+    selected_funds = next(csv.reader(StringIO(args.funds), skipinitialspace=True), []) if args.funds else []
+    if args.top_k < 1: parser.error('--top-k must be at least 1')
+    weight_presets = None
+    if args.weight_profiles:
+        if not args.bar_mode: parser.error('--weight-profiles needs --bar')
+        try: weight_presets = bar_presets(load_weight_profiles(args.weight_profiles), BAR_WINDOWS) or None
+        except Exception as e: parser.error(f'Cannot read weight profiles from {args.weight_profiles}: {e}')
+
+    # Per-stage profile (--profile); written at exit, whichever mode ends the script
+    profiler = StageProfiler('interactive_fund_plot', enabled=bool(args.profile))
+    if args.profile: atexit.register(profiler.write, args.profile)
+
+    # Determine modes
+    internal_only = (args.output_dir == ':internal:')
+    use_stdin = (args.input_dir == '.' and not sys.stdin.isatty() and not selected_funds) # Check if not a TTY and input_dir is default
+    if not internal_only and not use_stdin and not os.path.exists(args.output_dir) :
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Output cache: a page printed before from the same tables, options and code is printed again as is
+    page_key = None
+    real_stdout = sys.stdout
+    if args.cache_dir and internal_only and not use_stdin:
+        try:
+            page_key = page_cache_key(args, selected_funds, weight_presets)
+            cached_page = find_artifact(args.cache_dir, 'interactive_fund_plot', page_key, '.html')
+            if cached_page is not None:
+                sys.stdout.flush()
+                with open(cached_page, 'rb') as page_file:
+                    shutil.copyfileobj(page_file, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+                print(f"Output cache hit {short_key(page_key)}: printed the page from {args.cache_dir}", file=sys.stderr)
+                return
+        except Exception as e:
+            print(f"Warning: Output cache lookup failed: {e}. Generating the page.", file=sys.stderr)
+            page_key = None
+        if page_key is not None:
+            print(f"Output cache miss {short_key(page_key)}", file=sys.stderr)
+            try:
+                tmp_fd, tmp_path = artifact_tempfile(args.cache_dir, 'interactive_fund_plot')
+                sys.stdout = TeeTextStream(real_stdout, tmp_fd)
+            except OSError as e:
+                print(f"Warning: Could not write to the output cache: {e}", file=sys.stderr)
+                page_key = None
 
-    final_html_lines.extend(['</body>','</html>'])
+    try:
+        run_mode(args, internal_only, use_stdin, selected_funds, weight_presets)
+    except BaseException:
+        if page_key is not None:
+            sys.stdout.close_copy()
+            tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        page_stream, sys.stdout = sys.stdout, real_stdout
+    if page_key is not None:
+        try:
+            if page_stream.close_copy(): # Nothing printed: nothing to cache
+                store_artifact_file(args.cache_dir, 'interactive_fund_plot', page_key, '.html', tmp_path)
+        except OSError as e:
+            print(f"Warning: Could not write to the output cache: {e}", file=sys.stderr)
+        finally:
+            tmp_path.unlink(missing_ok=True)
 
-    if internal_only:
-        print("\n".join(final_html_lines))
-        print(f"Printed single aggregated HTML page to stdout.", file=sys.stderr)
-    else:
-        idxp=os.path.join(args.output_dir,'fund_series_charts_index.html')
-        with open(idxp,'w',encoding='utf-8') as f:f.write("\n".join(final_html_lines))
-        print(f"Generated index at {idxp}")
 
-elif not use_stdin and not args.bar_mode and not generated_any_chart:
-    print("No charts to include in master index (no charts were generated).", file=sys.stderr)
+if __name__ == '__main__':
+    main()
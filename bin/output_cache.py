@@ -0,0 +1,246 @@
+"""output_cache.py
+
+Content-addressed cache for the nightly report generators (`--cache-dir DIR` of
+`fund_momentum_emailer.py` and `interactive_fund_plot.py`).
+
+A generator builds a key from everything its output depends on and looks the key
+up before doing any work:
+
+    inputs    the raw bytes of the fund tables (`table_source_digest`: a directory,
+              fund_tables.zip or fund_tables_concat.txt) and the bundle YAML text
+    config    the command-line options that change the output
+    code      the source of the running script and every module imported from
+              bin/, plus the versions of the libraries that shape the output
+              (`code_version`)
+
+`cache_key` hashes these parts as canonical JSON with SHA-256. Artifacts are
+stored as `<cache dir>/<generator>/<key><suffix>`, so a key either matches an
+artifact built from exactly the same inputs, configuration and code, or it
+matches nothing. Nothing is ever invalidated; an unchanged day (e.g. a weekend
+snapshot repeating Friday's prices) costs reading and hashing the tables.
+
+Artifacts are written with `write_atomic`, so an interrupted run never leaves a
+truncated artifact. A hit refreshes the artifact's mtime, and each generator
+keeps its MAX_ARTIFACTS most recently used artifacts. `atomic_replace` and
+`write_atomic` are also how the other scripts in bin/ replace their output
+files.
+
+A cache directory may be restored from elsewhere (e.g. actions/cache), so
+artifacts hold data only: pages as bytes, tables as npz archives of plain arrays
+(`frames_to_npz`) that `frames_from_npz` loads with allow_pickle=False. Nothing
+in an artifact is ever executed.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+SCRIPT_DIR = Path(os.path.abspath(__file__)).parent
+MAX_ARTIFACTS = 8
+# Libraries whose version can change the generated output (missing ones hash as None)
+OUTPUT_LIBRARIES = ("numpy", "pandas", "plotly", "tabulate", "PyYAML")
+
+
+def table_source_digest(source: Path) -> str:
+    """SHA-256 over the names and bytes of the fund tables in `source` (as read by the loaders)."""
+    from fund_tables_io import iter_table_sources
+
+    digest = hashlib.sha256()
+    for name, table_bytes in iter_table_sources(source):
+        digest.update(name.encode("utf-8") + b"\0" + len(table_bytes).to_bytes(8, "little"))
+        digest.update(table_bytes)
+    return digest.hexdigest()
+
+
+def text_digest(text: str) -> str:
+    """SHA-256 of a text (e.g. the fund name bundle YAML)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def code_version() -> Dict[str, Any]:
+    """Digest of the running script and the bin/ modules imported so far, with the output libraries' versions."""
+    from importlib import metadata
+
+    local_files = set()
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and Path(os.path.abspath(module_file)).parent == SCRIPT_DIR:
+            local_files.add(Path(os.path.abspath(module_file)))
+    digest = hashlib.sha256()
+    for path in sorted(local_files):
+        digest.update(path.name.encode("utf-8") + b"\0")
+        digest.update(path.read_bytes())
+
+    versions: Dict[str, str | None] = {}
+    for library in OUTPUT_LIBRARIES:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = None
+    return {"sources": digest.hexdigest(), "python": sys.version.split()[0], "libraries": versions}
+
+
+def cache_key(parts: Dict[str, Any]) -> str:
+    """SHA-256 over the canonical JSON of `parts` (JSON-serializable: digests, options, code_version())."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def atomic_replace(path: Path, suffix: str = "") -> Iterator[Path]:
+    """
+    Yields a temporary file next to `path` for the caller to write; renames it over `path` when the block
+    completes and deletes it when the block raises. Readers see the old file or the complete new one, never
+    a partial write, and a failed run leaves no stray file behind.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=suffix)
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replaces `path` with `data` (see atomic_replace)."""
+    with atomic_replace(path) as tmp_path:
+        tmp_path.write_bytes(data)
+
+
+def artifact_path(cache_dir: Path, generator: str, key: str, suffix: str) -> Path:
+    return Path(cache_dir) / generator / f"{key}{suffix}"
+
+
+def find_artifact(cache_dir: Path, generator: str, key: str, suffix: str) -> Path | None:
+    """Returns the path of the cached artifact for `key`, or None on a miss. A hit marks the artifact as recently used."""
+    path = artifact_path(cache_dir, generator, key, suffix)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def load_artifact(cache_dir: Path, generator: str, key: str, suffix: str) -> bytes | None:
+    """Returns the cached artifact for `key`, or None on a miss (see find_artifact)."""
+    path = find_artifact(cache_dir, generator, key, suffix)
+    try:
+        return path.read_bytes() if path is not None else None
+    except FileNotFoundError: # Pruned by a concurrent run
+        return None
+
+
+def artifact_tempfile(cache_dir: Path, generator: str) -> Tuple[int, Path]:
+    """Opens a temporary file in the generator's directory for an artifact written as it is produced: (fd, path)."""
+    generator_dir = Path(cache_dir) / generator
+    generator_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=generator_dir, prefix=".tmp-")
+    return fd, Path(tmp_name)
+
+
+def store_artifact_file(cache_dir: Path, generator: str, key: str, suffix: str, tmp_path: Path) -> Path:
+    """Renames a complete temporary file from artifact_tempfile into place as the artifact for `key`."""
+    path = artifact_path(cache_dir, generator, key, suffix)
+    os.replace(tmp_path, path)
+    prune_artifacts(path.parent, MAX_ARTIFACTS)
+    return path
+
+
+def store_artifact(cache_dir: Path, generator: str, key: str, suffix: str, data: bytes) -> Path:
+    """Writes the artifact for `key` and drops the generator's least recently used artifacts."""
+    path = artifact_path(cache_dir, generator, key, suffix)
+    write_atomic(path, data)
+    prune_artifacts(path.parent, MAX_ARTIFACTS)
+    return path
+
+
+def prune_artifacts(generator_dir: Path, keep: int) -> None:
+    """Deletes all but the `keep` most recently used artifacts in `generator_dir`."""
+    artifacts = [p for p in generator_dir.iterdir() if p.is_file() and not p.name.startswith(".tmp-")]
+    artifacts.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in artifacts[keep:]:
+        stale.unlink(missing_ok=True)
+
+
+def short_key(key: str) -> str:
+    return key[:12]
+
+
+def _column_array(values: Any, what: str) -> Any:
+    """A column or index as a data-only numpy array: numeric, bool and datetime64 as they are, object as str."""
+    import numpy as np
+
+    array = np.asarray(values)
+    if array.dtype == object:
+        if not all(isinstance(value, str) for value in array):
+            raise ValueError(f"{what} holds values other than str; not cacheable")
+        return array.astype(np.str_)
+    if array.dtype.kind not in "biufM":
+        raise ValueError(f"{what} has dtype {array.dtype}; not cacheable")
+    return array
+
+
+def frames_to_npz(frames: Sequence[Any]) -> bytes:
+    """
+    Serializes a sequence of DataFrames (or None) as an npz archive of plain arrays and a JSON layout, which
+    frames_from_npz reads back with allow_pickle=False. Raises ValueError for frames with other than str,
+    numeric, bool or datetime64 columns or index, or non-str column names.
+    """
+    import numpy as np
+    import pandas as pd
+
+    layout: List[Dict[str, Any] | None] = []
+    arrays: Dict[str, Any] = {}
+    for i, frame in enumerate(frames):
+        if frame is None:
+            layout.append(None)
+            continue
+        if not all(isinstance(column, str) for column in frame.columns):
+            raise ValueError("column names must be str; not cacheable")
+        entry: Dict[str, Any] = {"columns": list(frame.columns), "index_name": frame.index.name}
+        if isinstance(frame.index, pd.RangeIndex):
+            entry["range_index"] = [frame.index.start, frame.index.stop, frame.index.step]
+        else:
+            arrays[f"f{i}_index"] = _column_array(frame.index, "index")
+        for j, column in enumerate(frame.columns):
+            arrays[f"f{i}_c{j}"] = _column_array(frame.iloc[:, j].to_numpy(), f"column '{column}'")
+        layout.append(entry)
+    arrays["layout"] = np.array(json.dumps(layout))
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def frames_from_npz(data: bytes) -> List[Any]:
+    """The DataFrames (or None) written by frames_to_npz; str columns come back as object columns."""
+    import numpy as np
+    import pandas as pd
+
+    def restored(array: Any) -> Any:
+        return array.astype(object) if array.dtype.kind == "U" else array
+
+    frames: List[Any] = []
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        for i, entry in enumerate(json.loads(str(archive["layout"]))):
+            if entry is None:
+                frames.append(None)
+                continue
+            if "range_index" in entry:
+                index = pd.RangeIndex(*entry["range_index"], name=entry["index_name"])
+            else:
+                index = pd.Index(restored(archive[f"f{i}_index"]), name=entry["index_name"])
+            frames.append(pd.DataFrame({column: restored(archive[f"f{i}_c{j}"]) for j, column in enumerate(entry["columns"])},
+                                       index=index, columns=entry["columns"]))
+    return frames
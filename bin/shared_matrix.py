@@ -0,0 +1,113 @@
+"""shared_matrix.py
+
+Publishes date x fund matrices to worker processes through one
+`multiprocessing.shared_memory` block, instead of pickling them into every
+worker.
+
+The parent publishes the arrays (e.g. the bundled log price matrix and rank
+matrices of the same shape), the date index and the fund names once:
+
+    with SharedMatrices({"log_prices": prices, "ranks": ranks}, dates, funds) as shared:
+        with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(shared.spec,)) as pool:
+            ...
+
+and each worker attaches to the block by name (`attach(spec)`), getting
+read-only numpy views of the shared pages: nothing is copied, so memory use
+stays flat as the number of workers grows. The spec passed to the workers is a
+small dict (block name and the layout of each array), cheap to pickle under any
+start method.
+
+The parent owns the block and unlinks it when the `with` ends (or on close());
+workers only close their mapping. Attach from child processes of the publisher
+(multiprocessing / concurrent.futures workers): they share its resource
+tracker, whereas an unrelated process attaching on Python < 3.13 would have its
+own tracker unlink the block when it exits.
+"""
+from __future__ import annotations
+
+import json
+from multiprocessing import shared_memory
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+ALIGNMENT = 64 # Bytes; every array starts on a cache line
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class SharedMatrices:
+    """Parent side: copies the arrays, dates and names into one shared memory block (see the module docstring)."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], dates: pd.DatetimeIndex, names: List[str]) -> None:
+        names_bytes = json.dumps([str(name) for name in names]).encode("utf-8")
+        dates_ns = np.asarray(pd.DatetimeIndex(dates).asi8, dtype=np.int64)
+        layout: Dict[str, Dict[str, Any]] = {}
+        offset = 0
+        for key, array in {**arrays, "__dates__": dates_ns}.items():
+            array = np.asarray(array)
+            layout[key] = {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+            offset = _aligned(offset + array.nbytes)
+        layout["__names__"] = {"offset": offset, "shape": [len(names_bytes)], "dtype": "|u1"}
+        size = max(1, offset + len(names_bytes))
+
+        self._block = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            for key, array in {**arrays, "__dates__": dates_ns}.items():
+                _view(self._block, layout[key])[...] = array
+            _view(self._block, layout["__names__"])[...] = np.frombuffer(names_bytes, dtype=np.uint8)
+        except BaseException:
+            self.close()
+            raise
+        self.spec: Dict[str, Any] = {"block": self._block.name, "layout": layout}
+
+    def close(self) -> None:
+        """Releases and removes the block; workers must be done with it."""
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def __enter__(self) -> SharedMatrices:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class AttachedMatrices:
+    """Worker side of a SharedMatrices block: `arrays` (read-only views), `dates` and `names`."""
+
+    def __init__(self, spec: Dict[str, Any]) -> None:
+        self._block = shared_memory.SharedMemory(name=spec["block"])
+        layout = spec["layout"]
+        self.arrays: Dict[str, np.ndarray] = {}
+        for key, entry in layout.items():
+            if key in ("__dates__", "__names__"):
+                continue
+            view = _view(self._block, entry)
+            view.flags.writeable = False
+            self.arrays[key] = view
+        self.dates = pd.DatetimeIndex(_view(self._block, layout["__dates__"]).view("datetime64[ns]"))
+        self.names: List[str] = json.loads(_view(self._block, layout["__names__"]).tobytes().decode("utf-8"))
+
+    def frame(self, key: str) -> pd.DataFrame:
+        """A date x fund array as a DataFrame over the shared view (for pandas code that reads, not writes)."""
+        return pd.DataFrame(self.arrays[key], index=self.dates, columns=self.names, copy=False)
+
+    def close(self) -> None:
+        """Drops the views and unmaps the block (the publisher unlinks it)."""
+        self.arrays = {}
+        self._block.close()
+
+
+def _view(block: shared_memory.SharedMemory, entry: Dict[str, Any]) -> np.ndarray:
+    return np.ndarray(tuple(entry["shape"]), dtype=np.dtype(entry["dtype"]), buffer=block.buf, offset=entry["offset"])
+
+
+def attach(spec: Dict[str, Any]) -> AttachedMatrices:
+    """Attaches to the block described by SharedMatrices.spec."""
+    return AttachedMatrices(spec)
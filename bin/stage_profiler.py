@@ -0,0 +1,118 @@
+"""stage_profiler.py
+
+Per-stage timing and memory profile shared by `fund_momentum_emailer.py` and
+`interactive_fund_plot.py` (their `--profile FILE` option).
+
+Each stage records wall time (`time.perf_counter`), CPU time of the process
+(`time.process_time`) and the `tracemalloc` peak of Python allocations while the
+stage ran. A stage run several times (e.g. one table read per file) is
+accumulated: times are summed, the peak is the largest seen, and `calls` counts
+the runs. Stages may nest; an inner stage's peak also counts for its outer stage.
+
+The JSON document written by `StageProfiler.write` lists the stages in the
+order they first ran, so profiles archived from nightly runs diff cleanly:
+
+    {"script": "...", "argv": [...], "started_utc": "...", "python": "...",
+     "platform": "...", "total": {"wall_s": ..., "cpu_s": ..., "peak_bytes": ...},
+     "stages": [{"name": "...", "calls": 1, "wall_s": ..., "cpu_s": ..., "peak_bytes": ...}, ...]}
+
+tracemalloc slows allocation-heavy code down noticeably, so it only runs when
+profiling is enabled; a disabled profiler's methods do nothing. CPU time covers the
+profiled process only, not worker processes started with `--jobs`.
+"""
+from __future__ import annotations
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+
+class StageProfiler:
+    """Collects wall time, CPU time and tracemalloc peak per named stage."""
+
+    def __init__(self, script_name: str, enabled: bool = True) -> None:
+        self.script_name = script_name
+        self.enabled = enabled
+        self.stages: Dict[str, Dict[str, Any]] = {} # name -> totals, in first-run order
+        self._open_stages: List[Dict[str, Any]] = []
+        self._overall_peak = 0
+        self._started_utc = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _take_peak(self) -> int:
+        """Returns the tracemalloc peak since the last call and starts a new peak window."""
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self._overall_peak = max(self._overall_peak, peak)
+        for open_stage in self._open_stages: # The window belonged to every stage still running
+            open_stage["peak_bytes"] = max(open_stage["peak_bytes"], peak)
+        return peak
+
+    def start(self, name: str) -> None:
+        """Starts timing stage `name`; pair with stop(name)."""
+        if not self.enabled:
+            return
+        self._take_peak()
+        self._open_stages.append({"name": name, "wall": time.perf_counter(), "cpu": time.process_time(), "peak_bytes": 0})
+
+    def stop(self, name: str) -> None:
+        """Stops the innermost running stage, which must be `name`, and adds its figures to the totals."""
+        if not self.enabled:
+            return
+        wall_end, cpu_end = time.perf_counter(), time.process_time()
+        self._take_peak()
+        open_stage = self._open_stages.pop()
+        if open_stage["name"] != name:
+            raise ValueError(f"Profile stage '{name}' stopped while '{open_stage['name']}' is running")
+        totals = self.stages.setdefault(name, {"name": name, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_bytes": 0})
+        totals["calls"] += 1
+        totals["wall_s"] += wall_end - open_stage["wall"]
+        totals["cpu_s"] += cpu_end - open_stage["cpu"]
+        totals["peak_bytes"] = max(totals["peak_bytes"], open_stage["peak_bytes"])
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Context manager form of start(name)/stop(name); a stage left by an exception is still recorded."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.enabled:
+            self._take_peak()
+        return {
+            "script": self.script_name,
+            "argv": sys.argv[1:],
+            "started_utc": self._started_utc,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "total": {
+                "wall_s": round(time.perf_counter() - self._wall_start, 6),
+                "cpu_s": round(time.process_time() - self._cpu_start, 6),
+                "peak_bytes": self._overall_peak,
+            },
+            "stages": [
+                {**totals, "wall_s": round(totals["wall_s"], 6), "cpu_s": round(totals["cpu_s"], 6)}
+                for totals in self.stages.values()
+            ],
+        }
+
+    def write(self, path: str | Path) -> None:
+        """Writes the profile as JSON to `path` (no-op when disabled)."""
+        if not self.enabled:
+            return
+        with Path(path).open("w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+        print(f"Wrote stage profile to {path}", file=sys.stderr)
@@ -0,0 +1,136 @@
+"""startup_budget.py
+
+Start-up time check for the command-line tools.
+
+Each CLI is started with `--help` under `python -X importtime` several times in
+fresh interpreters. The fastest run's wall time and the module import time
+reported by -X importtime (sum over the top-level imports) are compared with the
+CLI's budget, and the imports are checked for modules that must stay deferred to
+the code paths using them (plotly, requests, tabulate, smtplib, ssl, the process
+pool). `--help` does argument parsing only, so its time is the fixed cost every
+nightly run pays before any work starts.
+
+Budgets are in seconds and depend on the machine; set them from a few runs on
+the machine that runs the nightly jobs (--budget NAME=SECONDS, NAME being the
+script's file name). The exit status is 1 if any CLI is over budget or imports a
+deferred module.
+
+Usage:
+    python3 bin/startup_budget.py
+    python3 bin/startup_budget.py --runs 10 --budget fund_momentum_emailer.py=0.8 --budget interactive_fund_plot.py=0.9
+    python3 bin/startup_budget.py --output startup.json
+
+Python deps: none beyond those of the checked scripts
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+SCRIPT_DIR = Path(os.path.abspath(__file__)).parent
+
+# Script -> modules `--help` must not import (deferred to the code that needs them)
+CLI_DEFERRED_MODULES: Dict[str, List[str]] = {
+    "fund_momentum_emailer.py": ["requests", "tabulate", "smtplib", "ssl", "concurrent.futures.process"],
+    "interactive_fund_plot.py": ["plotly", "plotly.graph_objs", "plotly.utils"],
+}
+DEFAULT_BUDGET_S: Dict[str, float] = {
+    "fund_momentum_emailer.py": 1.0,
+    "interactive_fund_plot.py": 1.0,
+}
+
+# -X importtime lines: "import time: <self us> | <cumulative us> | <indent><module>"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+
+def parse_budget(value: str) -> Tuple[str, float]:
+    """argparse type for NAME=SECONDS."""
+    name, _, seconds = value.partition("=")
+    try:
+        return name.strip(), float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not NAME=SECONDS")
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[str]]:
+    """Returns the summed cumulative time of the top-level imports (seconds) and all imported module names."""
+    total_us = 0
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, module = match.groups()
+        modules.append(module)
+        if len(indent) == 1: # Top-level import (nested ones are indented further)
+            total_us += int(cumulative_us)
+    return total_us / 1e6, modules
+
+
+def measure_startup(script: str, runs: int) -> Dict[str, Any]:
+    """Starts `script --help` `runs` times; returns the fastest wall and import times and the modules imported."""
+    wall_times, import_times = [], []
+    modules: List[str] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", str(SCRIPT_DIR / script), "--help"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        wall_times.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            return {"status": f"exit {completed.returncode}", "stderr_tail": completed.stderr.splitlines()[-5:]}
+        import_s, modules = parse_importtime(completed.stderr)
+        import_times.append(import_s)
+    return {"status": "ok", "wall_s": round(min(wall_times), 4), "import_s": round(min(import_times), 4), "modules": modules}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the start-up time of the command-line tools against budgets.")
+    parser.add_argument("--runs", type=int, default=5, help="Starts per script; the fastest counts (default: 5).")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[], metavar="NAME=SECONDS",
+                        help="Wall-time budget for one script, e.g. fund_momentum_emailer.py=0.8 (repeatable).")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGET_S)
+    for name, seconds in args.budget:
+        if name not in budgets:
+            parser.error(f"Unknown script '{name}' in --budget; known: {', '.join(budgets)}")
+        budgets[name] = seconds
+
+    results: Dict[str, Any] = {}
+    failed = False
+    for script, budget_s in budgets.items():
+        result = measure_startup(script, args.runs)
+        result["budget_s"] = budget_s
+        problems = [] if result["status"] == "ok" else [f"--help failed ({result['status']})"]
+        if result["status"] == "ok":
+            if result["wall_s"] > budget_s:
+                problems.append(f"start-up {result['wall_s']:.3f}s is over the {budget_s:.3f}s budget")
+            problems += [f"imports deferred module '{module}'" for module in CLI_DEFERRED_MODULES[script]
+                         if module in result["modules"]]
+            result["imported_modules"] = len(result.pop("modules"))
+        result["problems"] = problems
+        failed = failed or bool(problems)
+        results[script] = result
+        timing = f"wall {result['wall_s']:.3f}s, imports {result['import_s']:.3f}s" if result["status"] == "ok" else result["status"]
+        print(f"{script}: {'OK' if not problems else 'FAIL'} ({timing}, budget {budget_s:.3f}s)")
+        for problem in problems:
+            print(f"  - {problem}")
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Wrote start-up results to {args.output}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()